@@ -0,0 +1,165 @@
+"""
+Tests for the local caches, which do not need a Galaxy server.
+"""
+import os
+import shutil
+import tempfile
+
+from bioblend import ConnectionError
+from bioblend.galaxy.cache import (
+    ContentCache,
+    dataset_version,
+    hash_file,
+    UploadIndex,
+)
+from bioblend.util import Bunch
+from .test_util import unittest
+
+
+class MockGalaxyInstance:
+
+    def __init__(self, datasets):
+        self.base_url = 'http://localhost:56789'
+        self.datasets = datasets
+        self.histories = Bunch(show_dataset=self._show_dataset)
+
+    def _show_dataset(self, history_id, dataset_id):
+        ds = self.datasets[dataset_id]
+        if isinstance(ds, int):
+            raise ConnectionError('error', status_code=ds)
+        return ds
+
+
+class TestUploadIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        self.fn = os.path.join(self.tempdir, 'foo.txt')
+        with open(self.fn, 'w') as f:
+            f.write('foo\nbar\n')
+        self.index = UploadIndex(os.path.join(self.tempdir, 'index.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_hash_file(self):
+        digest = self.index.hash_file(self.fn)
+        self.assertEqual(digest, hash_file(self.fn))
+        self.assertEqual(self.index.hash_files([self.fn, self.fn]), [digest, digest])
+        with open(self.fn, 'a') as f:
+            f.write('baz\n')
+        os.utime(self.fn, ns=(0, 0))
+        self.assertNotEqual(self.index.hash_file(self.fn), digest)
+
+    def test_find(self):
+        digest = self.index.hash_file(self.fn)
+        gi = MockGalaxyInstance({
+            'ok': {'state': 'ok', 'deleted': False, 'file_size': 8},
+            'running': {'state': 'running', 'deleted': False},
+            'deleted': {'state': 'ok', 'deleted': True, 'file_size': 8},
+            'wrong_hash': {'state': 'ok', 'deleted': False, 'file_size': 8,
+                           'hashes': [{'hash_function': 'SHA-256', 'hash_value': 'abc'}]},
+        })
+        for dataset_id in gi.datasets:
+            self.index.add(gi, digest, 'auto', '?', 'hda', 'history_id', dataset_id)
+        found = [_.dataset_id for _ in self.index.find(gi, self.fn, digest)]
+        self.assertEqual(found, ['ok'])
+        # Invalid entries have been removed, the non-terminal one is kept
+        gi.datasets['deleted']['deleted'] = False
+        gi.datasets['running']['state'] = 'ok'
+        gi.datasets['running']['file_size'] = 8
+        found = sorted(_.dataset_id for _ in self.index.find(gi, self.fn, digest))
+        self.assertEqual(found, ['ok', 'running'])
+        self.assertEqual(list(self.index.find(gi, self.fn, digest, file_type='txt')), [])
+        self.assertEqual(list(self.index.find(gi, self.fn, digest, srcs=('ld',))), [])
+
+    def test_find_errors(self):
+        digest = self.index.hash_file(self.fn)
+        gi = MockGalaxyInstance({'forbidden': 403, 'missing': 404, 'unreachable': 502})
+        for dataset_id in gi.datasets:
+            self.index.add(gi, digest, 'auto', '?', 'hda', 'history_id', dataset_id)
+        self.assertEqual(list(self.index.find(gi, self.fn, digest)), [])
+        # Only the entry of the missing dataset has been removed
+        gi.datasets = {_: {'state': 'ok', 'deleted': False, 'file_size': 8} for _ in gi.datasets}
+        found = sorted(_.dataset_id for _ in self.index.find(gi, self.fn, digest))
+        self.assertEqual(found, ['forbidden', 'unreachable'])
+
+
+class TestContentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        self.cache = ContentCache(self.tempdir, max_size=10)
+        self.url = 'http://localhost:56789'
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_dataset_version(self):
+        ds_dict = {'state': 'ok', 'update_time': '2020-10-01T00:00:00', 'file_size': 3}
+        self.assertIsNotNone(dataset_version(ds_dict))
+        self.assertNotEqual(dataset_version(ds_dict), dataset_version(dict(ds_dict, update_time='2020-10-02T00:00:00')))
+        self.assertIsNone(dataset_version(dict(ds_dict, state='running')))
+        self.assertIsNone(dataset_version({'state': 'ok'}))
+
+    def test_get_or_fetch(self):
+        fetched = []
+
+        def fetch():
+            fetched.append(1)
+            return [b'abc', b'def'], {'foo': 'bar'}
+
+        self.assertIsNone(self.cache.get(self.url, 'a', 'v1'))
+        path, metadata = self.cache.get_or_fetch(self.url, 'a', 'v1', fetch)
+        self.assertEqual(metadata, {'foo': 'bar'})
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'abcdef')
+        self.assertEqual(self.cache.get_or_fetch(self.url, 'a', 'v1', fetch), (path, metadata))
+        self.assertEqual(len(fetched), 1)
+        self.assertNotEqual(self.cache.get_or_fetch(self.url, 'a', 'v2', fetch)[0], path)
+        self.assertEqual(len(fetched), 2)
+
+    def test_evict(self):
+        a_path = self.cache.put(self.url, 'a', 'v1', [b'1234'])
+        b_path = self.cache.put(self.url, 'b', 'v1', [b'1234'])
+        os.utime(a_path, (0, 0))
+        os.utime(b_path, (1, 1))
+        # Accessing 'a' makes 'b' the least recently used entry
+        self.cache.get(self.url, 'a', 'v1')
+        self.cache.put(self.url, 'c', 'v1', [b'1234'])
+        self.assertIsNotNone(self.cache.get(self.url, 'a', 'v1'))
+        self.assertIsNone(self.cache.get(self.url, 'b', 'v1'))
+        self.assertIsNotNone(self.cache.get(self.url, 'c', 'v1'))
+        # An entry bigger than max_size is kept until the next put
+        self.cache.put(self.url, 'd', 'v1', [b'0123456789abc'])
+        self.assertIsNotNone(self.cache.get(self.url, 'd', 'v1'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(self.url, 'd', 'v1'))
+
+    def test_size_estimate(self):
+        scans = []
+        entries = self.cache._entries
+
+        def count_scans():
+            scans.append(1)
+            return entries()
+
+        self.cache._entries = count_scans
+        self.cache.put(self.url, 'a', 'v1', [b'1234'])
+        self.assertEqual(len(scans), 1)
+        # The cache directory is not scanned again while under max_size
+        self.cache.put(self.url, 'b', 'v1', [b'1234'])
+        self.assertEqual(len(scans), 1)
+        self.cache.put(self.url, 'c', 'v1', [b'1234'])
+        self.assertEqual(len(scans), 2)
+        self.assertEqual(self.cache._size, 8)
+
+    def test_truncated_fetch(self):
+        def fetch():
+            yield b'abc'
+            raise ConnectionError('truncated')
+
+        with self.assertRaises(ConnectionError):
+            self.cache.get_or_fetch(self.url, 'a', 'v1', lambda: (fetch(), {}))
+        # Incomplete contents are not cached
+        self.assertIsNone(self.cache.get(self.url, 'a', 'v1'))
@@ -1,6 +1,8 @@
+import os
 import shutil
 import tempfile
 
+from bioblend.galaxy.cache import ContentCache
 from . import (
     GalaxyTestBase,
     test_util
@@ -50,6 +52,24 @@ class TestGalaxyDatasets(GalaxyTestBase.GalaxyTestBase):
             f.flush()
             self.assertEqual(f.read(), expected_contents)
 
+    def test_download_dataset_content_cache(self):
+        expected_contents = ("\n".join(self.dataset_contents.splitlines()) + "\n").encode()
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            self.gi.content_cache = ContentCache(os.path.join(tempdir, 'cache'))
+            contents = self.gi.datasets.download_dataset(self.dataset_id, maxwait=GalaxyTestBase.BIOBLEND_TEST_JOB_TIMEOUT)
+            self.assertEqual(contents, expected_contents)
+            cached_path = self.gi.datasets.get_cached_path(self.dataset_id)
+            self.assertTrue(cached_path.startswith(tempdir))
+            with open(cached_path, 'rb') as f:
+                self.assertEqual(f.read(), expected_contents)
+            downloaded_dataset = self.gi.datasets.download_dataset(self.dataset_id, file_path=tempdir)
+            with open(downloaded_dataset, 'rb') as f:
+                self.assertEqual(f.read(), expected_contents)
+        finally:
+            self.gi.content_cache = None
+            shutil.rmtree(tempdir)
+
     @test_util.skip_unless_galaxy('release_19.05')
     def test_get_datasets(self):
         datasets = self.gi.datasets.get_datasets()
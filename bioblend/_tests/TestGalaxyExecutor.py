@@ -0,0 +1,98 @@
+"""
+Tests for the executor of Galaxy instances, which do not need a Galaxy server.
+"""
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from bioblend.galaxy.executor import GalaxyExecutor
+from bioblend.util.limiter import (
+    BACKGROUND,
+    current_priority,
+    INTERACTIVE,
+    priority,
+)
+from .test_util import unittest
+
+
+def square(x):
+    if x == 3:
+        raise ValueError(x)
+    time.sleep(0.001 * (x % 5))
+    return x * x
+
+
+class TestGalaxyExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = GalaxyExecutor(8)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_map(self):
+        progress = []
+        result = self.executor.map(square, range(50), progress=progress.append)
+        self.assertEqual(len(result), 50)
+        self.assertEqual([result[i] for i in (0, 2, 3, 49)], [0, 4, None, 2401])
+        self.assertEqual(list(result.errors), [3])
+        self.assertIsInstance(result.errors[3], ValueError)
+        self.assertFalse(result.cancelled)
+        self.assertRaises(ValueError, result.raise_errors)
+        self.assertEqual([_.done for _ in progress], list(range(1, 51)))
+        self.assertEqual(progress[-1].failed, 1)
+        self.assertEqual(progress[-1].total, 50)
+
+    def test_concurrency(self):
+        lock = threading.Lock()
+        running = []
+        max_running = []
+
+        def f(x):
+            with lock:
+                running.append(x)
+                max_running.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(x)
+
+        self.executor.map(f, range(20), concurrency=3)
+        self.assertEqual(max(max_running), 3)
+
+    def test_cancel(self):
+        cancel = threading.Event()
+
+        def progress(p):
+            if p.done == 5:
+                cancel.set()
+
+        result = self.executor.map(square, range(4, 100), concurrency=2, progress=progress, cancel=cancel)
+        self.assertTrue(result.cancelled)
+        self.assertGreaterEqual(len([_ for _ in result if _ is not None]), 5)
+        self.assertLess(len([_ for _ in result if _ is not None]), 10)
+        self.assertTrue(all(isinstance(e, CancelledError) for e in result.errors.values()))
+        self.assertEqual(len(result.errors) + len([_ for _ in result if _ is not None]), 96)
+
+    def test_nested(self):
+        executor = GalaxyExecutor(1)
+        result = executor.map(lambda x: executor.map(square, [x, x + 1]).results, [1, 5])
+        self.assertEqual(result.results, [[1, 4], [25, 36]])
+        self.assertEqual(executor.submit(square, 2).result(), 4)
+        executor.shutdown()
+
+    def test_priority(self):
+        result = self.executor.map(lambda _: current_priority(), range(4), priority=BACKGROUND)
+        self.assertEqual(result.results, [BACKGROUND] * 4)
+        with priority(BACKGROUND):
+            self.assertEqual(self.executor.submit(current_priority).result(), BACKGROUND)
+        self.assertEqual(self.executor.submit(current_priority).result(), INTERACTIVE)
+        self.assertRaises(ValueError, self.executor.map, square, [1], priority='urgent')
+
+    def test_lanes(self):
+        # Interactive calls do not queue behind a busy background lane
+        release = threading.Event()
+        with priority(BACKGROUND):
+            futures = [self.executor.submit(release.wait, 5) for _ in range(20)]
+        self.assertEqual(self.executor.submit(square, 4).result(timeout=1), 16)
+        release.set()
+        self.assertTrue(all(_.result() for _ in futures))
@@ -0,0 +1,161 @@
+"""
+Tests for the hedging of GET requests, which do not need a Galaxy server.
+"""
+import threading
+import time
+
+from bioblend.galaxy.hedging import (
+    endpoint,
+    Hedger,
+)
+from .test_util import unittest
+
+URL = 'http://localhost/api/histories/f2db41e1fa331b3e/contents'
+
+
+class FakeResponse:
+
+    def __init__(self, name, status_code=200):
+        self.name = name
+        self.status_code = status_code
+
+
+class TestHedger(unittest.TestCase):
+
+    def setUp(self):
+        self.hedger = Hedger(percentile=90, budget=0.5, min_samples=5, min_delay=0.01)
+
+    def tearDown(self):
+        self.hedger.shutdown()
+
+    def warm_up(self, latency=0.001):
+        for _ in range(100):
+            self.hedger.record(URL, latency)
+
+    def test_endpoint(self):
+        self.assertEqual(endpoint(URL), '/api/histories/{id}/contents')
+        self.assertEqual(endpoint('http://localhost/galaxy/api/jobs/1cd8e2f6b131e891?view=x'), '/galaxy/api/jobs/{id}')
+        self.assertEqual(endpoint('http://localhost/api/tools/cat1'), '/api/tools/cat1')
+
+    def test_delay(self):
+        self.assertIsNone(self.hedger.delay(URL))
+        for i in range(10):
+            self.hedger.record(URL, i / 10)
+        self.assertEqual(self.hedger.delay(URL), 0.9)
+        self.assertEqual(self.hedger.delay(URL.replace('f2db41e1fa331b3e', '0123456789abcdef')), 0.9)
+        self.assertIsNone(self.hedger.delay('http://localhost/api/histories'))
+
+    def test_no_hedge_before_samples(self):
+        r = self.hedger.get(URL, lambda: FakeResponse('primary'))
+        self.assertEqual(r.name, 'primary')
+        self.assertEqual((self.hedger.requests, self.hedger.hedges), (1, 0))
+        self.assertEqual(len(self.hedger._latencies['/api/histories/{id}/contents']), 1)
+
+    def test_hedge(self):
+        self.warm_up()
+        self.hedger._tokens = 1
+        calls = []
+        release = threading.Event()
+
+        def send():
+            calls.append(None)
+            if len(calls) == 1:
+                release.wait(5)
+                return FakeResponse('primary')
+            return FakeResponse('hedge')
+
+        start = time.monotonic()
+        r = self.hedger.get(URL, send)
+        self.assertEqual(r.name, 'hedge')
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual((self.hedger.hedges, self.hedger.wins), (1, 1))
+        release.set()
+
+    def test_fast_primary(self):
+        self.warm_up(latency=1)
+        self.hedger._tokens = 1
+        r = self.hedger.get(URL, lambda: FakeResponse('primary'))
+        self.assertEqual(r.name, 'primary')
+        self.assertEqual(self.hedger.hedges, 0)
+
+    def test_budget(self):
+        self.warm_up()
+        self.hedger.budget = 0.25
+
+        def send():
+            time.sleep(0.05)
+            return FakeResponse('response')
+
+        for _ in range(8):
+            self.hedger.get(URL, send)
+        self.assertEqual(self.hedger.requests, 8)
+        self.assertEqual(self.hedger.hedges, 2)
+
+    def test_error(self):
+        self.warm_up()
+        self.hedger._tokens = 1
+        calls = []
+
+        def send():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.1)
+                raise ConnectionError('primary')
+            time.sleep(0.2)
+            return FakeResponse('hedge')
+
+        # An error does not win against a pending response
+        self.assertEqual(self.hedger.get(URL, send).name, 'hedge')
+
+    def test_error_response(self):
+        self.warm_up()
+        self.hedger._tokens = 1
+        calls = []
+
+        def send():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.3)
+                return FakeResponse('primary')
+            return FakeResponse('hedge', status_code=503)
+
+        # An error response does not win against a pending request
+        self.assertEqual(self.hedger.get(URL, send).name, 'primary')
+        self.assertEqual((self.hedger.hedges, self.hedger.wins), (1, 0))
+
+    def test_error_responses(self):
+        self.warm_up()
+        self.hedger._tokens = 1
+
+        def send():
+            time.sleep(0.05)
+            return FakeResponse('error', status_code=502)
+
+        # The last response is returned if no request succeeds
+        self.assertEqual(self.hedger.get(URL, send).status_code, 502)
+        self.assertEqual((self.hedger.hedges, self.hedger.wins), (1, 0))
+
+    def test_queued(self):
+        hedger = Hedger(percentile=90, budget=1, min_samples=5, max_workers=2)
+        for _ in range(100):
+            hedger.record(URL, 0.05)
+        hedger._tokens = 1
+        release = threading.Event()
+        executor = hedger._get_executor(1)
+        blockers = [executor.submit(release.wait, 5) for _ in range(2)]
+        threading.Timer(0.2, release.set).start()
+        # The time spent waiting for a thread does not count as latency
+        r = hedger.get(URL, lambda: FakeResponse('primary'))
+        self.assertEqual(r.name, 'primary')
+        self.assertEqual(hedger.hedges, 0)
+        self.assertTrue(all(_.result() for _ in blockers))
+        hedger.shutdown()
+
+    def test_pool_size(self):
+        self.warm_up(latency=1)
+        self.hedger.get(URL, lambda: FakeResponse('primary'), pool_size=7)
+        self.assertEqual(self.hedger._executor._max_workers, 14)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Hedger, percentile=100)
+        self.assertRaises(ValueError, Hedger, budget=-1)
@@ -4,7 +4,11 @@ import os
 import shutil
 import tarfile
 import tempfile
+import threading
 
+import requests
+
+from bioblend.galaxy.histories import _ResumableResponseStream
 from . import GalaxyTestBase, test_util
 
 
@@ -60,6 +64,10 @@ class TestGalaxyHistories(GalaxyTestBase.GalaxyTestBase):
         histories = self.gi.histories.get_histories(name=self.default_history_name)
         self.assertTrue(any(h['id'] == self.history['id'] for h in histories))
 
+        # Check whether the detailed view has the same fields as show_history()
+        new_history = self.gi.histories.get_histories(history_id=self.history['id'], view='detailed')[0]
+        self.assertEqual(set(new_history), set(self.gi.histories.show_history(self.history['id'])))
+
         # TODO: check whether deleted history is returned correctly
         # At the moment, get_histories() returns only not-deleted histories
         # and get_histories(deleted=True) returns only deleted histories,
@@ -94,6 +102,36 @@ class TestGalaxyHistories(GalaxyTestBase.GalaxyTestBase):
         contents = self.gi.histories.show_history(history_id, contents=True, types=['dataset', 'dataset_collection'])
         self.assertEqual(len(contents), 1)
 
+    def test_show_history_with_contents_paginated(self):
+        history_id = self.history["id"]
+        dataset_ids = [self._test_dataset(history_id) for _ in range(3)]
+        contents = self.gi.histories.show_history(history_id, contents=True, limit=2)
+        self.assertEqual([_['id'] for _ in contents], dataset_ids[:2])
+        contents = self.gi.histories.show_history(history_id, contents=True, limit=2, offset=2)
+        self.assertEqual([_['id'] for _ in contents], dataset_ids[2:])
+        contents = self.gi.histories.show_history(history_id, contents=True, types=['dataset_collection'], offset=0)
+        self.assertEqual(len(contents), 0)
+
+    def test_show_datasets(self):
+        history_id = self.history["id"]
+        dataset_ids = [self._test_dataset(history_id, file_name='ds%d.txt' % i) for i in range(3)]
+        datasets = self.gi.histories.show_datasets(history_id)
+        self.assertEqual([_['id'] for _ in datasets], dataset_ids)
+        datasets = self.gi.histories.show_datasets(history_id, dataset_ids=dataset_ids[::-1])
+        self.assertEqual([_['id'] for _ in datasets], dataset_ids[::-1])
+        self.assertEqual(datasets[0], self.gi.histories.show_dataset(history_id, dataset_ids[2]))
+        datasets = self.gi.histories.show_datasets(history_id, name='ds1.txt')
+        self.assertEqual([_['id'] for _ in datasets], dataset_ids[1:2])
+        datasets = self.gi.histories.show_matching_datasets(history_id, name_filter='ds[02].txt')
+        self.assertEqual([_['id'] for _ in datasets], dataset_ids[::2])
+        self.gi.histories.delete_dataset(history_id, dataset_ids[0])
+        datasets = self.gi.histories.show_datasets(history_id, deleted=False)
+        self.assertEqual([_['id'] for _ in datasets], dataset_ids[1:])
+        datasets = self.gi.histories.show_datasets(history_id, dataset_ids=dataset_ids, deleted=True)
+        self.assertEqual([_['id'] for _ in datasets], dataset_ids[:1])
+        with self.assertRaises(ValueError):
+            self.gi.histories.show_datasets(history_id, dataset_ids=dataset_ids + [self.history['id']])
+
     def test_create_history_tag(self):
         new_tag = 'tag1'
         self.gi.histories.create_history_tag(self.history['id'], new_tag)
@@ -112,6 +150,11 @@ class TestGalaxyHistories(GalaxyTestBase.GalaxyTestBase):
         self.assertEqual(dataset["id"], dataset1_id)
         self.assertEqual(dataset["deleted"], False)
         self.assertEqual(dataset["visible"], True)
+        dataset = self.gi.histories.show_dataset(history_id, dataset1_id, keys=['id', 'state'])
+        self.assertEqual(set(dataset), {'id', 'state'})
+        contents = self.gi.histories.show_history(history_id, contents=True, keys=['id', 'name'])
+        self.assertEqual([set(_) for _ in contents], [{'id', 'name'}])
+        self.assertEqual(contents[0]['id'], dataset1_id)
 
     def test_show_dataset_provenance(self):
         history_id = self.history["id"]
@@ -189,6 +232,22 @@ class TestGalaxyHistories(GalaxyTestBase.GalaxyTestBase):
         finally:
             shutil.rmtree(tempdir)
 
+    def test_extract_history(self):
+        self._test_dataset(self.history['id'])
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            members = []
+            ret = self.gi.histories.extract_history(
+                self.history['id'], path=tempdir, maxwait=60,
+                callback=lambda member, fileobj: members.append(member.name))
+            self.assertTrue(ret['jeha_id'])
+            self.assertEqual(ret['members'], len(members))
+            self.assertGreater(ret['bytes'], 0)
+            for name in members:
+                self.assertTrue(os.path.lexists(os.path.join(tempdir, name)))
+        finally:
+            shutil.rmtree(tempdir)
+
     def test_import_history(self):
         path = test_util.get_abspath(os.path.join('data', 'Galaxy-History-test.tar.gz'))
         self.gi.histories.import_history(file_path=path)
@@ -203,6 +262,24 @@ class TestGalaxyHistories(GalaxyTestBase.GalaxyTestBase):
         self._wait_and_verify_dataset(copied_dataset['id'], expected_contents)
         self.gi.histories.delete_history(self.history_id2, purge=True)
 
+    def test_watch(self):
+        history_id = self.history["id"]
+        dataset1_id = self._test_dataset(history_id)
+        events = list(self.gi.histories.watch([history_id], interval=1, maxwait=0, include_existing=True))
+        self.assertEqual([(_.type, _.item['id']) for _ in events], [('added', dataset1_id)])
+        self._wait_and_verify_dataset(dataset1_id, b'1\t2\t3\n')
+        # Delete the dataset once the watch has started
+        timer = threading.Timer(2, self.gi.histories.delete_dataset, (history_id, dataset1_id))
+        timer.start()
+        event_types = set()
+        for event in self.gi.histories.watch([history_id], interval=1, maxwait=GalaxyTestBase.BIOBLEND_TEST_JOB_TIMEOUT):
+            self.assertEqual(event.item['id'], dataset1_id)
+            event_types.add(event.type)
+            if 'deleted' in event_types:
+                break
+        timer.join()
+        self.assertIn('deleted', event_types)
+
     @test_util.skip_unless_galaxy('release_20.09')
     def test_update_dataset_datatype(self):
         history_id = self.history["id"]
@@ -216,3 +293,57 @@ class TestGalaxyHistories(GalaxyTestBase.GalaxyTestBase):
 
     def tearDown(self):
         self.gi.histories.delete_history(self.history['id'], purge=True)
+
+
+class FlakyRaw:
+    """
+    Raw response body returning a single byte, then failing.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.read_once = False
+
+    def read(self, n, decode_content=True):
+        if self.read_once:
+            raise requests.exceptions.ConnectionError('connection reset')
+        self.read_once = True
+        return self.data[:1]
+
+
+class FlakyResponse:
+
+    status_code = 206
+
+    def __init__(self, data):
+        self.raw = FlakyRaw(data)
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestResumableResponseStream(test_util.unittest.TestCase):
+
+    def test_retries_across_reads(self):
+        data = b'0123456789'
+        offsets = []
+
+        def open_response(headers):
+            offset = int(headers['Range'][6:-1]) if headers else 0
+            offsets.append(offset)
+            return FlakyResponse(data[offset:])
+
+        stream = _ResumableResponseStream(open_response, max_retries=3)
+        b = bytearray(10)
+        # Each byte after the first one needs a retry, the retries are not
+        # reset by each read
+        self.assertEqual(stream.readinto(b), 1)
+        for _ in range(3):
+            self.assertEqual(stream.readinto(b), 1)
+        self.assertEqual(stream.retries_left, 0)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            stream.readinto(b)
+        self.assertEqual(offsets, [0, 1, 2, 3])
@@ -1,11 +1,24 @@
 """
 Tests on the GalaxyInstance object itself.
 """
+import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
 
 from bioblend import ConnectionError
 from bioblend.galaxy import GalaxyInstance
 from bioblend.galaxy.client import Client
+from bioblend.galaxy.hedging import Hedger
+from bioblend.toolshed import ToolShedInstance
 from .test_util import unittest
 
 
@@ -17,11 +30,30 @@ class TestGalaxyInstance(unittest.TestCase):
 
     def test_set_max_get_retries(self):
         self.gi.max_get_attempts = 3
-        self.assertEqual(3, Client.max_get_retries())
+        self.assertEqual(3, self.gi.max_get_attempts)
+        self.assertEqual(1, Client.max_get_retries())
+        other_gi = GalaxyInstance("http://localhost:56789", key="whatever")
+        self.assertEqual(1, other_gi.max_get_attempts)
+        self.assertRaises(ValueError, setattr, self.gi, 'max_get_attempts', 0)
 
     def test_set_retry_delay(self):
         self.gi.get_retry_delay = 5
-        self.assertEqual(5, Client.get_retry_delay())
+        self.assertEqual(5, self.gi.get_retry_delay)
+        self.assertEqual(10, Client.get_retry_delay())
+        other_gi = GalaxyInstance("http://localhost:56789", key="whatever", get_retry_delay=1)
+        self.assertEqual(1, other_gi.get_retry_delay)
+
+    def test_limiter(self):
+        # Requests are not limited by default
+        self.assertIsNone(self.gi.limiter)
+        self.assertIsNone(ToolShedInstance("http://localhost:56789").limiter)
+        gi = GalaxyInstance("http://localhost:56789", key="whatever", adaptive_concurrency=True)
+        self.assertEqual((gi.limiter.limit, gi.limiter.max_limit, gi.limiter.reserved_slots), (5, 10, 2))
+        # A rate limit alone does not reserve slots for interactive calls
+        gi = GalaxyInstance("http://localhost:56789", key="whatever", max_rate=100)
+        self.assertEqual((gi.limiter.limit, gi.limiter.reserved_slots), (10, 0))
+        gi = GalaxyInstance("http://localhost:56789", key="whatever", adaptive_concurrency=False, reserved_slots=2)
+        self.assertEqual((gi.limiter.limit, gi.limiter.reserved_slots), (10, 2))
 
     def test_get_retry(self):
         # We set the client to try twice, with a delay of 5 seconds between
@@ -37,3 +69,148 @@ class TestGalaxyInstance(unittest.TestCase):
             end = time.time()
         duration = end - start
         self.assertGreater(duration, self.gi.get_retry_delay, "Didn't seem to retry long enough")
+
+
+class StubGalaxyHandler(BaseHTTPRequestHandler):
+    """
+    Answer ``GET /api/histories/<id>[/contents]`` with the id and the query parameters,
+    and ``GET /api/authenticate/baseauth`` with an API key. Ids starting
+    with ``flaky`` fail the first time they are requested, and ids starting
+    with ``busy`` fail with HTTP 503 when more than ``server.capacity`` of
+    them are requested at the same time. The first request for an id
+    starting with ``dead`` is answered after 2 seconds.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.paths.append(url.path)
+        if url.path == '/api/authenticate/baseauth':
+            # Give other threads the time to ask for the key too
+            time.sleep(0.1)
+            self._reply(200, {'api_key': 'stubkey'})
+            return
+        history_id = url.path.split('/')[3]
+        if history_id.startswith('busy'):
+            with server.lock:
+                server.busy += 1
+                overloaded = server.busy > server.capacity
+                server.overloaded += overloaded
+            try:
+                if overloaded:
+                    self._reply(503, {'err_msg': 'overloaded'})
+                else:
+                    time.sleep(0.01)
+                    self._reply(200, {'id': history_id})
+            finally:
+                with server.lock:
+                    server.busy -= 1
+            return
+        with server.lock:
+            first = history_id not in server.failed
+            server.failed.add(history_id)
+        if history_id.startswith('dead') and first:
+            time.sleep(2)
+        if history_id.startswith('flaky') and first:
+            self._reply(500, {'err_msg': 'try again'})
+        else:
+            self._reply(200, {'id': history_id, 'params': parse_qs(url.query)})
+
+    def _reply(self, status_code, body):
+        data = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGalaxyInstanceThreads(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGalaxyHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.connections = set()
+        self.server.paths = []
+        self.server.failed = set()
+        self.server.busy = self.server.overloaded = 0
+        self.server.capacity = 4
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+
+    def test_concurrent_calls(self):
+        n_workers = 64
+        gi = GalaxyInstance(self.url, email='user@example.org', password='secret', pool_size=n_workers)
+        history_ids = ['h%d' % i for i in range(2000)]
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            histories = list(executor.map(gi.histories.show_history, history_ids))
+        self.assertEqual([_['id'] for _ in histories], history_ids)
+        self.assertTrue(all(_['params'] == {'key': ['stubkey']} for _ in histories))
+        # The key is fetched once and the connections are reused
+        self.assertEqual(self.server.paths.count('/api/authenticate/baseauth'), 1)
+        self.assertLessEqual(len(self.server.connections), n_workers + 1)
+
+    def test_retry_settings(self):
+        gi = GalaxyInstance(self.url, key='whatever', max_get_attempts=2, get_retry_delay=0)
+        other_gi = GalaxyInstance(self.url, key='whatever')
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            histories = list(executor.map(
+                lambda _: gi.histories.show_history(_, contents=True, deleted=True), ['flaky%d' % i for i in range(50)]))
+        self.assertTrue(all(_['params']['deleted'] == ['True'] for _ in histories))
+        self.assertEqual(len(self.server.paths), 100)
+        self.assertRaises(ConnectionError, other_gi.histories.show_history, 'flaky_other')
+
+    def test_map(self):
+        gi = GalaxyInstance(self.url, key='whatever', max_workers=16)
+        history_ids = ['h%d' % i for i in range(200)] + ['flaky']
+        progress = []
+        result = gi.map(gi.histories.show_history, history_ids, progress=progress.append)
+        self.assertEqual([_['id'] for _ in result[:200]], history_ids[:200])
+        self.assertEqual(list(result.errors), [200])
+        self.assertIsInstance(result.errors[200], ConnectionError)
+        self.assertEqual(progress[-1][:3], (201, 1, 201))
+        self.assertEqual(gi.submit(gi.histories.show_history, 'flaky').result()['id'], 'flaky')
+
+    def test_adaptive_concurrency(self):
+        gi = GalaxyInstance(self.url, key='whatever', pool_size=32, max_get_attempts=100, get_retry_delay=0,
+                            adaptive_concurrency=True)
+        history_ids = ['busy%d' % i for i in range(300)]
+        result = gi.map(gi.histories.show_history, history_ids)
+        self.assertEqual([_['id'] for _ in result], history_ids)
+        # The limit went down to about the capacity of the server (without
+        # the limiter, about as many requests are rejected as accepted)
+        self.assertGreater(self.server.overloaded, 0)
+        self.assertLess(self.server.overloaded, 100)
+
+    def test_max_rate(self):
+        gi = GalaxyInstance(self.url, key='whatever', adaptive_concurrency=False, max_rate=100)
+        start = time.monotonic()
+        result = gi.map(gi.histories.show_history, ['h%d' % i for i in range(21)])
+        self.assertEqual(len(result.errors), 0)
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        self.assertEqual(gi.limiter.limit, 10)
+
+    def test_hedging(self):
+        gi = GalaxyInstance(self.url, key='whatever')
+        gi.hedger = Hedger(budget=1, min_samples=10)
+        for i in range(20):
+            gi.histories.show_history('%016x' % i)
+        hedges, wins = gi.hedger.hedges, gi.hedger.wins
+        start = time.monotonic()
+        self.assertEqual(gi.histories.show_history('dead%012x' % 0)['id'], 'dead%012x' % 0)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual((gi.hedger.hedges - hedges, gi.hedger.wins - wins), (1, 1))
+        gi.hedger.shutdown()
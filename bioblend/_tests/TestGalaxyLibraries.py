@@ -56,6 +56,15 @@ class TestGalaxyLibraries(GalaxyTestBase.GalaxyTestBase):
             f.flush()
             self.gi.libraries.upload_file_from_local_path(self.library['id'], f.name)
 
+    @test_util.skip_unless_galaxy('release_19.09')
+    def test_upload_file_from_local_path_resumable(self):
+        with tempfile.NamedTemporaryFile(mode='w', prefix='bioblend_test_') as f:
+            f.write(FOO_DATA)
+            f.flush()
+            ret = self.gi.libraries.upload_file_from_local_path(self.library['id'], f.name, resumable=True, chunk_size=4)
+        dataset = self.gi.libraries.wait_for_dataset(self.library['id'], ret[0]['id'])
+        self.assertEqual(dataset['state'], 'ok')
+
     def test_upload_file_from_server(self):
         pass
 
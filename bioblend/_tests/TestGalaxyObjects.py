@@ -15,6 +15,8 @@ import bioblend
 import bioblend.galaxy.objects.galaxy_instance as galaxy_instance
 import bioblend.galaxy.objects.wrappers as wrappers
 from bioblend.galaxy import dataset_collections
+from bioblend.galaxy.cache import ContentCache
+from bioblend.util import Bunch
 from . import test_util
 from .test_util import unittest
 
@@ -132,6 +134,16 @@ class TestWrapper(unittest.TestCase):
         self.w.a = 111  # pylint: disable=W0201
         self.assertTrue(self.w.is_modified)
 
+    def test_reinit(self):
+        self.w.a = 111  # pylint: disable=W0201
+        self.w._reinit({'a': 2, 'b': [5], 'c': {}})
+        self.assertEqual(self.w.b, [5])
+        # Unflushed changes are kept
+        self.assertEqual(self.w.a, 111)
+        self.assertEqual(self.w.changes, {'a': 111})
+        self.w.a = 2
+        self.assertEqual(self.w.changes, {})
+
     def test_serialize(self):
         w = MockWrapper.from_json(self.w.to_json())
         self.assertEqual(w.wrapped, self.w.wrapped)
@@ -148,6 +160,57 @@ class TestWrapper(unittest.TestCase):
         self.assertIs(w.parent, parent)
         self.assertRaises(AttributeError, setattr, w, 'parent', 0)
 
+    def test_slots(self):
+        self.assertFalse(hasattr(self.w, '__dict__'))
+        self.w.c = {'x': 5}
+        self.assertEqual(self.w.wrapped['c'], {'x': 5})
+        self.assertTrue(self.w.is_modified)
+
+    def test_owned(self):
+        d = {'a': 1, 'b': [2, 3]}
+        w = MockWrapper(wrappers._Owned(d))
+        self.assertIs(w.wrapped, d)
+        self.assertIs(w.b, d['b'])
+
+    def test_partial(self):
+        refreshed = []
+
+        class MockRefreshableWrapper(MockWrapper):
+            BASE_ATTRS = ('id', 'a', 'b')
+
+            def refresh(self):
+                refreshed.append(self.id)
+                self.__init__(wrappers._Owned({'id': self.id, 'a': 1, 'b': 2}), gi=self.gi)
+                return self
+
+        w = MockRefreshableWrapper(wrappers._Partial({'id': 'x', 'a': 0}), gi=object())
+        self.assertEqual(w.a, 0)
+        self.assertEqual(refreshed, [])
+        self.assertEqual(w.b, 2)
+        self.assertEqual(refreshed, ['x'])
+        self.assertEqual(w.a, 1)
+        self.assertRaises(AttributeError, getattr, w, 'c')
+        # Without a GalaxyInstance, missing attributes are None
+        w = MockRefreshableWrapper(wrappers._Partial({'id': 'x', 'a': 0}))
+        self.assertIsNone(w.b)
+        self.assertEqual(refreshed, ['x'])
+
+    def test_not_serializable(self):
+        w = MockWrapper({'a': object()})
+        self.assertRaises(ValueError, w.to_json)
+
+    def test_changes(self):
+        self.assertEqual(self.w.changes, {})
+        self.w.a = 2
+        self.w.c = {'x': 5}
+        self.assertEqual(self.w.changes, {'a': 2, 'c': {'x': 5}})
+        # Setting back the original value is not a change
+        self.w.a = 1
+        self.assertEqual(self.w.changes, {'c': {'x': 5}})
+        self.assertRaises(NotImplementedError, self.w.flush)
+        # Nothing to save
+        MockWrapper(self.d).flush()
+
 
 class TestWorkflow(unittest.TestCase):
 
@@ -219,6 +282,264 @@ class TestWorkflow(unittest.TestCase):
             self.assertIn(d['id'], 'ab')
 
 
+class TestIdentityMap(unittest.TestCase):
+
+    def setUp(self):
+        self.identity_map = galaxy_instance.IdentityMap()
+
+    def test_add_get(self):
+        w = wrappers.HistoryPreview({'id': 'a'})
+        self.assertIs(self.identity_map.add(w), w)
+        self.assertIs(self.identity_map.get(wrappers.HistoryPreview, 'a'), w)
+        self.assertIsNone(self.identity_map.get(wrappers.HistoryPreview, 'b'))
+        # The first wrapper registered for an entity wins
+        self.assertIs(self.identity_map.add(wrappers.HistoryPreview({'id': 'a'})), w)
+        self.identity_map.discard(wrappers.HistoryPreview, 'a')
+        self.assertIsNone(self.identity_map.get(wrappers.HistoryPreview, 'a'))
+
+    def test_weak(self):
+        self.identity_map.add(wrappers.HistoryPreview({'id': 'a'}))
+        self.assertIsNone(self.identity_map.get(wrappers.HistoryPreview, 'a'))
+        self.assertEqual(len(self.identity_map), 0)
+
+    def test_update(self):
+        gi = galaxy_instance.GalaxyInstance('http://localhost:8080', api_key='test', identity_map=True)
+        fetched = MockUpdatableWrapper({'id': 'a', 'a': 0, 'b': 0}, gi=gi)
+        w = gi._get_wrapper(MockUpdatableWrapper, 'a', lambda: fetched)
+        self.assertIs(w, fetched)
+        w.b = 1
+
+        def update(wrapper):
+            wrapper._reinit({'id': 'a', 'a': 2, 'b': 3}, gi=gi)
+
+        # A live wrapper is updated in place with a fresh dictionary
+        self.assertIs(gi._get_wrapper(MockUpdatableWrapper, 'a', None, update=update), w)
+        self.assertEqual((w.a, w.b), (2, 1))
+        self.assertEqual(w.changes, {'b': 1})
+
+
+class MockUpdatableWrapper(MockWrapper):
+    BASE_ATTRS = ('id', 'a', 'b')
+    __slots__ = ('container', 'saved', 'refreshed')
+
+    def __init__(self, *args, **kwargs):
+        object.__setattr__(self, 'container', kwargs.pop('container', None))
+        object.__setattr__(self, 'saved', [])
+        object.__setattr__(self, 'refreshed', 0)
+        super().__init__(*args, **kwargs)
+
+    def _save_changes(self, changes):
+        if changes.get('a') == 'invalid':
+            raise ValueError('invalid value')
+        self.saved.append(changes)
+        return [] if self.container is None else [self.container]
+
+    def refresh(self):
+        object.__setattr__(self, 'refreshed', self.refreshed + 1)
+        return self
+
+
+class TestUnitOfWork(unittest.TestCase):
+
+    def setUp(self):
+        self.gi = galaxy_instance.GalaxyInstance('http://localhost:8080', api_key='test')
+
+    def test_flush(self):
+        container = MockUpdatableWrapper({'id': 'c'}, gi=self.gi)
+        ws = [MockUpdatableWrapper({'id': str(_), 'a': 0, 'b': 0}, container=container, gi=self.gi) for _ in range(20)]
+        unchanged = MockUpdatableWrapper({'id': 'u', 'a': 0}, gi=self.gi)
+        with self.gi.unit_of_work() as uow:
+            for w in ws:
+                w.a = 1
+                w.b = 2
+            unchanged.a = 1
+            unchanged.a = 0
+            # unchanged is tracked, but no request is made for it
+            self.assertEqual(len(uow), 21)
+        for w in ws:
+            self.assertEqual(w.saved, [{'a': 1, 'b': 2}])
+            self.assertEqual(w.changes, {})
+        self.assertEqual(unchanged.saved, [])
+        self.assertEqual(container.refreshed, 1)
+        self.assertEqual(len(uow), 0)
+        # Changes outside of the with block are not tracked
+        ws[0].a = 3
+        self.assertEqual(len(uow), 0)
+
+    def test_error(self):
+        w = MockUpdatableWrapper({'id': 'a', 'a': 0}, gi=self.gi)
+        with self.assertRaises(ValueError):
+            with self.gi.unit_of_work():
+                w.a = 1
+                raise ValueError()
+        self.assertEqual(w.saved, [])
+        self.assertEqual(w.changes, {'a': 1})
+        w.flush()
+        self.assertEqual(w.saved, [{'a': 1}])
+
+    def test_failed_save(self):
+        ws = [MockUpdatableWrapper({'id': str(_), 'a': 0}, gi=self.gi) for _ in range(3)]
+        uow = self.gi.unit_of_work()
+        with self.assertRaises(ValueError):
+            with uow:
+                ws[0].a = 1
+                ws[1].a = 'invalid'
+                ws[2].a = 2
+        # A failed save does not stop the others
+        self.assertEqual([_.saved for _ in ws], [[{'a': 1}], [], [{'a': 2}]])
+        self.assertEqual(len(uow), 1)
+        ws[1].a = 3
+        result = uow.flush()
+        self.assertEqual(list(result), [ws[1]])
+        self.assertEqual(result.errors, {})
+        ws[1].a = 'invalid'
+        uow.add(ws[1])
+        result = uow.flush()
+        self.assertEqual(list(result), [None])
+        self.assertIsInstance(result.errors[0], ValueError)
+        self.assertEqual(ws[1].changes, {'a': 'invalid'})
+
+
+class MockToolsClient:
+
+    def __init__(self, tool_ids):
+        self.tool_ids = tool_ids
+        self.calls = 0
+
+    def get_tools(self):
+        self.calls += 1
+        return [{'id': _} for _ in self.tool_ids]
+
+
+class MockGalaxyInstance:
+
+    def __init__(self, tool_ids):
+        self.tools = MockToolsClient(tool_ids)
+        self._toolbox_generation = 0
+
+
+class TestToolIdIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.gi = MockGalaxyInstance(['Paste1'])
+        self.index = galaxy_instance.ToolIdIndex(self.gi, ttl=60)
+
+    def test_cache(self):
+        self.assertIn('Paste1', self.index)
+        self.assertNotIn('cat1', self.index)
+        self.assertEqual(self.gi.tools.calls, 1)
+        self.gi.tools.tool_ids.append('cat1')
+        self.index.invalidate()
+        self.assertIn('cat1', self.index)
+        self.assertEqual(self.gi.tools.calls, 2)
+
+    def test_ttl(self):
+        self.index.ttl = 0
+        self.index.get_ids()
+        self.index.get_ids()
+        self.assertEqual(self.gi.tools.calls, 2)
+
+    def test_toolbox_generation(self):
+        self.index.get_ids()
+        self.gi._toolbox_generation += 1
+        self.index.get_ids()
+        self.assertEqual(self.gi.tools.calls, 2)
+
+    def test_workflow_missing_ids(self):
+        obj_gi = Bunch(tool_id_index=self.index)
+        wf = wrappers.Workflow(SAMPLE_WF_DICT, gi=obj_gi)
+        self.assertEqual(self.gi.tools.calls, 0)
+        self.assertTrue(wf.is_runnable)
+        self.assertEqual(wrappers.Workflow(SAMPLE_WF_DICT, gi=obj_gi).missing_ids, [])
+        self.assertEqual(self.gi.tools.calls, 1)
+        self.gi.tools.tool_ids.remove('Paste1')
+        self.index.invalidate()
+        self.assertEqual(wf.missing_ids, ['573'])
+
+
+class MockContainerClient:
+
+    def __init__(self, n):
+        self.infos = [{'id': str(i), 'name': 'n%d' % i, 'type': 'file' if i % 2 else 'collection', 'deleted': False}
+                      for i in range(n)]
+        self.calls = []
+
+    def _fetch_content_infos(self, id_, offset, limit, filters):
+        self.calls.append((offset, limit, filters))
+        infos = [_ for _ in self.infos if all(_[k] == v for k, v in filters.items())]
+        page = infos[offset:offset + limit]
+        return [wrappers.HistoryContentInfo(_) for _ in page], len(page) < limit
+
+
+class TestContentInfoList(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MockContainerClient(25)
+        self.c_infos = wrappers.ContentInfoList(self.client, 'c', page_size=10)
+
+    def test_lazy(self):
+        self.assertEqual(self.client.calls, [])
+        self.assertEqual(self.c_infos[3].id, '3')
+        self.assertEqual([_.id for _ in self.c_infos[:12]], [str(_) for _ in range(12)])
+        self.assertEqual(len(self.client.calls), 2)
+        for ci in self.c_infos:
+            if ci.id == '15':
+                break
+        self.assertEqual(len(self.client.calls), 2)
+        self.assertEqual(len(self.c_infos), 25)
+        self.assertEqual(self.c_infos[-1].id, '24')
+        self.assertEqual(len(self.client.calls), 3)
+        self.assertRaises(IndexError, self.c_infos.__getitem__, 25)
+
+    def test_filter(self):
+        files = self.c_infos.filter(type='file')
+        self.assertEqual([_.id for _ in files], [str(_) for _ in range(1, 25, 2)])
+        self.assertEqual(self.client.calls[-1][2], {'type': 'file'})
+
+    def test_lookup(self):
+        self.assertEqual([_.id for _ in self.c_infos.lookup('name', 'n7')], ['7'])
+        self.assertEqual(len(self.client.calls), 3)
+        self.assertEqual(len(self.c_infos.lookup('type', 'file')), 12)
+        self.assertEqual(self.c_infos.lookup('id', '25'), [])
+        self.c_infos._extend([wrappers.HistoryContentInfo({'id': '25', 'name': 'n7', 'type': 'file'})])
+        self.assertEqual([_.id for _ in self.c_infos.lookup('name', 'n7')], ['7', '25'])
+        self.assertEqual(len(self.c_infos.lookup('type', 'file')), 13)
+        self.assertEqual(len(self.client.calls), 3)
+
+    def test_merge(self):
+        self.c_infos._merge([wrappers.HistoryContentInfo({'id': '3', 'name': 'x', 'type': 'file'})])
+        self.assertEqual(self.client.calls, [])
+        files = self.c_infos.filter(type='file', deleted=False)
+        self.assertEqual(len(files), 12)
+        files._merge([
+            wrappers.HistoryContentInfo({'id': '3', 'name': 'n3bis', 'type': 'file', 'deleted': False}),
+            wrappers.HistoryContentInfo({'id': '5', 'name': 'n5', 'type': 'file', 'deleted': True}),
+            wrappers.HistoryContentInfo({'id': '25', 'name': 'n25', 'type': 'file', 'deleted': False}),
+        ])
+        self.assertEqual(len(files), 12)
+        self.assertEqual(files[1].name, 'n3bis')
+        self.assertEqual(files[-1].id, '25')
+        self.assertNotIn('5', [_.id for _ in files])
+        self.assertEqual([_.id for _ in files.lookup('name', 'n25')], ['25'])
+
+
+class TestHistoryUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.gi = galaxy_instance.GalaxyInstance('http://localhost:8080', api_key='test')
+        self.hist = wrappers.History({'id': 'h', 'name': 'test'}, gi=self.gi)
+
+    def test_paste_content(self):
+        hda_dict = {'id': 'd', 'name': 'Pasted Entry', 'state': 'queued'}
+        self.gi.gi.tools.paste_content = lambda content, history_id, **kwargs: {'outputs': [hda_dict], 'jobs': []}
+        content_infos = self.hist.content_infos
+        # The history is not refreshed (there is no Galaxy server to ask)
+        hda = self.hist.paste_content('foo')
+        self.assertEqual((hda.id, hda.name), ('d', 'Pasted Entry'))
+        self.assertIs(hda.container, self.hist)
+        self.assertIsNot(self.hist.content_infos, content_infos)
+
+
 @test_util.skip_unless_galaxy()
 class GalaxyObjectsTestBase(unittest.TestCase):
 
@@ -488,6 +809,24 @@ class TestLibrary(GalaxyObjectsTestBase):
             hist.delete(purge=True)
         self._check_datasets([ds])
 
+    def test_batch(self):
+        folder = self.lib.create_folder('test_%s' % uuid.uuid4().hex)
+        # Load the content infos, which are then updated from the uploads
+        self.assertEqual(len(self.lib.content_infos), 2)
+        with tempfile.NamedTemporaryFile(mode='w', prefix='bioblend_test_') as f:
+            f.write(FOO_DATA)
+            f.flush()
+            with self.lib.batch() as batch:
+                batch.upload_data(FOO_DATA)
+                batch.upload_data(FOO_DATA, folder=folder)
+                batch.upload_from_local(f.name)
+                self.assertIsNone(batch.datasets)
+        self.assertEqual(len(batch.datasets), 3)
+        self._check_datasets(batch.datasets)
+        paths = {_.name for _ in self.lib.content_infos}
+        self.lib.refresh()
+        self.assertEqual(paths, {_.name for _ in self.lib.content_infos})
+
     def test_get_dataset(self):
         ds = self.lib.upload_data(FOO_DATA)
         retrieved = self.lib.get_dataset(ds.id)
@@ -570,6 +909,43 @@ class TestHistory(GalaxyObjectsTestBase):
         h = self.gi.histories.get(hist_id)
         self.assertTrue(h.deleted)
 
+    def test_get_previews_keys(self):
+        prevs = [_ for _ in self.gi.histories.get_previews(keys=['name']) if _.id == self.hist.id]
+        self.assertEqual(len(prevs), 1)
+        self.assertEqual(set(prevs[0].wrapped), {'id', 'name'})
+        self.assertEqual(prevs[0].name, self.hist.name)
+        self.assertFalse(prevs[0].deleted)
+        self.assertIn('tags', prevs[0].wrapped)
+
+    def test_content_infos(self):
+        hdas = [self.hist.paste_content(FOO_DATA) for _ in range(3)]
+        c_infos = wrappers.ContentInfoList(self.gi.histories, self.hist.id, page_size=2)
+        self.assertEqual([_.id for _ in c_infos], [_.id for _ in hdas])
+        self.assertEqual(c_infos[1].id, hdas[1].id)
+        self.assertEqual(len(c_infos.filter(type='collection')), 0)
+        self.assertEqual(len(c_infos.filter(type='file', visible=True)), 3)
+
+    def test_identity_map(self):
+        gi = galaxy_instance.GalaxyInstance(self.gi.gi.url, self.gi.gi.key, identity_map=True)
+        hist = gi.histories.get(self.hist.id)
+        self.assertIs(gi.histories.get(self.hist.id), hist)
+        hda = hist.paste_content(FOO_DATA)
+        self.assertIs(hist.get_dataset(hda.id), hda)
+        hist.refresh()
+        self.assertEqual(hist.dataset_ids, [hda.id])
+        self.assertIs(gi.histories.get(self.hist.id), hist)
+
+    def test_identity_map_get_datasets(self):
+        gi = galaxy_instance.GalaxyInstance(self.gi.gi.url, self.gi.gi.key, identity_map=True)
+        hist = gi.histories.get(self.hist.id)
+        hda = hist.paste_content(FOO_DATA)
+        self.assertIs(hist.get_datasets()[0], hda)
+        # Change the dataset on the server, bypassing the wrapper
+        gi.gi.histories.update_dataset(hist.id, hda.id, name='renamed')
+        datasets = hist.get_datasets()
+        self.assertIs(datasets[0], hda)
+        self.assertEqual(hda.name, 'renamed')
+
     def _check_dataset(self, hda):
         self.assertIsInstance(hda, wrappers.HistoryDatasetAssociation)
         self.assertIs(hda.container, self.hist)
@@ -694,6 +1070,18 @@ class TestHDAContents(GalaxyObjectsTestBase):
     def test_dataset_get_contents(self):
         self.assertEqual(FOO_DATA.encode(), self.ds.get_contents())
 
+    def test_dataset_get_contents_content_cache(self):
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            self.gi.gi.content_cache = ContentCache(tempdir)
+            self.assertEqual(FOO_DATA.encode(), self.ds.get_contents())
+            cached_path = self.ds.get_cached_path()
+            self.assertTrue(cached_path.startswith(tempdir))
+            self.assertEqual(FOO_DATA.encode(), self.ds.get_contents())
+        finally:
+            self.gi.gi.content_cache = None
+            shutil.rmtree(tempdir)
+
     def test_dataset_update(self):
         new_name = 'test_%s' % uuid.uuid4().hex
         new_annotation = 'Annotation for %s' % new_name
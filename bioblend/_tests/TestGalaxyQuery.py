@@ -0,0 +1,55 @@
+"""
+Tests for the query builder, which do not need a Galaxy server.
+"""
+import datetime
+
+from bioblend.galaxy.query import Query
+from .test_util import unittest
+
+ITEMS = [
+    {'id': 'a', 'name': 'RNA-seq 1', 'deleted': False, 'tags': ['paper'], 'update_time': '2020-07-04T12:00:00.500000'},
+    {'id': 'b', 'name': 'ChIP-seq', 'deleted': True, 'tags': [], 'update_time': '2020-07-05T12:00:00.000000'},
+    {'id': 'c', 'name': 'rna-seq 2', 'deleted': False, 'tags': ['paper', 'x'], 'update_time': '2020-07-03T00:00:00'},
+    {'id': 'd', 'name': 'misc'},
+]
+
+
+class TestQuery(unittest.TestCase):
+
+    def test_to_params(self):
+        q = Query().filter('name', 'x').filter('name', 'RNA', op='contains').tag('paper')
+        q = q.updated_after(datetime.datetime(2020, 7, 4, 14, tzinfo=datetime.timezone(datetime.timedelta(hours=2))))
+        q = q.filter('state', ['ok', 'error'], op='in').order_by('update_time', desc=True).limit(10).offset(20)
+        self.assertEqual(q.keys('id', 'name').to_params(), {
+            'q': ['name', 'name-contains', 'tag-has', 'update_time-gt', 'state-in'],
+            'qv': ['x', 'RNA', 'paper', '2020-07-04T12:00:00.000000', 'ok,error'],
+            'order': 'update_time-dsc',
+            'limit': 10,
+            'offset': 20,
+            'keys': 'id,name',
+        })
+        self.assertEqual(Query().to_params(), {})
+        self.assertRaises(ValueError, Query().filter, 'name', 'x', op='startswith')
+
+    def test_immutable(self):
+        base = Query().filter('deleted', False)
+        base.filter('name', 'x').limit(1)
+        self.assertEqual(base.to_params(), {'q': ['deleted'], 'qv': [False]})
+
+    def test_apply_filters(self):
+        def ids(q):
+            return [_['id'] for _ in q.apply(ITEMS)]
+
+        self.assertEqual(ids(Query().filter('deleted', False)), ['a', 'c'])
+        self.assertEqual(ids(Query().filter('name', 'rna', op='contains')), ['a', 'c'])
+        self.assertEqual(ids(Query().filter('name', '%-seq _', op='like')), ['a', 'c'])
+        self.assertEqual(ids(Query().filter('id', 'a,d', op='in')), ['a', 'd'])
+        self.assertEqual(ids(Query().tag('x')), ['c'])
+        self.assertEqual(ids(Query().updated_after('2020-07-04T12:00:00')), ['a', 'b'])
+        self.assertEqual(ids(Query().updated_before(datetime.datetime(2020, 7, 4))), ['c'])
+
+    def test_apply_order_page_keys(self):
+        q = Query().order_by('update_time', desc=True)
+        self.assertEqual([_['id'] for _ in q.apply(ITEMS)], ['b', 'a', 'c', 'd'])
+        self.assertEqual([_['id'] for _ in q.offset(1).limit(2).apply(ITEMS)], ['a', 'c'])
+        self.assertEqual(q.limit(1).keys('id', 'tags').apply(ITEMS), [{'id': 'b', 'tags': []}])
@@ -0,0 +1,85 @@
+"""
+Tests for the column-oriented table, which do not need a Galaxy server.
+"""
+import array
+
+from bioblend.galaxy.table import ContentTable
+from .test_util import unittest
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+CONTENTS = [
+    {'id': 'a', 'hid': 1, 'state': 'ok', 'extension': 'txt', 'file_size': 10, 'deleted': False,
+     'update_time': '2020-07-04T12:00:00.500000', 'tags': ['x']},
+    {'id': 'b', 'hid': 2, 'state': 'error', 'extension': 'bam', 'file_size': None, 'deleted': True,
+     'update_time': '2020-07-04T12:00:01.000000', 'tags': []},
+    {'id': 'c', 'hid': 3, 'state': 'ok', 'extension': 'txt', 'file_size': 30, 'deleted': False,
+     'update_time': '2020-07-04T11:00:00.000000', 'tags': []},
+    {'id': 'd', 'hid': 4, 'state': 'ok', 'extension': 'bam', 'file_size': 5},
+]
+
+
+class TestContentTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = ContentTable.from_dicts(iter(CONTENTS))
+
+    def test_columns(self):
+        self.assertEqual(len(self.table), 4)
+        self.assertEqual(self.table.keys, ['id', 'hid', 'state', 'extension', 'file_size', 'deleted', 'update_time', 'tags'])
+        self.assertIsInstance(self.table.raw_column('hid'), array.array)
+        self.assertIsInstance(self.table.raw_column('file_size'), array.array)
+        self.assertIsInstance(self.table.raw_column('deleted'), array.array)
+        self.assertIsInstance(self.table.raw_column('update_time'), array.array)
+        self.assertEqual(self.table.column('file_size'), [10, None, 30, 5])
+        self.assertEqual(self.table.column('deleted'), [False, True, False, None])
+        self.assertEqual(self.table.column('update_time')[0], 1593864000.5)
+        self.assertEqual(self.table[0]['tags'], ('x',))
+        self.assertEqual(self.table[-1], {
+            'id': 'd', 'hid': 4, 'state': 'ok', 'extension': 'bam', 'file_size': 5, 'deleted': None,
+            'update_time': None, 'tags': None})
+        self.assertRaises(IndexError, self.table.__getitem__, 4)
+        table = ContentTable.from_dicts(CONTENTS, keys=['id', 'name'])
+        self.assertEqual(table.keys, ['id', 'name'])
+        self.assertEqual(table.column('name'), [None] * 4)
+
+    def test_mixed_types(self):
+        table = ContentTable.from_dicts([{'v': 1}, {'v': 2.5}, {'v': 'x'}, {'v': 2 ** 70}])
+        self.assertEqual(table.column('v'), [1, 2.5, 'x', 2 ** 70])
+        table = ContentTable.from_dicts([{'v': 1}, {'v': 2.5}])
+        self.assertEqual(table.column('v'), [1.0, 2.5])
+
+    def test_filter(self):
+        self.assertEqual(self.table.filter(state='ok').column('id'), ['a', 'c', 'd'])
+        self.assertEqual(self.table.filter(state='ok', deleted=False).column('id'), ['a', 'c'])
+        self.assertEqual(self.table.filter(deleted=None).column('id'), ['d'])
+        self.assertEqual(self.table.filter(file_size=lambda s: s is not None and s > 8).column('id'), ['a', 'c'])
+        self.assertEqual(self.table.filter(extension={'bam', 'vcf'}).column('id'), ['b', 'd'])
+        self.assertEqual(self.table.filter(file_size={None, 5}).column('id'), ['b', 'd'])
+        self.assertEqual(len(self.table.filter(hid='1')), 0)
+        self.assertEqual(len(self.table.filter(name='foo')), 0)
+        self.assertEqual(len(self.table.filter(name=None)), 4)
+
+    def test_sort(self):
+        self.assertEqual(self.table.sort('file_size').column('id'), ['d', 'a', 'c', 'b'])
+        self.assertEqual(self.table.sort('file_size', reverse=True).column('id'), ['c', 'a', 'd', 'b'])
+        self.assertEqual(self.table.sort('update_time').column('id'), ['c', 'a', 'b', 'd'])
+
+    def test_group_by(self):
+        self.assertEqual(self.table.group_by('state'), {'ok': 3, 'error': 1})
+        self.assertEqual(self.table.group_by('extension', 'file_size', 'sum'), {'txt': 40, 'bam': 5})
+        self.assertEqual(self.table.group_by('extension', 'file_size', 'count'), {'txt': 2, 'bam': 1})
+        self.assertEqual(self.table.group_by('extension', 'file_size', 'max'), {'txt': 30, 'bam': 5})
+        self.assertEqual(self.table.group_by('state', 'file_size', 'mean'), {'ok': 15, 'error': None})
+        self.assertEqual(self.table.group_by('update_time', 'hid', 'min')[None], 4)
+        self.assertRaises(ValueError, self.table.group_by, 'state', 'hid', 'median')
+
+    @unittest.skipIf(pandas is None, 'pandas is not installed')
+    def test_to_pandas(self):
+        df = self.table.to_pandas()
+        self.assertEqual(len(df), 4)
+        self.assertEqual(list(df.columns), self.table.keys)
+        self.assertEqual(df['hid'].sum(), 10)
@@ -1,7 +1,10 @@
 """
 """
 import os
+import shutil
+import tempfile
 
+from bioblend.galaxy.cache import UploadIndex
 from bioblend.galaxy.tools.inputs import (
     conditional,
     dataset,
@@ -79,6 +82,62 @@ class TestGalaxyTools(GalaxyTestBase.GalaxyTestBase):
         )
         self._wait_for_and_verify_upload(tool_output, file_name, fn, expected_dbkey=dbkey)
 
+    @test_util.skip_unless_galaxy('release_19.09')
+    def test_upload_file_resumable(self):
+        history = self.gi.histories.create_history(name="test_upload_file_resumable history")
+        fn = test_util.get_abspath("test_util.py")
+        file_name = "test1"
+        tool_output = self.gi.tools.upload_file(
+            fn,
+            history_id=history["id"],
+            file_name=file_name,
+            file_type="txt",
+            resumable=True,
+            chunk_size=1024,
+        )
+        self._wait_for_and_verify_upload(tool_output, file_name, fn)
+
+    def test_upload_file_upload_index(self):
+        history = self.gi.histories.create_history(name="test_upload_file_upload_index history")
+        fn = test_util.get_abspath("test_util.py")
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            self.gi.upload_index = UploadIndex(os.path.join(tempdir, 'index.sqlite'))
+            tool_output = self.gi.tools.upload_file(fn, history["id"], file_name="test1", file_type="txt")
+            self._wait_for_and_verify_upload(tool_output, "test1", fn)
+            tool_output = self.gi.tools.upload_file(fn, history["id"], file_name="test2", file_type="txt")
+            self.assertEqual(tool_output["jobs"], [])
+            self._wait_for_and_verify_upload(tool_output, "test2", fn)
+        finally:
+            self.gi.upload_index = None
+            shutil.rmtree(tempdir)
+
+    def test_upload_batch(self):
+        history = self.gi.histories.create_history(name="test_upload_batch history")
+        fn = test_util.get_abspath("test_util.py")
+        tool_output = self.gi.tools.upload_batch(history["id"], [
+            {'path': fn, 'name': 'file1', 'file_type': 'txt'},
+            {'content': 'a\tb\n', 'name': 'pasted1'},
+        ])
+        self.assertEqual(len(tool_output["outputs"]), 2)
+        self.assertEqual({_['name'] for _ in tool_output["outputs"]}, {'file1', 'pasted1'})
+        for output in tool_output["outputs"]:
+            expected_contents = open(fn, "rb").read() if output['name'] == 'file1' else b'a\tb\n'
+            self._wait_and_verify_dataset(output["id"], expected_contents)
+
+    def test_upload_batch_collection(self):
+        history = self.gi.histories.create_history(name="test_upload_batch_collection history")
+        tool_output = self.gi.tools.upload_batch(history["id"], [
+            {'content': '1\n'},
+            {'content': '2\n'},
+        ], collection_type='paired', collection_name='my pair')
+        self.assertEqual(len(tool_output["output_collections"]), 1)
+        hdca = self.gi.histories.show_dataset_collection(history["id"], tool_output["output_collections"][0]["id"])
+        self.assertEqual(hdca['name'], 'my pair')
+        self.assertEqual(hdca['collection_type'], 'paired')
+        self.assertEqual([_['element_identifier'] for _ in hdca['elements']], ['forward', 'reverse'])
+        self.assertRaises(ValueError, self.gi.tools.upload_batch, history["id"], [{'content': '1\n'}], collection_type='list')
+
     @test_util.skip_unless_tool("random_lines1")
     def test_run_random_lines(self):
         # Run second test case from randomlines.xml
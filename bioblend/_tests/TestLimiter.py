@@ -0,0 +1,168 @@
+"""
+Tests for the adaptive concurrency limiter, which do not need a Galaxy server.
+"""
+import threading
+import time
+
+from bioblend.util.limiter import (
+    AIMDLimiter,
+    BACKGROUND,
+    bind_priority,
+    current_priority,
+    INTERACTIVE,
+    priority,
+)
+from .test_util import unittest
+
+
+class TestAIMDLimiter(unittest.TestCase):
+
+    def test_increase_decrease(self):
+        limiter = AIMDLimiter(8, initial_limit=2, latency_tolerance=None)
+        for _ in range(20):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 6)
+        for _ in range(100):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 8)
+        limiter.release(limiter.acquire(), congested=True)
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(5):
+            limiter.release(limiter.acquire(), congested=True)
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_one_decrease_per_generation(self):
+        limiter = AIMDLimiter(8, initial_limit=8, latency_tolerance=None)
+        tickets = [limiter.acquire() for _ in range(8)]
+        self.assertEqual(limiter.in_flight, 8)
+        for ticket in tickets:
+            limiter.release(ticket, congested=True)
+        self.assertEqual(limiter.limit, 4)
+
+    def request(self, limiter, latency, key=('GET', '/api/histories/{id}')):
+        ticket = limiter.acquire()
+        ticket.start -= latency
+        limiter.release(ticket, key=key)
+
+    def test_latency(self):
+        limiter = AIMDLimiter(10, initial_limit=10, latency_tolerance=3.0)
+        for _ in range(200):
+            self.request(limiter, 0.05)
+        # A single slow request is not a congestion signal
+        self.request(limiter, 2)
+        self.assertEqual(limiter.limit, 10)
+        for _ in range(300):
+            self.request(limiter, 0.05)
+        for _ in range(30):
+            self.request(limiter, 0.5)
+        self.assertLess(limiter.limit, 10)
+        # Requests without a key are ignored
+        limiter = AIMDLimiter(10, initial_limit=10, latency_tolerance=3.0)
+        for latency in [0.05] * 100 + [0.5] * 30:
+            self.request(limiter, latency, key=None)
+        self.assertEqual(limiter.limit, 10)
+
+    def test_mixed_latency(self):
+        limiter = AIMDLimiter(10, initial_limit=10, latency_tolerance=3.0)
+        # Slow but normal requests to other endpoints are not compared with
+        # the fast ones
+        for i in range(500):
+            self.request(limiter, 0.05)
+            if i % 10 == 0:
+                self.request(limiter, 2, key=('GET', '/api/histories/{id}/contents'))
+            if i % 50 == 0:
+                self.request(limiter, 5, key=('POST', '/api/tools'))
+        self.assertEqual(limiter.limit, 10)
+        for _ in range(30):
+            self.request(limiter, 20, key=('GET', '/api/histories/{id}/contents'))
+        self.assertLess(limiter.limit, 10)
+
+    def test_wait(self):
+        limiter = AIMDLimiter(2, initial_limit=1)
+        ticket = limiter.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            limiter.release(limiter.acquire())
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release(ticket)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+
+    def test_not_adaptive(self):
+        limiter = AIMDLimiter(8, adaptive=False)
+        self.assertEqual(limiter.limit, 8)
+        limiter.release(limiter.acquire(), congested=True)
+        self.assertEqual(limiter.limit, 8)
+
+    def test_max_rate(self):
+        limiter = AIMDLimiter(8, max_rate=100)
+        start = time.monotonic()
+        for _ in range(21):
+            limiter.release(limiter.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, AIMDLimiter, 0)
+        self.assertRaises(ValueError, AIMDLimiter, 4, min_limit=5)
+        self.assertRaises(ValueError, AIMDLimiter, 4, backoff=1)
+        self.assertRaises(ValueError, AIMDLimiter, 4, max_rate=0)
+
+    def test_reserved_slots(self):
+        limiter = AIMDLimiter(4, adaptive=False, reserved_slots=1)
+        tickets = [limiter.acquire(BACKGROUND) for _ in range(3)]
+        acquired = threading.Event()
+
+        def acquire_background():
+            limiter.release(limiter.acquire(BACKGROUND))
+            acquired.set()
+
+        thread = threading.Thread(target=acquire_background)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        # The reserved slot is still available to interactive requests
+        limiter.release(limiter.acquire(INTERACTIVE))
+        self.assertFalse(acquired.is_set())
+        limiter.release(tickets.pop())
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        for ticket in tickets:
+            limiter.release(ticket)
+
+    def test_interactive_first(self):
+        limiter = AIMDLimiter(2, adaptive=False, reserved_slots=0)
+        tickets = [limiter.acquire(INTERACTIVE) for _ in range(2)]
+        order = []
+
+        def acquire(lane):
+            ticket = limiter.acquire(lane)
+            order.append(lane)
+            limiter.release(ticket)
+
+        background = threading.Thread(target=acquire, args=(BACKGROUND,))
+        background.start()
+        time.sleep(0.05)
+        interactive = threading.Thread(target=acquire, args=(INTERACTIVE,))
+        interactive.start()
+        time.sleep(0.05)
+        limiter.release(tickets.pop())
+        background.join(5)
+        interactive.join(5)
+        self.assertEqual(order, [INTERACTIVE, BACKGROUND])
+        limiter.release(tickets.pop())
+
+    def test_priority(self):
+        self.assertEqual(current_priority(), INTERACTIVE)
+        with priority(BACKGROUND):
+            self.assertEqual(current_priority(), BACKGROUND)
+            func = bind_priority(current_priority)
+        self.assertEqual(current_priority(), INTERACTIVE)
+        self.assertEqual(func(), BACKGROUND)
+        with self.assertRaises(ValueError):
+            with priority('urgent'):
+                pass
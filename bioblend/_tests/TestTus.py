@@ -0,0 +1,66 @@
+"""
+Tests for the tus uploader, which do not need a Galaxy server.
+"""
+import os
+import tempfile
+
+import requests
+
+from bioblend.util.tus import TusUploader
+from .test_util import unittest
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ''
+
+
+class FakeTusUploader(TusUploader):
+    """
+    Keep the uploads in memory instead of sending them to a server. The
+    ``PATCH`` requests at the offsets in ``failures`` fail (with a connection
+    error) as many times as the value for that offset.
+    """
+
+    def __init__(self, failures, **kwargs):
+        super().__init__('http://localhost/api/upload/resumable_upload/', **kwargs)
+        self.failures = dict(failures)
+        self.uploads = {}
+
+    def _request(self, method, url, headers=None, **kwargs):
+        if method == 'POST':
+            url = self.endpoint + str(len(self.uploads))
+            self.uploads[url] = b''
+            return FakeResponse(201, {'Location': url})
+        if method == 'HEAD':
+            return FakeResponse(200, {'Upload-Offset': str(len(self.uploads[url]))})
+        offset = int(headers['Upload-Offset'])
+        if self.failures.get(offset):
+            self.failures[offset] -= 1
+            raise requests.exceptions.ConnectionError('connection reset')
+        self.uploads[url] = self.uploads[url][:offset] + kwargs['data']
+        return FakeResponse(204, {'Upload-Offset': str(len(self.uploads[url]))})
+
+
+class TestTusUploader(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'0123456789' * 10)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_retries_per_chunk(self):
+        # Two different chunks each fail max_retries times
+        uploader = FakeTusUploader({20: 2, 60: 2}, chunk_size=20, max_retries=2)
+        url = uploader.upload(self.path)
+        self.assertEqual(uploader.uploads[url], b'0123456789' * 10)
+
+    def test_too_many_retries(self):
+        uploader = FakeTusUploader({20: 3}, chunk_size=20, max_retries=2)
+        self.assertRaises(requests.exceptions.ConnectionError, uploader.upload, self.path)
@@ -0,0 +1,88 @@
+"""
+Benchmark the construction of object wrappers, from dictionaries passed by
+the caller (which are copied) and from dictionaries just decoded from a
+Galaxy response (which are handed over without copying).
+
+Run from the project root folder with::
+
+    python -m bioblend._tests.benchmark_wrappers [N_ITEMS] [REPEAT]
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from bioblend.galaxy.objects.wrappers import (
+    _Owned,
+    HistoryContentInfo,
+)
+
+
+def contents_response(n_items):
+    """
+    Return the JSON text of a fake ``/api/histories/<ID>/contents``
+    response with ``n_items`` datasets.
+    """
+    return json.dumps([{
+        'id': '%016x' % i,
+        'name': 'dataset %d' % i,
+        'type': 'file',
+        'history_content_type': 'dataset',
+        'hid': i + 1,
+        'deleted': False,
+        'purged': False,
+        'visible': True,
+        'state': 'ok',
+        'extension': 'txt',
+        'history_id': 'f2db41e1fa331b3e',
+        'create_time': '2020-07-04T12:00:00.000000',
+        'update_time': '2020-07-04T12:00:00.000000',
+        'url': '/api/histories/f2db41e1fa331b3e/contents/%016x' % i,
+        'tags': [],
+    } for i in range(n_items)])
+
+
+def build_copy(response):
+    return [HistoryContentInfo(_) for _ in json.loads(response)]
+
+
+def build_owned(response):
+    return [HistoryContentInfo(_Owned(_)) for _ in json.loads(response)]
+
+
+def measure(build, response, repeat):
+    """
+    Return the best time (in seconds) of ``repeat`` runs of
+    ``build(response)``, and the memory (in bytes) retained by the built
+    wrappers and at peak during the construction.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        wrappers = build(response)
+        times.append(time.perf_counter() - start)
+        del wrappers
+    gc.collect()
+    tracemalloc.start()
+    wrappers = build(response)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del wrappers
+    return min(times), retained, peak
+
+
+def main(argv):
+    n_items = int(argv[1]) if len(argv) > 1 else 50000
+    repeat = int(argv[2]) if len(argv) > 2 else 3
+    response = contents_response(n_items)
+    print('%d HistoryContentInfo objects, best of %d' % (n_items, repeat))
+    for label, build in (('copy', build_copy), ('_Owned', build_owned)):
+        seconds, retained, peak = measure(build, response, repeat)
+        print('%-8s %6.3f s  retained %6.1f MiB  peak %6.1f MiB' % (
+            label, seconds, retained / 2 ** 20, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
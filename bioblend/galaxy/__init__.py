@@ -1,17 +1,29 @@
 """
 A base representation of an instance of Galaxy
 """
+from os.path import basename
+
 from bioblend.galaxy import (config, datasets, datatypes, folders, forms,
                              ftpfiles, genomes, groups, histories,
                              invocations, jobs, libraries, quotas, roles,
                              tool_data, tools, toolshed, users, visual,
                              workflows)
 from bioblend.galaxy.client import Client
-from bioblend.galaxyclient import GalaxyClient
+from bioblend.galaxy.executor import GalaxyExecutor
+from bioblend.galaxyclient import (
+    DEFAULT_POOL_SIZE,
+    GalaxyClient,
+)
+from bioblend.util.tus import (
+    DEFAULT_CHUNK_SIZE,
+    TusUploader,
+)
 
 
 class GalaxyInstance(GalaxyClient):
-    def __init__(self, url, key=None, email=None, password=None, verify=True):
+    def __init__(self, url, key=None, email=None, password=None, verify=True, timeout=None,
+                 max_get_attempts=None, get_retry_delay=None, pool_size=DEFAULT_POOL_SIZE, max_workers=None,
+                 adaptive_concurrency=False, max_rate=None, reserved_slots=None):
         """
         A base representation of a connection to a Galaxy instance, identified
         by the server URL and user credentials.
@@ -52,8 +64,93 @@ class GalaxyInstance(GalaxyClient):
 
         :param verify: Whether to verify the server's TLS certificate
         :type verify: bool
+
+        :type timeout: float
+        :param timeout: Timeout (in seconds) for each request, ``None`` for no
+          timeout (the default)
+
+        :type max_get_attempts: int
+        :param max_get_attempts: Maximum number of attempts for a GET request
+          made through this instance. If not set, the value set for all
+          instances with ``Client.set_max_get_retries()`` is used.
+
+        :type get_retry_delay: float
+        :param get_retry_delay: Delay (in seconds) before retrying a failed
+          GET request made through this instance. If not set, the value set
+          for all instances with ``Client.set_get_retry_delay()`` is used.
+
+        :type pool_size: int
+        :param pool_size: Maximum number of connections to the server kept
+          open for reuse. Set it to at least the number of threads making
+          concurrent requests through this instance. If
+          ``adaptive_concurrency``, ``max_rate`` or ``reserved_slots`` is
+          set, it is also the maximum number of concurrent requests made
+          through this instance.
+
+        :type max_workers: int
+        :param max_workers: Number of threads used by :meth:`map` and
+          :meth:`submit`, by default ``pool_size``
+
+        :type adaptive_concurrency: bool
+        :param adaptive_concurrency: Whether to adapt the number of concurrent
+          requests to the load of the server: the limit starts at half of
+          ``pool_size``, grows while requests succeed (up to ``pool_size``),
+          and is halved when the server answers that it is overloaded (HTTP
+          429, 502, 503 or 504), a request times out or the recent latencies
+          of an endpoint increase sharply. The limiter is available as the
+          ``limiter`` attribute. By default (``False``), and unless
+          ``max_rate`` or ``reserved_slots`` is set, the number of
+          concurrent requests is not limited and ``limiter`` is ``None``.
+
+        :type max_rate: float
+        :param max_rate: Maximum number of requests started per second by
+          this instance, ``None`` (the default) for no maximum
+
+        :type reserved_slots: int
+        :param reserved_slots: Number of concurrent requests reserved for
+          interactive calls, which background calls cannot use. Calls are
+          interactive unless made in the background priority lane, e.g. with
+          ``gi.map(..., priority=BACKGROUND)`` or within a
+          ``with priority(BACKGROUND):`` block (see
+          :mod:`bioblend.util.limiter`). By default, slots are reserved only
+          if ``adaptive_concurrency`` is ``True`` (a fifth of ``pool_size``,
+          at least 1), and not when only ``max_rate`` is set. While requests
+          are limited, background calls also wait while interactive ones are
+          waiting. If requests are not limited at all (the default), the
+          priority lanes only separate the thread pools of :meth:`map` and
+          :meth:`submit`.
+
+        A ``GalaxyInstance`` object can be shared by several threads: its
+        settings are not shared with other instances, the API key is fetched
+        only once even if several threads need it at the same time, and the
+        requests of all threads reuse the connections of a single pool. The
+        settings themselves should be changed only while no requests are being
+        made.
+
+        To avoid uploading the same file contents again and again, set the
+        ``upload_index`` attribute to a
+        :class:`~bioblend.galaxy.cache.UploadIndex` object. Similarly, to
+        avoid downloading the same dataset contents again and again, set the
+        ``content_cache`` attribute to a
+        :class:`~bioblend.galaxy.cache.ContentCache` object.
+
+        To cut the tail latency of GET requests by sending a duplicate of the
+        slow ones, set the ``hedger`` attribute to a
+        :class:`~bioblend.galaxy.hedging.Hedger` object.
         """
-        super().__init__(url, key, email, password, verify=verify)
+        super().__init__(url, key, email, password, verify=verify, timeout=timeout, pool_size=pool_size,
+                         adaptive_concurrency=adaptive_concurrency, max_rate=max_rate,
+                         reserved_slots=reserved_slots)
+        if max_get_attempts is not None:
+            self.max_get_attempts = max_get_attempts
+        if get_retry_delay is not None:
+            self.get_retry_delay = get_retry_delay
+        self.executor = GalaxyExecutor(pool_size if max_workers is None else max_workers)
+        self.upload_index = None
+        self.content_cache = None
+        self.hedger = None
+        # Incremented when tools are (un)installed, to invalidate tool caches
+        self._toolbox_generation = 0
         self.libraries = libraries.LibraryClient(self)
         self.histories = histories.HistoryClient(self)
         self.workflows = workflows.WorkflowClient(self)
@@ -76,21 +173,87 @@ class GalaxyInstance(GalaxyClient):
         self.tool_data = tool_data.ToolDataClient(self)
         self.folders = folders.FoldersClient(self)
 
+    def map(self, fn, items, concurrency=None, progress=None, cancel=None, priority=None):
+        """
+        Call ``fn`` on each of ``items`` using the threads of this instance,
+        e.g. ``gi.map(gi.datasets.show_dataset, dataset_ids)``, and return the
+        results in the same order as ``items``. A failed call does not stop
+        the others: its exception is collected in the ``errors`` attribute
+        of the result.
+
+        See :meth:`.executor.GalaxyExecutor.map` for the parameters.
+
+        :rtype: :class:`~.executor.MapResult`
+        :return: the results and errors of the calls
+        """
+        return self.executor.map(fn, items, concurrency=concurrency, progress=progress, cancel=cancel,
+                                 priority=priority)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule the call ``fn(*args, **kwargs)`` on the threads of this
+        instance, in the priority lane of the current thread.
+
+        :rtype: :class:`concurrent.futures.Future`
+        :return: the future result of the call
+        """
+        return self.executor.submit(fn, *args, **kwargs)
+
     @property
     def max_get_attempts(self):
-        return Client.max_get_retries()
+        """
+        The maximum number of attempts for a GET request made through this
+        instance.
+        """
+        if self._max_get_attempts is None:
+            return Client.max_get_retries()
+        return self._max_get_attempts
 
     @max_get_attempts.setter
     def max_get_attempts(self, v):
-        Client.set_max_get_retries(v)
+        if v < 1:
+            raise ValueError("Number of retries must be >= 1 (got: %s)" % v)
+        self._max_get_attempts = v
 
     @property
     def get_retry_delay(self):
-        return Client.get_retry_delay()
+        """
+        The delay (in seconds) to wait before retrying a failed GET request
+        made through this instance.
+        """
+        if self._get_retry_delay is None:
+            return Client.get_retry_delay()
+        return self._get_retry_delay
 
     @get_retry_delay.setter
     def get_retry_delay(self, v):
-        Client.set_get_retry_delay(v)
+        if v < 0:
+            raise ValueError("Retry delay must be >= 0 (got: %s)" % v)
+        self._get_retry_delay = v
+
+    def _tus_upload(self, path, file_name=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                    parallel=1, storage=None):
+        """
+        Stage a local file on Galaxy's resumable upload (tus) endpoint.
+
+        See :class:`~bioblend.util.tus.TusUploader` for the meaning of the
+        ``chunk_size``, ``parallel`` and ``storage`` parameters.
+
+        :rtype: dict
+        :return: a value for the ``files_0|file_data`` upload parameter,
+          referencing the staged upload
+        """
+        if file_name is None:
+            file_name = basename(path)
+        uploader = TusUploader(self.url + '/upload/resumable_upload/',
+                               params=self.default_params, verify=self.verify,
+                               timeout=self.timeout, chunk_size=chunk_size,
+                               parallel=parallel, storage=storage)
+        upload_url = uploader.upload(path, metadata={'filename': file_name})
+        return {
+            'session_id': upload_url.rstrip('/').rsplit('/', 1)[-1],
+            'name': file_name,
+        }
 
     def __repr__(self):
         """
@@ -0,0 +1,420 @@
+"""
+Local, persistent caches for data exchanged with Galaxy servers.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import bioblend
+from bioblend import ConnectionError
+
+# Hash algorithm names as used by Galaxy's ``DatasetHash.hash_function``
+GALAXY_HASH_FUNCTIONS = {
+    'md5': 'MD5',
+    'sha1': 'SHA-1',
+    'sha256': 'SHA-256',
+    'sha512': 'SHA-512',
+}
+
+
+def default_cache_dir():
+    """
+    Return the default directory for BioBlend's caches, i.e.
+    ``$XDG_CACHE_HOME/bioblend`` or ``~/.cache/bioblend``.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'bioblend')
+
+
+def hash_file(path, algorithm='sha256', chunk_size=1024 * 1024):
+    """
+    Compute the hex digest of the contents of the file at ``path``, reading
+    ``chunk_size`` bytes at a time.
+    """
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+UploadIndexEntry = namedtuple('UploadIndexEntry', ['src', 'container_id', 'dataset_id'])
+
+
+class UploadIndex:
+    """
+    A local index mapping the content hash of uploaded files to the Galaxy
+    datasets created from them, stored in a SQLite database.
+
+    When a :class:`~bioblend.galaxy.GalaxyInstance` has an ``upload_index``
+    set, :meth:`~bioblend.galaxy.tools.ToolClient.upload_file` and
+    :meth:`~bioblend.galaxy.libraries.LibraryClient.upload_file_from_local_path`
+    look up the file being uploaded in the index and, if a dataset with the
+    same content, datatype and dbkey is found on the same Galaxy server,
+    copy it instead of sending the file again. Before being reused, each
+    dataset is checked on the server: it must still exist, be in the 'ok'
+    state, have the same size and, if Galaxy has computed a hash for it,
+    the same hash. Entries failing these checks are removed from the index.
+
+    The database can safely be shared by multiple threads and processes.
+    """
+
+    def __init__(self, path=None, algorithm='sha256'):
+        """
+        :type path: str
+        :param path: path of the SQLite database file. By default,
+          ``upload_index.sqlite`` in :func:`default_cache_dir`
+
+        :type algorithm: str
+        :param algorithm: name of the :mod:`hashlib` algorithm used to hash
+          the file contents
+        """
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'upload_index.sqlite')
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self.algorithm = algorithm
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT, algorithm TEXT, size INTEGER, mtime_ns INTEGER, digest TEXT,
+                PRIMARY KEY (path, algorithm))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS datasets (
+                galaxy_url TEXT, algorithm TEXT, digest TEXT, file_type TEXT, dbkey TEXT,
+                src TEXT, container_id TEXT, dataset_id TEXT,
+                PRIMARY KEY (galaxy_url, src, dataset_id))""")
+            conn.execute("""CREATE INDEX IF NOT EXISTS datasets_by_digest
+                ON datasets (galaxy_url, algorithm, digest)""")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _stat_key(self, path):
+        st = os.stat(path)
+        return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+    def _cached_digest(self, conn, abspath, size, mtime_ns):
+        row = conn.execute(
+            "SELECT digest FROM file_hashes WHERE path = ? AND algorithm = ? AND size = ? AND mtime_ns = ?",
+            (abspath, self.algorithm, size, mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def hash_file(self, path):
+        """
+        Return the digest of the file at ``path``, computing it only if the
+        file has been modified since it was last hashed.
+        """
+        abspath, size, mtime_ns = self._stat_key(path)
+        with self._connect() as conn:
+            digest = self._cached_digest(conn, abspath, size, mtime_ns)
+        if digest is None:
+            digest = hash_file(path, self.algorithm)
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)",
+                             (abspath, self.algorithm, size, mtime_ns, digest))
+        return digest
+
+    def hash_files(self, paths, max_workers=None):
+        """
+        Return the digests of the files at ``paths``, hashing the modified
+        ones in parallel in a pool of ``max_workers`` processes.
+
+        :rtype: list of str
+        :return: digests, in the same order as ``paths``
+        """
+        keys = [self._stat_key(_) for _ in paths]
+        with self._connect() as conn:
+            digests = [self._cached_digest(conn, *key) for key in keys]
+        todo = [i for i, digest in enumerate(digests) if digest is None]
+        if todo:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = executor.map(hash_file, [paths[i] for i in todo],
+                                       [self.algorithm] * len(todo))
+                for i, digest in zip(todo, results):
+                    digests[i] = digest
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)",
+                                 [keys[i] + (self.algorithm, digests[i]) for i in todo])
+        return digests
+
+    def add(self, gi, digest, file_type, dbkey, src, container_id, dataset_id):
+        """
+        Record that the dataset ``dataset_id`` (of type ``src``, i.e. 'hda'
+        or 'ld', in the history or library ``container_id``) has been
+        created on ``gi`` from a file with the given ``digest``.
+        """
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (gi.base_url, self.algorithm, digest, file_type, dbkey, src, container_id, dataset_id))
+
+    def remove(self, gi, src, dataset_id):
+        """
+        Remove a dataset from the index.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM datasets WHERE galaxy_url = ? AND src = ? AND dataset_id = ?",
+                         (gi.base_url, src, dataset_id))
+
+    def _is_valid(self, gi, entry, digest, size):
+        """
+        Check on the server that the dataset of ``entry`` can be reused.
+
+        :rtype: bool or None
+        :return: ``True`` if the dataset can be reused, ``None`` if it
+          cannot be reused yet (i.e. it is not in a terminal state) or by the
+          current user, ``False`` otherwise
+        """
+        try:
+            if entry.src == 'hda':
+                ds = gi.histories.show_dataset(entry.container_id, entry.dataset_id)
+            else:
+                ds = gi.libraries.show_dataset(entry.container_id, entry.dataset_id)
+        except ConnectionError as e:
+            bioblend.log.info("Cannot reuse dataset %s: %s", entry.dataset_id, e)
+            # Keep the entry if the server could not be reached, or if the
+            # dataset is only not accessible to the current user (entries are
+            # shared by all the users of a Galaxy server)
+            return False if e.status_code in (400, 404) else None
+        if ds.get('deleted') or ds.get('purged'):
+            return False
+        state = ds.get('state')
+        if state != 'ok':
+            return None if state in ('new', 'upload', 'queued', 'running', 'setting_metadata') else False
+        if ds.get('file_size') is not None and int(ds['file_size']) != size:
+            return False
+        hash_function = GALAXY_HASH_FUNCTIONS.get(self.algorithm)
+        for h in ds.get('hashes') or []:
+            if h.get('hash_function') == hash_function and h.get('hash_value') != digest:
+                return False
+        return True
+
+    def find(self, gi, path, digest, file_type='auto', dbkey='?', srcs=('hda', 'ld')):
+        """
+        Find datasets on ``gi`` which have been created from a file with the
+        same content as the file at ``path`` (whose digest is ``digest``) and
+        with the same ``file_type`` and ``dbkey``, and which can still be
+        reused.
+
+        :type srcs: tuple of str
+        :param srcs: acceptable dataset types ('hda' and/or 'ld')
+
+        :rtype: generator of :class:`UploadIndexEntry`
+        """
+        size = os.path.getsize(path)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT src, container_id, dataset_id FROM datasets WHERE galaxy_url = ? AND algorithm = ? AND digest = ? AND file_type = ? AND dbkey = ?",
+                (gi.base_url, self.algorithm, digest, file_type, dbkey)).fetchall()
+        for row in rows:
+            entry = UploadIndexEntry(*row)
+            if entry.src not in srcs:
+                continue
+            valid = self._is_valid(gi, entry, digest, size)
+            if valid:
+                yield entry
+            elif valid is False:
+                self.remove(gi, entry.src, entry.dataset_id)
+
+
+def dataset_version(ds_dict):
+    """
+    Return a string identifying the version of the contents of a dataset,
+    based on the dataset details returned by Galaxy, or ``None`` if the
+    contents cannot be cached (i.e. the dataset is not in the 'ok' state or
+    its update time is unknown).
+    """
+    if ds_dict.get('state') != 'ok' or not ds_dict.get('update_time'):
+        return None
+    parts = [ds_dict['update_time'], str(ds_dict.get('file_size'))]
+    for h in ds_dict.get('hashes') or []:
+        parts.append('{}:{}'.format(h.get('hash_function'), h.get('hash_value')))
+    return '|'.join(parts)
+
+
+class ContentCache:
+    """
+    A size-bounded, on-disk cache for the contents of datasets in the 'ok'
+    state, which never change.
+
+    Entries are keyed by Galaxy URL, dataset id and dataset version (see
+    :func:`dataset_version`), so that a dataset modified on the server is
+    downloaded again. Entries are written atomically and the least recently
+    used ones are evicted when the total size exceeds ``max_size``, so the
+    same cache directory can be shared by multiple threads and processes.
+
+    To avoid scanning the cache directory on every write, each
+    ``ContentCache`` object keeps an estimate of the total size, which is
+    updated by its own writes and recomputed when entries are evicted. The
+    entries written by other processes are therefore only taken into
+    account at the next eviction, and the cache may temporarily grow beyond
+    ``max_size``.
+
+    To use it, set the ``content_cache`` attribute of a
+    :class:`~bioblend.galaxy.GalaxyInstance` object.
+    """
+
+    TMP_PREFIX = '.tmp-'
+
+    def __init__(self, path=None, max_size=10 * 1024 ** 3):
+        """
+        :type path: str
+        :param path: cache directory. By default, ``contents`` in
+          :func:`default_cache_dir`
+
+        :type max_size: int
+        :param max_size: maximum total size (in bytes) of the cached contents
+        """
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'contents')
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        # Estimate of the total size of the cached contents, None until the
+        # cache directory is first scanned
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _entry_path(self, galaxy_url, dataset_id, version):
+        key = hashlib.sha256('\n'.join((galaxy_url, dataset_id, version)).encode()).hexdigest()
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, galaxy_url, dataset_id, version):
+        """
+        Return the path and metadata of a cached entry, or ``None`` if
+        the entry is not in the cache.
+
+        :rtype: tuple or None
+        :return: path of the cached contents and metadata dict
+        """
+        entry_path = self._entry_path(galaxy_url, dataset_id, version)
+        try:
+            # Mark the entry as recently used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(entry_path + '.json') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {}
+        return entry_path, metadata
+
+    def put(self, galaxy_url, dataset_id, version, chunks, metadata=None):
+        """
+        Atomically store the contents of a dataset, given as an iterable of
+        ``bytes`` chunks, and evict least recently used entries if needed.
+
+        :type metadata: dict
+        :param metadata: JSON-serializable metadata to store with the entry
+
+        :rtype: str
+        :return: path of the cached contents
+        """
+        entry_path = self._entry_path(galaxy_url, dataset_id, version)
+        dirname = os.path.dirname(entry_path)
+        os.makedirs(dirname, exist_ok=True)
+        if metadata:
+            self._write_atomically(dirname, entry_path + '.json', [json.dumps(metadata).encode()])
+        size = self._write_atomically(dirname, entry_path, chunks)
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            over_size = self._size is None or self._size > self.max_size
+        if over_size:
+            self.evict(keep=entry_path)
+        return entry_path
+
+    def _write_atomically(self, dirname, dest, chunks):
+        """
+        Write the chunks to ``dest`` through a temporary file, and return
+        the number of bytes written.
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix=self.TMP_PREFIX, dir=dirname)
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        size += f.write(chunk)
+            os.replace(tmp_path, dest)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return size
+
+    def get_or_fetch(self, galaxy_url, dataset_id, version, fetch):
+        """
+        Return the path and metadata of a cached entry, calling ``fetch()``
+        to fill the cache if the entry is missing. ``fetch()`` must return a
+        tuple of an iterable of ``bytes`` chunks and a metadata dict.
+        """
+        entry = self.get(galaxy_url, dataset_id, version)
+        if entry is not None:
+            return entry
+        chunks, metadata = fetch()
+        return self.put(galaxy_url, dataset_id, version, chunks, metadata=metadata), metadata
+
+    def _entries(self):
+        """
+        Return a list of (mtime, size, path) tuples for all cached entries.
+        """
+        entries = []
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if filename.startswith(self.TMP_PREFIX) or filename.endswith('.json'):
+                    continue
+                entry_path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry_path))
+        return entries
+
+    def _remove(self, entry_path):
+        for path in (entry_path, entry_path + '.json'):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries (except ``keep``) until the
+        total size of the cache is not greater than ``max_size``.
+
+        This scans the whole cache directory, and is called by :meth:`put`
+        only when the estimated total size exceeds ``max_size``.
+        """
+        entries = self._entries()
+        total_size = sum(_[1] for _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if entry_path == keep:
+                continue
+            self._remove(entry_path)
+            total_size -= size
+        with self._lock:
+            self._size = total_size
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        for _, _, entry_path in self._entries():
+            self._remove(entry_path)
+        with self._lock:
+            self._size = 0
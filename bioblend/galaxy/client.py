@@ -5,6 +5,7 @@ This class is primarily a helper for the library and user code
 should not use it directly.
 """
 
+import functools
 import time
 
 import requests
@@ -20,7 +21,9 @@ class Client:
 
     # Class variables that configure GET request retries.  Note that since these
     # are class variables their values are shared by all Client instances --
-    # i.e., HistoryClient, WorkflowClient, etc.
+    # i.e., HistoryClient, WorkflowClient, etc. -- unless overridden for a
+    # Galaxy instance by setting its ``max_get_attempts`` and
+    # ``get_retry_delay`` attributes.
     #
     # Number of attempts before giving up on a GET request.
     _max_get_retries = 1
@@ -101,6 +104,33 @@ class Client:
                 c_url = c_url + '/contents'
         return c_url
 
+    def _get_retry_settings(self):
+        """
+        Return the maximum number of attempts for a GET request and the delay
+        between them, as set for the Galaxy instance or else for all clients.
+        """
+        max_attempts = getattr(self.gi, '_max_get_attempts', None)
+        retry_delay = getattr(self.gi, '_get_retry_delay', None)
+        if max_attempts is None:
+            max_attempts = self.max_get_retries()
+        if retry_delay is None:
+            retry_delay = self.get_retry_delay()
+        return max_attempts, retry_delay
+
+    @staticmethod
+    def _serialization_params(view=None, keys=None):
+        """
+        Return the request parameters selecting the fields that Galaxy
+        serializes for an item: those of ``view`` plus ``keys``, or only
+        ``keys`` if ``view`` is not set.
+        """
+        params = {}
+        if view is not None:
+            params['view'] = view
+        if keys is not None:
+            params['keys'] = ','.join(keys)
+        return params
+
     def _get(self, id=None, deleted=False, contents=None, url=None,
              params=None, json=True):
         """
@@ -111,22 +141,27 @@ class Client:
 
         The request will optionally be retried as configured by
         ``max_get_retries`` and ``get_retry_delay``: this offers some
-        resilience in the presence of temporary failures.
+        resilience in the presence of temporary failures. If the ``hedger``
+        attribute of the Galaxy instance is set, each attempt is hedged.
 
         :return: The decoded response if ``json`` is set to ``True``, otherwise
           the response object
         """
         if not url:
             url = self._make_url(module_id=id, deleted=deleted, contents=contents)
-        attempts_left = self.max_get_retries()
-        retry_delay = self.get_retry_delay()
+        attempts_left, retry_delay = self._get_retry_settings()
         bioblend.log.debug("GET - attempts left: %s; retry delay: %s",
                            attempts_left, retry_delay)
+        hedger = getattr(self.gi, 'hedger', None)
         msg = ''
         while attempts_left > 0:
             attempts_left -= 1
             try:
-                r = self.gi.make_get_request(url, params=params)
+                if hedger is None:
+                    r = self.gi.make_get_request(url, params=params)
+                else:
+                    r = hedger.get(url, functools.partial(self.gi.make_get_request, url, params=params),
+                                   pool_size=self.gi.pool_size)
             except (requests.exceptions.ConnectionError, ProtocolError) as e:
                 msg = str(e)
                 r = requests.Response()  # empty Response object used when raising ConnectionError
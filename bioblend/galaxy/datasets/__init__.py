@@ -4,10 +4,12 @@ Contains possible interactions with the Galaxy Datasets
 import logging
 import os
 import shlex
+import shutil
 import time
 from urllib.parse import urljoin
 
 import bioblend
+from bioblend.galaxy.cache import dataset_version
 from bioblend.galaxy.client import Client
 
 log = logging.getLogger(__name__)
@@ -21,7 +23,7 @@ class DatasetClient(Client):
         self.module = 'datasets'
         super().__init__(galaxy_instance)
 
-    def show_dataset(self, dataset_id, deleted=False, hda_ldda='hda'):
+    def show_dataset(self, dataset_id, deleted=False, hda_ldda='hda', view=None, keys=None):
         """
         Get details about a given dataset. This can be a history or a library dataset.
 
@@ -35,11 +37,21 @@ class DatasetClient(Client):
         :param hda_ldda: Whether to show a history dataset ('hda' - the default) or library
                          dataset ('ldda').
 
+        :type view: str
+        :param view: name of the set of fields to return for a history dataset,
+          e.g. ``summary`` or ``detailed`` (the default)
+
+        :type keys: list
+        :param keys: names of the fields to return for a history dataset, in
+          addition to those of ``view``. If ``view`` is not set, only these
+          fields are returned.
+
         :rtype: dict
         :return: Information about the HDA or LDDA
         """
         params = dict(
             hda_ldda=hda_ldda,
+            **self._serialization_params(view, keys)
         )
         return self._get(id=dataset_id, deleted=deleted, params=params)
 
@@ -49,6 +61,10 @@ class DatasetClient(Client):
         Download a dataset to file or in memory. If the dataset state is not
         'ok', a ``DatasetStateException`` will be thrown.
 
+        If the ``content_cache`` attribute of the Galaxy instance is set, the
+        dataset contents are downloaded only if they are not already in the
+        cache.
+
         :type dataset_id: str
         :param dataset_id: Encoded dataset ID
 
@@ -79,18 +95,21 @@ class DatasetClient(Client):
         if not dataset['state'] == 'ok':
             raise DatasetStateException("Dataset state is not 'ok'. Dataset id: {}, current state: {}".format(dataset_id, dataset['state']))
 
-        file_ext = dataset.get('file_ext')
-        # Resort to 'data' when Galaxy returns an empty or temporary extension
-        if not file_ext or file_ext == 'auto' or file_ext == '_sniff_':
-            file_ext = 'data'
-        # The preferred download URL is
-        # '/api/histories/<history_id>/contents/<dataset_id>/display?to_ext=<dataset_ext>'
-        # since the old URL:
-        # '/dataset/<dataset_id>/display/to_ext=<dataset_ext>'
-        # does not work when using REMOTE_USER with access disabled to
-        # everything but /api without auth
-        download_url = dataset['download_url'] + '?to_ext=' + file_ext
-        url = urljoin(self.gi.base_url, download_url)
+        file_ext = self._get_file_ext(dataset)
+        url = self._get_download_url(dataset, file_ext)
+
+        content_cache = self.gi.content_cache
+        if content_cache is not None and dataset_version(dataset) is not None:
+            f, metadata = self._open_cached(dataset, url, file_ext)
+            with f:
+                if file_path is None:
+                    return f.read()
+                file_local_path = self._get_file_local_path(
+                    dataset, file_ext, file_path, use_default_filename,
+                    metadata.get('content-disposition'))
+                with open(file_local_path, 'wb') as fp:
+                    shutil.copyfileobj(f, fp)
+            return file_local_path
 
         stream_content = file_path is not None
         r = self.gi.make_get_request(url, stream=stream_content)
@@ -101,21 +120,9 @@ class DatasetClient(Client):
                 log.warning("Transferred content size does not match content-length header (%s != %s)", len(r.content), r.headers['content-length'])
             return r.content
         else:
-            if use_default_filename:
-                # Build a useable filename
-                filename = dataset['name'] + '.' + file_ext
-                # Now try to get a better filename from the response headers
-                # We expect tokens 'filename' '=' to be followed by the quoted filename
-                if 'content-disposition' in r.headers:
-                    tokens = list(shlex.shlex(r.headers['content-disposition'], posix=True))
-                    try:
-                        header_filepath = tokens[tokens.index('filename') + 2]
-                        filename = os.path.basename(header_filepath)
-                    except (ValueError, IndexError):
-                        pass
-                file_local_path = os.path.join(file_path, filename)
-            else:
-                file_local_path = file_path
+            file_local_path = self._get_file_local_path(
+                dataset, file_ext, file_path, use_default_filename,
+                r.headers.get('content-disposition'))
 
             with open(file_local_path, 'wb') as fp:
                 for chunk in r.iter_content(chunk_size=bioblend.CHUNK_SIZE):
@@ -125,6 +132,125 @@ class DatasetClient(Client):
             # Return location file was saved to
             return file_local_path
 
+    def get_cached_path(self, dataset_id, maxwait=12000):
+        """
+        Make sure that the contents of a dataset are in the content cache of
+        the Galaxy instance (see its ``content_cache`` attribute) and return
+        the path of the local copy, which can be read without any further
+        copy. If the dataset state is not 'ok', a ``DatasetStateException``
+        will be thrown.
+
+        :type dataset_id: str
+        :param dataset_id: Encoded dataset ID
+
+        :type maxwait: float
+        :param maxwait: Total time (in seconds) to wait for the dataset state to
+          become terminal. If the dataset state is not terminal within this
+          time, a ``DatasetTimeoutException`` will be thrown.
+
+        :rtype: str
+        :return: path of the cached dataset contents
+
+        .. note::
+          The returned file may be evicted from the cache at any time by
+          another download, in this or another thread or process, even
+          before it is opened. It should be opened promptly (an open file
+          can still be read after eviction, except on Windows), never
+          modified, and a ``FileNotFoundError`` should be handled by calling
+          this method again. Use ``download_dataset()`` to get a copy which
+          is not affected by evictions.
+        """
+        if self.gi.content_cache is None:
+            raise ValueError('The content_cache attribute of the Galaxy instance is not set')
+        dataset = self._block_until_dataset_terminal(dataset_id, maxwait=maxwait)
+        if dataset_version(dataset) is None:
+            raise DatasetStateException("Dataset state is not 'ok'. Dataset id: {}, current state: {}".format(dataset_id, dataset['state']))
+        file_ext = self._get_file_ext(dataset)
+        url = self._get_download_url(dataset, file_ext)
+        return self._get_cached(dataset, url, file_ext)[0]
+
+    def _get_cached(self, dataset, url, file_ext):
+        """
+        Return the path and metadata of the cached contents of ``dataset``,
+        downloading them from ``url`` if needed.
+        """
+        def fetch():
+            r = self.gi.make_get_request(url, stream=True)
+            r.raise_for_status()
+            metadata = {}
+            if 'content-disposition' in r.headers:
+                metadata['content-disposition'] = r.headers['content-disposition']
+            return self._checked_chunks(r), metadata
+
+        version = '{}|{}'.format(dataset_version(dataset), file_ext)
+        return self.gi.content_cache.get_or_fetch(
+            self.gi.base_url, 'hda:' + dataset['id'], version, fetch)
+
+    def _checked_chunks(self, r):
+        """
+        Iterate over the content of a streamed response, raising a
+        ``ConnectionError`` at the end if its size does not match the
+        content-length header, so that truncated contents are not cached.
+        """
+        size = 0
+        for chunk in r.iter_content(chunk_size=bioblend.CHUNK_SIZE):
+            size += len(chunk)
+            yield chunk
+        # The content-length header is the size of the encoded content
+        if 'content-length' in r.headers and 'content-encoding' not in r.headers and size != int(r.headers['content-length']):
+            raise bioblend.ConnectionError(
+                "Transferred content size does not match content-length header ({} != {})".format(size, r.headers['content-length']),
+                status_code=r.status_code)
+
+    def _open_cached(self, dataset, url, file_ext):
+        """
+        Return an open binary file with the cached contents of ``dataset``
+        and the metadata, downloading them from ``url`` if needed. The file
+        can be read even if the entry is evicted afterwards.
+        """
+        for attempt in range(2):
+            cached_path, metadata = self._get_cached(dataset, url, file_ext)
+            try:
+                return open(cached_path, 'rb'), metadata
+            except FileNotFoundError:
+                # Evicted by another thread or process before being opened
+                if attempt:
+                    raise
+
+    def _get_file_ext(self, dataset):
+        file_ext = dataset.get('file_ext')
+        # Resort to 'data' when Galaxy returns an empty or temporary extension
+        if not file_ext or file_ext == 'auto' or file_ext == '_sniff_':
+            file_ext = 'data'
+        return file_ext
+
+    def _get_download_url(self, dataset, file_ext):
+        # The preferred download URL is
+        # '/api/histories/<history_id>/contents/<dataset_id>/display?to_ext=<dataset_ext>'
+        # since the old URL:
+        # '/dataset/<dataset_id>/display/to_ext=<dataset_ext>'
+        # does not work when using REMOTE_USER with access disabled to
+        # everything but /api without auth
+        download_url = dataset['download_url'] + '?to_ext=' + file_ext
+        return urljoin(self.gi.base_url, download_url)
+
+    def _get_file_local_path(self, dataset, file_ext, file_path, use_default_filename,
+                             content_disposition=None):
+        if not use_default_filename:
+            return file_path
+        # Build a useable filename
+        filename = dataset['name'] + '.' + file_ext
+        # Now try to get a better filename from the response headers
+        # We expect tokens 'filename' '=' to be followed by the quoted filename
+        if content_disposition is not None:
+            tokens = list(shlex.shlex(content_disposition, posix=True))
+            try:
+                header_filepath = tokens[tokens.index('filename') + 2]
+                filename = os.path.basename(header_filepath)
+            except (ValueError, IndexError):
+                pass
+        return os.path.join(file_path, filename)
+
     def get_datasets(self, limit=500, offset=0):
         """
         Provide a list of all datasets. Since this may be very large, ``limit``
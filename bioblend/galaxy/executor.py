@@ -0,0 +1,229 @@
+"""
+A thread pool owned by a Galaxy instance, to make many API calls
+concurrently, e.g.::
+
+    result = gi.map(gi.histories.delete_history, history_ids, concurrency=16)
+    for i, e in result.errors.items():
+        print(f'Could not delete history {history_ids[i]}: {e}')
+
+The calls share the connection pool and the retry settings of the instance.
+Bulk work can be run in the background priority lane, so that it does not
+delay interactive calls, e.g.::
+
+    from bioblend.util.limiter import BACKGROUND
+
+    gi.map(gi.datasets.show_dataset, dataset_ids, priority=BACKGROUND)
+"""
+import threading
+import time
+from collections import namedtuple
+from collections.abc import Sequence
+from concurrent.futures import (
+    CancelledError,
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from bioblend.util.limiter import (
+    current_priority,
+    PRIORITIES,
+    priority as lane_priority,
+)
+
+# Maximum time (in seconds) to notice that a map has been cancelled while
+# waiting for calls to complete
+CANCEL_POLL_INTERVAL = 0.2
+
+MapProgress = namedtuple('MapProgress', ['done', 'failed', 'total', 'elapsed', 'rate'])
+MapProgress.__doc__ = """
+Progress of a :meth:`GalaxyExecutor.map` call: number of calls ``done`` (of
+which ``failed`` raised an exception) out of ``total``, ``elapsed`` time in
+seconds and completion ``rate`` in calls per second.
+"""
+
+
+class MapResult(Sequence):
+    """
+    Results of a :meth:`GalaxyExecutor.map` call, in the same order as the
+    items. The result of a failed (or cancelled) call is ``None``, and its
+    exception is in the ``errors`` dict, keyed by the index of the item.
+    """
+
+    def __init__(self, results, errors, cancelled, elapsed):
+        self.results = results
+        self.errors = errors
+        self.cancelled = cancelled
+        self.elapsed = elapsed
+
+    def __getitem__(self, index):
+        return self.results[index]
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return '<{} of {} calls, {} failed{}>'.format(
+            self.__class__.__name__, len(self), len(self.errors), ', cancelled' if self.cancelled else '')
+
+    def raise_errors(self):
+        """
+        Raise the exception of the first failed call, if any.
+        """
+        if self.errors:
+            raise self.errors[min(self.errors)]
+
+
+class GalaxyExecutor:
+    """
+    A pool of ``max_workers`` threads for each priority lane (see
+    :mod:`bioblend.util.limiter`), created when first needed, so that
+    interactive calls never queue behind background ones. Calls are made in
+    the priority lane they were scheduled from.
+
+    Calls made from a thread of the pool (e.g. a function passed to
+    :meth:`map` which calls :meth:`map` again) are run in that thread, so
+    that nested calls cannot wait for the pool forever.
+    """
+
+    def __init__(self, max_workers):
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1 (got: %s)" % max_workers)
+        self.max_workers = max_workers
+        self._executors = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _mark_worker(self):
+        self._local.is_worker = True
+
+    def _in_worker(self):
+        return getattr(self._local, 'is_worker', False)
+
+    def _get_executor(self, lane):
+        with self._lock:
+            if lane not in self._executors:
+                self._executors[lane] = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='bioblend-%s' % lane,
+                    initializer=self._mark_worker)
+            return self._executors[lane]
+
+    @staticmethod
+    def _call(lane, fn, args, kwargs):
+        with lane_priority(lane):
+            return fn(*args, **kwargs)
+
+    def _submit(self, lane, fn, args, kwargs):
+        if self._in_worker():
+            future = Future()
+            try:
+                future.set_result(self._call(lane, fn, args, kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._get_executor(lane).submit(self._call, lane, fn, args, kwargs)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule the call ``fn(*args, **kwargs)``, in the priority lane of the
+        current thread.
+
+        :rtype: :class:`concurrent.futures.Future`
+        :return: the future result of the call
+        """
+        return self._submit(current_priority(), fn, args, kwargs)
+
+    def map(self, fn, items, concurrency=None, progress=None, cancel=None, priority=None):
+        """
+        Call ``fn`` on each of ``items``, making up to ``concurrency`` calls at
+        the same time, and wait for all of them. A failed call does not stop
+        the others.
+
+        :type fn: callable
+        :param fn: function taking an item as its only argument
+
+        :type items: iterable
+        :param items: the items
+
+        :type concurrency: int
+        :param concurrency: maximum number of concurrent calls, at most (and
+          by default) ``max_workers``
+
+        :type progress: callable
+        :param progress: function called with a :class:`MapProgress` after
+          each call completes, in the thread which called :meth:`map`
+
+        :type cancel: :class:`threading.Event`
+        :param cancel: when set (e.g. by another thread or by ``progress``),
+          no more calls are started and the calls not yet started are
+          cancelled. The calls already running are waited for.
+
+        :type priority: str
+        :param priority: priority lane of the calls, ``INTERACTIVE`` or
+          ``BACKGROUND`` (from :mod:`bioblend.util.limiter`), by default the
+          one of the current thread
+
+        :rtype: :class:`MapResult`
+        :return: the results and errors of the calls
+        """
+        if priority is None:
+            priority = current_priority()
+        elif priority not in PRIORITIES:
+            raise ValueError("Unknown priority {!r}, it must be one of: {}".format(priority, ', '.join(PRIORITIES)))
+        items = list(items)
+        total = len(items)
+        concurrency = self.max_workers if concurrency is None else min(concurrency, self.max_workers)
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1 (got: %s)" % concurrency)
+        results = [None] * total
+        errors = {}
+        start = time.monotonic()
+        done = failed = 0
+        pending = {}
+        next_index = 0
+        try:
+            while True:
+                cancelled = cancel is not None and cancel.is_set()
+                if cancelled:
+                    for future in pending:
+                        future.cancel()
+                while not cancelled and next_index < total and len(pending) < concurrency:
+                    pending[self._submit(priority, fn, (items[next_index],), {})] = next_index
+                    next_index += 1
+                if not pending:
+                    break
+                completed, _ = wait(pending, timeout=None if cancel is None else CANCEL_POLL_INTERVAL,
+                                    return_when=FIRST_COMPLETED)
+                for future in completed:
+                    i = pending.pop(future)
+                    try:
+                        results[i] = future.result()
+                    except CancelledError as e:
+                        errors[i] = e
+                        continue
+                    except Exception as e:
+                        errors[i] = e
+                        failed += 1
+                    done += 1
+                    if progress is not None:
+                        elapsed = time.monotonic() - start
+                        progress(MapProgress(done, failed, total, elapsed, done / elapsed if elapsed else 0.0))
+        except BaseException:
+            # E.g. KeyboardInterrupt: do not start the remaining calls
+            for future in pending:
+                future.cancel()
+            raise
+        for i in range(next_index, total):
+            errors[i] = CancelledError()
+        return MapResult(results, errors, cancelled, time.monotonic() - start)
+
+    def shutdown(self, wait=True):
+        """
+        Stop the threads of the pools, after the scheduled calls complete if
+        ``wait`` is ``True``. The pools are created again if needed.
+        """
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=wait)
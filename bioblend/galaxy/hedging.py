@@ -0,0 +1,204 @@
+"""
+Hedged GET requests, to cut the tail latency caused by requests stalled on a
+slow Galaxy web worker: if a GET request has not been answered after a
+given percentile of the recent latencies of its endpoint, a duplicate request
+is sent and the first response wins, e.g.::
+
+    from bioblend.galaxy.hedging import Hedger
+
+    gi.hedger = Hedger(percentile=95, budget=0.05)
+
+Only the GET requests made by the clients (which are idempotent) are hedged.
+"""
+import collections
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from bioblend.galaxyclient import DEFAULT_POOL_SIZE
+from bioblend.util import endpoint
+from bioblend.util.limiter import bind_priority
+
+
+def _succeeded(r):
+    return 200 <= r.status_code < 300
+
+
+class Hedger:
+    """
+    Track the latencies of GET requests per endpoint, and send a duplicate of
+    the requests which take longer than usual.
+
+    The extra load is capped by a budget: each request earns ``budget``
+    hedges (e.g. 0.05 allows 5 hedged requests out of 100), and at most
+    ``max_burst`` unused hedges are saved for later.
+
+    The first response with a 2xx status code wins. An error or another
+    response is used only if the other request fails too.
+
+    A request which is still running when the other one wins is not
+    interrupted (``requests`` cannot abort a request from another thread),
+    but its response is discarded. A hedge not yet started is cancelled.
+    """
+
+    def __init__(self, percentile=95, budget=0.05, min_samples=20, window=200, min_delay=0.01,
+                 max_burst=10, max_workers=None):
+        """
+        :type percentile: float
+        :param percentile: percentile (between 0 and 100) of the latencies of
+          an endpoint after which a request is hedged
+
+        :type budget: float
+        :param budget: number of hedges allowed per request
+
+        :type min_samples: int
+        :param min_samples: number of latencies of an endpoint needed before
+          hedging its requests
+
+        :type window: int
+        :param window: number of recent latencies kept for each endpoint
+
+        :type min_delay: float
+        :param min_delay: minimum delay (in seconds) before hedging a request
+
+        :type max_burst: float
+        :param max_burst: maximum number of unused hedges saved for later
+
+        :type max_workers: int
+        :param max_workers: number of threads making the requests, which
+          should be at least twice the number of threads making GET requests
+          at the same time, by default twice the ``pool_size`` of the Galaxy
+          instance
+        """
+        if not 0 < percentile < 100:
+            raise ValueError("percentile must be between 0 and 100 (got: %s)" % percentile)
+        if budget < 0:
+            raise ValueError("budget must be >= 0 (got: %s)" % budget)
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = max(1, min_samples)
+        self.window = window
+        self.min_delay = min_delay
+        self.max_burst = max_burst
+        self.max_workers = max_workers
+        # Number of requests, of hedges sent and of hedges which won
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+        self._latencies = {}
+        self._tokens = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def delay(self, url):
+        """
+        Return the delay (in seconds) after which a request to ``url`` is
+        hedged, or ``None`` if not enough latencies of its endpoint are known.
+        """
+        with self._lock:
+            latencies = self._latencies.get(endpoint(url))
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(self.min_delay, latencies[index])
+
+    def record(self, url, latency):
+        """
+        Record the latency (in seconds) of a successful request to ``url``.
+        """
+        key = endpoint(url)
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = collections.deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+    def _get_executor(self, pool_size):
+        with self._lock:
+            if self._executor is None:
+                max_workers = self.max_workers
+                if max_workers is None:
+                    max_workers = 2 * pool_size
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bioblend-hedge')
+            return self._executor
+
+    def _timed(self, url, send, started=None):
+        start = time.monotonic()
+        if started is not None:
+            started.set()
+        r = send()
+        if _succeeded(r):
+            self.record(url, time.monotonic() - start)
+        return r
+
+    def get(self, url, send, pool_size=DEFAULT_POOL_SIZE):
+        """
+        Make a GET request to ``url``, hedging it if it is slow.
+
+        :type url: str
+        :param url: the URL of the request, used to find its endpoint
+
+        :type send: callable
+        :param send: function without arguments making the request and
+          returning the response (it is called in another thread)
+
+        :type pool_size: int
+        :param pool_size: ``pool_size`` of the Galaxy instance, used to size
+          the thread pool if ``max_workers`` is not set
+
+        :rtype: requests.Response
+        :return: the first successful response
+        """
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.max_burst, self._tokens + self.budget)
+        delay = self.delay(url)
+        if delay is None:
+            return self._timed(url, send)
+        executor = self._get_executor(pool_size)
+        # Only the latency of the first request is recorded, the latency of
+        # hedges being biased towards faster responses
+        started = threading.Event()
+        primary = executor.submit(bind_priority(self._timed), url, send, started)
+        # Do not count the time spent waiting for a thread against the delay
+        started.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_token():
+            return primary.result()
+        hedge = executor.submit(bind_priority(send))
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [_ for _ in done if _.exception() is None and _succeeded(_.result())]
+            if succeeded or not pending:
+                # Take the first successful response, or else the last one
+                winner = succeeded[0] if succeeded else done.pop()
+                for loser in pending:
+                    loser.cancel()
+                if succeeded and winner is hedge:
+                    with self._lock:
+                        self.wins += 1
+                return winner.result()
+
+    def shutdown(self):
+        """
+        Stop the threads making the requests. They are started again if
+        needed.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -1,19 +1,52 @@
 """
 Contains possible interactions with the Galaxy Histories
 """
+import datetime
+import io
 import logging
 import os
 import re
 import sys
+import tarfile
 import time
+from collections import namedtuple
+
+import requests
+from requests.packages.urllib3.exceptions import HTTPError
 
 import bioblend
 from bioblend import ConnectionError
 from bioblend.galaxy.client import Client
-from bioblend.util import attach_file
+from bioblend.galaxy.query import Query
+from bioblend.util import (
+    attach_file,
+    parse_timestamp,
+)
 
 log = logging.getLogger(__name__)
 
+# Minimum and maximum delay (in seconds) between checks of export readiness
+EXPORT_POLLING_MIN_INTERVAL = 1
+EXPORT_POLLING_MAX_INTERVAL = 30
+# Maximum number of history content ids to send with a single request
+CONTENTS_IDS_BATCH_SIZE = 100
+# Overlap (in seconds) between the update time windows of consecutive polls
+# in watch(), so that contents updated while a listing was being built are
+# not missed
+WATCH_OVERLAP = 60
+
+HistoryEvent = namedtuple('HistoryEvent', ['type', 'history_id', 'item', 'old_state', 'new_state'])
+HistoryEvent.__doc__ = """
+A change of a history content, as yielded by :meth:`HistoryClient.watch`.
+
+``type`` is one of ``'added'``, ``'state_changed'``, ``'deleted'``,
+``'undeleted'`` or ``'updated'`` (any other change, e.g. a rename or a change
+of visibility). ``item`` is the history content dict (in the 'summary' view
+of Galaxy's newer history contents API). ``old_state`` and ``new_state`` are
+the content state before and after the change (``old_state`` is ``None`` for
+``'added'`` events).
+"""
+
 
 class HistoryClient(Client):
 
@@ -52,7 +85,8 @@ class HistoryClient(Client):
 
         return self._post(payload=payload, files_attached=file_path is not None)
 
-    def get_histories(self, history_id=None, name=None, deleted=False, published=None):
+    def get_histories(self, history_id=None, name=None, deleted=False, published=None, view=None, keys=None,
+                      query=None):
         """
         Get all histories or filter the specific one(s) via the provided
         ``name`` or ``history_id``. Provide only one argument, ``name`` or
@@ -76,6 +110,19 @@ class HistoryClient(Client):
           (``True``) or for the non-published ones (``False``). If not set, no
           filtering is applied.
 
+        :type view: str
+        :param view: name of the set of fields to return for each history,
+          e.g. ``summary`` (the default) or ``detailed`` (the same fields as
+          :meth:`show_history`)
+
+        :type keys: list
+        :param keys: names of the fields to return for each history, in
+          addition to those of ``view``
+
+        :type query: :class:`~bioblend.galaxy.query.Query`
+        :param query: additional filters, ordering, pagination and fields,
+          which are all applied by Galaxy
+
         :rtype: list
         :return: Return a list of history element dicts. If more than one
                  history matches the given ``name``, return the list of all the
@@ -83,19 +130,25 @@ class HistoryClient(Client):
         """
         if history_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or history_id, but not both')
-        params = {}
+        query = query or Query()
+        if name is not None:
+            query = query.filter('name', name)
         if published is not None:
-            params.setdefault('q', []).append('published')
-            params.setdefault('qv', []).append(published)
+            query = query.filter('published', published)
+        if keys is not None:
+            query = query.keys(*keys)
+        params = query.to_params()
+        if view is not None:
+            params['view'] = view
         histories = self._get(deleted=deleted, params=params)
         if history_id is not None:
             history = next((_ for _ in histories if _['id'] == history_id), None)
             histories = [history] if history is not None else []
-        elif name is not None:
-            histories = [_ for _ in histories if _['name'] == name]
         return histories
 
-    def show_history(self, history_id, contents=False, deleted=None, visible=None, details=None, types=None):
+    def show_history(self, history_id, contents=False, deleted=None, visible=None, details=None, types=None,
+                     states=None, limit=None, offset=None, ids=None, update_time_gt=None, query=None,
+                     view=None, keys=None):
         """
         Get details of a given history. By default, just get the history meta
         information.
@@ -130,21 +183,207 @@ class HistoryClient(Client):
           ``['dataset_collection']``,  return only dataset collections. If not
           set, no filtering is applied.
 
+        :type states: list
+        :param states: When ``contents=True``, return only the history
+          contents in one of these states (e.g. ``['ok', 'error']``)
+
+        :type limit: int
+        :param limit: When ``contents=True``, maximum number of history
+          contents to return
+
+        :type offset: int
+        :param offset: When ``contents=True``, number of history contents to
+          skip (ordered by hid)
+
+        :type update_time_gt: str
+        :param update_time_gt: When ``contents=True``, return only the history
+          contents updated after this time (an ISO 8601 timestamp in UTC, e.g.
+          ``2020-07-04T12:34:56``)
+
+        :type query: :class:`~bioblend.galaxy.query.Query`
+        :param query: When ``contents=True``, additional filters, ordering,
+          pagination and fields for the history contents, which are all
+          applied by Galaxy
+
+        :type view: str
+        :param view: name of the set of fields to return for the history (e.g.
+          ``summary`` or ``detailed``, the default) or for each history
+          content (e.g. ``summary``, the default, or ``detailed``)
+
+        :type keys: list
+        :param keys: names of the fields to return for the history or for each
+          history content, in addition to those of ``view``. If ``view`` is not
+          set, only these fields are returned.
+
+        :type ids: list
+        :param ids: When ``contents=True``, return the full details of only
+          the history contents with these encoded ids (in batches of
+          ``CONTENTS_IDS_BATCH_SIZE`` ids per request). Note that datasets and
+          dataset collections may share the same encoded id, so ``types``
+          should be set if only one of them is wanted.
+
         :rtype: dict or list of dicts
         :return: details of the given history or list of dataset info
+
+        .. note::
+          When ``states``, ``limit``, ``offset``, ``update_time_gt``,
+          ``query``, ``view`` or ``keys`` is set (and ``ids`` is not), the
+          ``details`` parameter is ignored and the history contents are
+          returned by Galaxy's newer history contents API, by default in the
+          'summary' view. ``view`` and ``keys`` are ignored if ``ids`` is set.
         """
         params = {}
         if contents:
-            if details:
-                params['details'] = details
-            if deleted is not None:
-                params['deleted'] = deleted
-            if visible is not None:
-                params['visible'] = visible
-            if types is not None:
-                params['types'] = types
+            newer_filters = (states, limit, offset, update_time_gt, query, view, keys)
+            if ids is None and any(_ is not None for _ in newer_filters):
+                # Only the newer history contents API can filter and paginate
+                params['v'] = 'dev'
+                query = query or Query()
+                if deleted is not None:
+                    query = query.filter('deleted', deleted)
+                if visible is not None:
+                    query = query.filter('visible', visible)
+                if types is not None and len(types) == 1:
+                    query = query.filter('history_content_type', types[0])
+                if states is not None:
+                    query = query.filter('state', states, op='in')
+                if update_time_gt is not None:
+                    query = query.filter('update_time', update_time_gt, op='gt')
+                if limit is not None:
+                    query = query.limit(limit)
+                if offset is not None:
+                    query = query.offset(offset)
+                if keys is not None:
+                    query = query.keys(*keys)
+                if view is not None:
+                    params['view'] = view
+                params.update(query.to_params())
+            else:
+                if details:
+                    params['details'] = details
+                if deleted is not None:
+                    params['deleted'] = deleted
+                if visible is not None:
+                    params['visible'] = visible
+                if types is not None:
+                    params['types'] = types
+                if ids is not None:
+                    # Galaxy returns full details when ids are specified
+                    ret = []
+                    for i in range(0, len(ids), CONTENTS_IDS_BATCH_SIZE):
+                        params['ids'] = ','.join(ids[i:i + CONTENTS_IDS_BATCH_SIZE])
+                        ret.extend(self._get(id=history_id, contents=contents, params=params))
+                    return ret
+        else:
+            params.update(self._serialization_params(view, keys))
         return self._get(id=history_id, contents=contents, params=params)
 
+    def watch(self, history_ids, interval=10, maxwait=None, include_existing=False):
+        """
+        Watch the contents of some histories and yield their changes.
+
+        Each history is polled every ``interval`` seconds, asking Galaxy only
+        for the contents updated since the previous poll (minus an overlap of
+        ``WATCH_OVERLAP`` seconds), so that the amount of data transferred
+        depends on the number of changes rather than on the size of the
+        histories. The histories are polled concurrently with the executor of
+        the Galaxy instance. Contents which did not change in a way worth
+        reporting are skipped.
+
+        :type history_ids: list of str
+        :param history_ids: Encoded ids of the histories to watch
+
+        :type interval: float
+        :param interval: Time (in seconds) to wait between 2 consecutive polls
+          of all histories
+
+        :type maxwait: float
+        :param maxwait: Total time (in seconds) after which to stop watching.
+          If ``None``, watch until the generator is closed.
+
+        :type include_existing: bool
+        :param include_existing: whether to yield an ``'added'`` event for each
+          content already in the histories when the watch starts
+
+        :rtype: generator of :class:`HistoryEvent`
+        :return: the changes of the history contents, in the order in which
+          they have been detected
+
+        .. note::
+          A history which cannot be polled (e.g. because of a network error) is
+          skipped until the next poll, after logging a warning.
+        """
+        assert interval > 0
+        assert maxwait is None or maxwait >= 0
+        deadline = None if maxwait is None else time.monotonic() + maxwait
+        # For each history, the last seen snapshot of each content
+        known = {history_id: None for history_id in history_ids}
+        while True:
+            polls = self.gi.executor.map(lambda _: self._watch_poll(_, known[_]), known)
+            for i, (history_id, snapshots) in enumerate(known.items()):
+                e = polls.errors.get(i)
+                if e is not None:
+                    if not isinstance(e, ConnectionError):
+                        raise e
+                    log.warning("Failed to poll contents of history %s: %s", history_id, e)
+                    continue
+                items = polls[i]
+                if snapshots is None:
+                    snapshots = known[history_id] = {}
+                    report = include_existing
+                else:
+                    report = True
+                for item in items:
+                    key = (item['id'], item.get('history_content_type'))
+                    new = self._content_snapshot(item)
+                    old = snapshots.get(key)
+                    snapshots[key] = new
+                    if report and new != old:
+                        yield from self._content_events(history_id, item, old, new)
+            if deadline is not None:
+                time_left = deadline - time.monotonic()
+                if time_left <= 0:
+                    return
+                time.sleep(min(time_left, interval))
+            else:
+                time.sleep(interval)
+
+    def _watch_poll(self, history_id, snapshots):
+        """
+        Return the contents of a history updated since the latest update time
+        in ``snapshots`` (minus ``WATCH_OVERLAP``), or all its contents if
+        ``snapshots`` is empty or ``None``.
+        """
+        update_times = [_['update_time'] for _ in (snapshots or {}).values() if _['update_time']]
+        if not update_times:
+            return self.show_history(history_id, contents=True, offset=0)
+        since = parse_timestamp(max(update_times)) - datetime.timedelta(seconds=WATCH_OVERLAP)
+        return self.show_history(history_id, contents=True, update_time_gt=since.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+
+    @staticmethod
+    def _content_snapshot(item):
+        # Dataset collections have a populated_state instead of a state
+        return {
+            'state': item.get('state', item.get('populated_state')),
+            'deleted': item.get('deleted'),
+            'update_time': item.get('update_time'),
+        }
+
+    @staticmethod
+    def _content_events(history_id, item, old, new):
+        if old is None:
+            yield HistoryEvent('added', history_id, item, None, new['state'])
+            return
+        changed = False
+        if new['deleted'] != old['deleted']:
+            changed = True
+            yield HistoryEvent('deleted' if new['deleted'] else 'undeleted', history_id, item, old['state'], new['state'])
+        if new['state'] != old['state']:
+            changed = True
+            yield HistoryEvent('state_changed', history_id, item, old['state'], new['state'])
+        if not changed:
+            yield HistoryEvent('updated', history_id, item, old['state'], new['state'])
+
     def delete_dataset(self, history_id, dataset_id, purge=False):
         """
         Mark corresponding dataset as deleted.
@@ -188,7 +427,7 @@ class HistoryClient(Client):
         url = '/'.join((self._make_url(history_id, contents=True), 'dataset_collections', dataset_collection_id))
         self._delete(url=url)
 
-    def show_dataset(self, history_id, dataset_id):
+    def show_dataset(self, history_id, dataset_id, view=None, keys=None):
         """
         Get details about a given history dataset.
 
@@ -198,11 +437,65 @@ class HistoryClient(Client):
         :type dataset_id: str
         :param dataset_id: Encoded dataset ID
 
+        :type view: str
+        :param view: name of the set of fields to return, e.g. ``summary`` or
+          ``detailed`` (the default)
+
+        :type keys: list
+        :param keys: names of the fields to return, in addition to those of
+          ``view``. If ``view`` is not set, only these fields are returned.
+
         :rtype: dict
         :return: Information about the dataset
         """
         url = '/'.join((self._make_url(history_id, contents=True), dataset_id))
-        return self._get(url=url)
+        return self._get(url=url, params=self._serialization_params(view, keys))
+
+    def show_datasets(self, history_id, dataset_ids=None, name=None, deleted=None, visible=None):
+        """
+        Get details about several history datasets, with as few requests as
+        possible.
+
+        :type history_id: str
+        :param history_id: Encoded history ID
+
+        :type dataset_ids: list
+        :param dataset_ids: Encoded IDs of the datasets. If not set, get all
+          the datasets in the history matching the other parameters. A
+          ``ValueError`` is raised if any of them is not a dataset of the
+          history
+
+        :type name: str
+        :param name: return only the datasets with this name
+
+        :type deleted: bool or None
+        :param deleted: whether to get only the deleted datasets (``True``) or
+          only the non-deleted ones (``False``). If not set, no filtering is
+          applied.
+
+        :type visible: bool or None
+        :param visible: whether to get only the visible datasets (``True``) or
+          only the hidden ones (``False``). If not set, no filtering is
+          applied.
+
+        :rtype: list of dicts
+        :return: Information about the datasets (as returned by
+          :meth:`show_dataset`), in the same order as ``dataset_ids`` or, if
+          not set, ordered by hid
+        """
+        query = Query()
+        for attr, value in (('name', name), ('deleted', deleted), ('visible', visible)):
+            if value is not None:
+                query = query.filter(attr, value)
+        if dataset_ids is None:
+            params = query.filter('history_content_type', 'dataset').to_params()
+            params.update(v='dev', view='detailed')
+            return self._get(url=self._make_url(history_id, contents=True), params=params)
+        datasets = {_['id']: _ for _ in self.show_history(history_id, contents=True, types=['dataset'], ids=dataset_ids)}
+        missing = [_ for _ in dataset_ids if _ not in datasets]
+        if missing:
+            raise ValueError('Datasets not found in history {}: {}'.format(history_id, ', '.join(missing)))
+        return [datasets[_] for _ in dataset_ids if query.matches(datasets[_])]
 
     def show_dataset_collection(self, history_id, dataset_collection_id):
         """
@@ -236,11 +529,16 @@ class HistoryClient(Client):
         :rtype: list
         :return: List of dictionaries
         """
+        if name_filter is None:
+            return self.show_datasets(history_id)
         if isinstance(name_filter, str):
+            if re.escape(name_filter) == name_filter:
+                # An exact match, which Galaxy can do
+                return self.show_datasets(history_id, name=name_filter)
             name_filter = re.compile(name_filter + '$')
-        return [self.show_dataset(history_id, h['id'])
-                for h in self.show_history(history_id, contents=True)
-                if name_filter is None or name_filter.match(h['name'])]
+        dataset_ids = [h['id'] for h in self.show_history(history_id, contents=True, types=['dataset'])
+                       if name_filter.match(h['name'])]
+        return self.show_datasets(history_id, dataset_ids)
 
     def show_dataset_provenance(self, history_id, dataset_id, follow=False):
         """
@@ -615,6 +913,8 @@ class HistoryClient(Client):
         }
         url = '%s/exports' % self._make_url(history_id)
         time_left = maxwait
+        # Poll often at first, then back off since big exports take long
+        interval = EXPORT_POLLING_MIN_INTERVAL
         while True:
             try:
                 r = self._put(payload={}, url=url, params=params)
@@ -622,8 +922,10 @@ class HistoryClient(Client):
                 if e.status_code == 202:  # export is not ready
                     if time_left > 0:
                         log.warning("Waiting for the export of history %s to complete. Will wait %i more s", history_id, time_left)
-                        time.sleep(1)
-                        time_left -= 1
+                        delay = min(interval, time_left)
+                        time.sleep(delay)
+                        time_left -= delay
+                        interval = min(interval * 1.5, EXPORT_POLLING_MAX_INTERVAL)
                     else:
                         return ''
                 else:
@@ -662,6 +964,87 @@ class HistoryClient(Client):
         for chunk in r.iter_content(chunk_size):
             outf.write(chunk)
 
+    def extract_history(self, history_id, jeha_id=None, path=None, callback=None,
+                        chunk_size=bioblend.CHUNK_SIZE, max_retries=3,
+                        progress=None, **export_kwds):
+        """
+        Download a history export archive and extract its members while it is
+        being transferred, without storing the archive itself.
+
+        :type history_id: str
+        :param history_id: history ID
+
+        :type jeha_id: str
+        :param jeha_id: jeha ID of an existing export (obtained via
+          :meth:`export_history`). If not provided, a new export is created
+          with :meth:`export_history` (passing ``export_kwds`` to it) and
+          waited for
+
+        :type path: str
+        :param path: directory where to extract the archive members
+
+        :type callback: callable
+        :param callback: function called with 2 arguments for each archive
+          member as soon as it arrives: the ``tarfile.TarInfo`` object and, for
+          regular files, a file object from which the member contents can be
+          read (``None`` for other member types). The file object is valid
+          only until the callback returns
+
+        :type chunk_size: int
+        :param chunk_size: how many bytes at a time should be read into memory
+
+        :type max_retries: int
+        :param max_retries: how many times the download is resumed (from the
+          last received byte) after a connection error
+
+        :type progress: callable
+        :param progress: function called after each received chunk with the
+          number of bytes received so far and the elapsed time in seconds
+
+        :rtype: dict
+        :return: a summary of the transfer, with the keys ``jeha_id``,
+          ``members`` (the number of archive members), ``bytes`` (the number
+          of bytes received), ``seconds`` (the elapsed time) and
+          ``throughput`` (in bytes per second)
+        """
+        if path is None and callback is None:
+            raise ValueError('At least one of path and callback must be provided')
+        if jeha_id is None:
+            export_kwds.setdefault('wait', True)
+            jeha_id = self.export_history(history_id, **export_kwds)
+            if not jeha_id:
+                raise ConnectionError('The export of history %s is not ready' % history_id)
+        url = '{}/exports/{}'.format(self._make_url(module_id=history_id), jeha_id)
+        start = time.time()
+        stream = _ResumableResponseStream(
+            lambda headers: self.gi.make_get_request(url, stream=True, headers=headers),
+            max_retries=max_retries,
+            progress=progress and (lambda n: progress(n, time.time() - start)))
+        members = 0
+        with tarfile.open(fileobj=io.BufferedReader(stream, buffer_size=chunk_size), mode='r|*') as tar:
+            for member in tar:
+                members += 1
+                if path is not None:
+                    _check_tar_member(member, path)
+                    _extract_tar_member(tar, member, path)
+                    if callback is not None:
+                        # The stream cannot be rewound, read back the extracted file
+                        if member.isfile():
+                            with open(os.path.join(path, member.name), 'rb') as fileobj:
+                                callback(member, fileobj)
+                        else:
+                            callback(member, None)
+                elif callback is not None:
+                    callback(member, tar.extractfile(member) if member.isfile() else None)
+        seconds = time.time() - start
+        return {
+            'jeha_id': jeha_id,
+            'members': members,
+            'bytes': stream.pos,
+            'seconds': seconds,
+            'throughput': stream.pos / seconds if seconds > 0 else None,
+        }
+
     def copy_dataset(self, history_id, dataset_id, source='hda'):
         """
         Copy a dataset to a history.
@@ -687,3 +1070,99 @@ class HistoryClient(Client):
 
         url = self._make_url(history_id, contents=True)
         return self._post(payload=payload, url=url)
+
+
+def _check_tar_member(member, path):
+    """
+    Refuse to extract archive members which would end up outside ``path``.
+    """
+    dest = os.path.realpath(path)
+    target = os.path.realpath(os.path.join(dest, member.name))
+    if os.path.commonpath([dest, target]) != dest:
+        raise ValueError('Archive member %s would be extracted outside %s' % (member.name, path))
+    if member.issym() or member.islnk():
+        link_target = os.path.realpath(os.path.join(os.path.dirname(target), member.linkname))
+        if member.islnk():
+            link_target = os.path.realpath(os.path.join(dest, member.linkname))
+        if os.path.commonpath([dest, link_target]) != dest:
+            raise ValueError('Archive member %s links outside %s' % (member.name, path))
+
+
+def _extract_tar_member(tar, member, path):
+    """
+    Extract an archive member with the 'data' extraction filter, which also
+    refuses special files and unsafe permissions, when available (i.e. in
+    Python 3.12 and in the security releases of older versions).
+    """
+    if hasattr(tarfile, 'data_filter'):
+        tar.extract(member, path, filter='data')
+    else:
+        tar.extract(member, path)
+
+
+class _ResumableResponseStream(io.RawIOBase):
+    """
+    A read-only raw stream over the body of a streamed GET response which,
+    after a connection error, transparently requests the rest of the body
+    with an HTTP ``Range`` header.
+    """
+
+    def __init__(self, open_response, max_retries=3, progress=None):
+        """
+        :type open_response: callable
+        :param open_response: function returning a streamed response, given
+          the extra request headers (or ``None``)
+
+        :type max_retries: int
+        :param max_retries: maximum number of times the download is resumed,
+          over the whole stream
+        """
+        super().__init__()
+        self._open_response = open_response
+        self._response = None
+        self.max_retries = max_retries
+        self.retries_left = max_retries
+        self.progress = progress
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def _connect(self):
+        headers = {'Range': 'bytes=%d-' % self.pos} if self.pos else None
+        r = self._open_response(headers)
+        r.raise_for_status()
+        if self.pos and r.status_code != 206:
+            # The server ignored the Range header, skip what was already read
+            to_skip = self.pos
+            while to_skip > 0:
+                data = r.raw.read(min(to_skip, bioblend.CHUNK_SIZE), decode_content=True)
+                if not data:
+                    raise ConnectionError('Response body ended before the resume position', status_code=r.status_code)
+                to_skip -= len(data)
+        self._response = r
+
+    def readinto(self, b):
+        while True:
+            try:
+                if self._response is None:
+                    self._connect()
+                data = self._response.raw.read(len(b), decode_content=True)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, HTTPError) as e:
+                if self.retries_left <= 0:
+                    raise
+                self.retries_left -= 1
+                log.warning("Download interrupted at byte %d (%s), resuming. %d retries left", self.pos, e, self.retries_left)
+                self._response = None
+        n = len(data)
+        b[:n] = data
+        self.pos += n
+        if self.progress is not None and n:
+            self.progress(self.pos)
+        return n
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+        super().close()
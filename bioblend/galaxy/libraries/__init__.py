@@ -2,6 +2,7 @@
 Contains possible interactions with the Galaxy Data Libraries
 """
 import logging
+import os
 import time
 
 from bioblend.galaxy.client import Client
@@ -9,7 +10,9 @@ from bioblend.galaxy.datasets import (
     DatasetTimeoutException,
     TERMINAL_STATES,
 )
+from bioblend.galaxy.query import Query
 from bioblend.util import attach_file
+from bioblend.util.tus import DEFAULT_CHUNK_SIZE
 
 log = logging.getLogger(__name__)
 
@@ -240,7 +243,7 @@ class LibraryClient(Client):
             payload['description'] = description
         return self._post(payload, id=library_id, contents=True)
 
-    def get_folders(self, library_id, folder_id=None, name=None):
+    def get_folders(self, library_id, folder_id=None, name=None, query=None):
         """
         Get all the folders or filter specific one(s) via the provided ``name``
         or ``folder_id`` in data library with id ``library_id``. Provide only
@@ -257,22 +260,24 @@ class LibraryClient(Client):
                      path of the folder starting from the library's root
                      folder, e.g. ``/subfolder/subsubfolder``.
 
+        :type query: :class:`~bioblend.galaxy.query.Query`
+        :param query: additional filters, ordering, pagination and fields.
+          Galaxy cannot filter library contents, so they are applied to the
+          whole list of library contents.
+
         :rtype: list
         :return: list of dicts each containing basic information about a folder
         """
         if folder_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or folder_id, but not both')
-        library_contents = self.show_library(library_id=library_id, contents=True)
+        query = (query or Query()).filter('type', 'folder')
         if folder_id is not None:
-            folder = next((_ for _ in library_contents if _['type'] == 'folder' and _['id'] == folder_id), None)
-            folders = [folder] if folder is not None else []
+            query = query.filter('id', folder_id)
         elif name is not None:
-            folders = [_ for _ in library_contents if _['type'] == 'folder' and _['name'] == name]
-        else:
-            folders = [_ for _ in library_contents if _['type'] == 'folder']
-        return folders
+            query = query.filter('name', name)
+        return query.apply(self.show_library(library_id=library_id, contents=True))
 
-    def get_libraries(self, library_id=None, name=None, deleted=False):
+    def get_libraries(self, library_id=None, name=None, deleted=False, query=None):
         """
         Get all the libraries or filter for specific one(s) via the provided
         name or ID. Provide only one argument: ``name`` or ``library_id``, but
@@ -290,18 +295,22 @@ class LibraryClient(Client):
           libraries. If ``True``, return only deleted libraries. If ``None``,
           return both deleted and non-deleted libraries.
 
+        :type query: :class:`~bioblend.galaxy.query.Query`
+        :param query: additional filters, ordering, pagination and fields.
+          Galaxy cannot filter libraries, so they are applied to the whole list
+          of libraries.
+
         :rtype: list
         :return: list of dicts each containing basic information about a library
         """
         if library_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or library_id, but not both')
-        libraries = self._get(params={"deleted": deleted})
+        query = query or Query()
         if library_id is not None:
-            library = next((_ for _ in libraries if _['id'] == library_id), None)
-            libraries = [library] if library is not None else []
-        if name is not None:
-            libraries = [_ for _ in libraries if _['name'] == name]
-        return libraries
+            query = query.filter('id', library_id)
+        elif name is not None:
+            query = query.filter('name', name)
+        return query.apply(self._get(params={"deleted": deleted}))
 
     def show_library(self, library_id, contents=False):
         """
@@ -355,8 +364,15 @@ class LibraryClient(Client):
             payload['server_dir'] = keywords['server_dir']
         elif keywords.get('file_local_path', None) is not None:
             payload['upload_option'] = 'upload_file'
-            payload['files_0|file_data'] = attach_file(keywords['file_local_path'])
-            files_attached = True
+            if keywords.get('resumable', False):
+                payload['files_0|file_data'] = self.gi._tus_upload(
+                    keywords['file_local_path'],
+                    chunk_size=keywords.get('chunk_size', DEFAULT_CHUNK_SIZE),
+                    parallel=keywords.get('parallel', 1),
+                    storage=keywords.get('resume_storage'))
+            else:
+                payload['files_0|file_data'] = attach_file(keywords['file_local_path'])
+                files_attached = True
         elif keywords.get("filesystem_paths", None) is not None:
             payload["upload_option"] = "upload_paths"
             payload["filesystem_paths"] = keywords["filesystem_paths"]
@@ -365,7 +381,7 @@ class LibraryClient(Client):
             return self._post(payload, id=library_id, contents=True,
                               files_attached=files_attached)
         finally:
-            if payload.get('files_0|file_data', None) is not None:
+            if files_attached:
                 payload['files_0|file_data'].close()
 
     def upload_file_from_url(self, library_id, file_url, folder_id=None,
@@ -436,7 +452,9 @@ class LibraryClient(Client):
 
     def upload_file_from_local_path(self, library_id, file_local_path,
                                     folder_id=None, file_type='auto', dbkey='?',
-                                    tags=None):
+                                    tags=None, resumable=False,
+                                    chunk_size=DEFAULT_CHUNK_SIZE, parallel=1,
+                                    resume_storage=None):
         """
         Read local file contents from file_local_path and upload data to a
         library.
@@ -460,13 +478,63 @@ class LibraryClient(Client):
         :type tags: list
         :param tags: A list of tags to add to the datasets
 
+        :type resumable: bool
+        :param resumable: if ``True``, first stage the file on Galaxy's
+          resumable upload (tus) endpoint in chunks, instead of sending it in a
+          single multipart request
+
+        :type chunk_size: int
+        :param chunk_size: when ``resumable`` is ``True``, the number of bytes
+          sent with each chunk request
+
+        :type parallel: int
+        :param parallel: when ``resumable`` is ``True``, the maximum number of
+          parts of the file to send concurrently, if supported by the server
+
+        :type resume_storage: :class:`~collections.abc.MutableMapping`
+        :param resume_storage: when ``resumable`` is ``True``, a persistent
+          mapping (e.g. a :mod:`shelve` object) where the state of unfinished
+          uploads is recorded, so that an interrupted upload of the same file
+          can be resumed by calling this method again
+
         :rtype: list
-        :return: List with a single dictionary containing information about the LDDA
-        """
-        return self._do_upload(library_id, file_local_path=file_local_path,
-                               folder_id=folder_id, file_type=file_type,
-                               dbkey=dbkey,
-                               tags=tags)
+        :return: List with a single dictionary containing information about the LDDA.
+          If the ``upload_index`` of the Galaxy instance contains a reusable
+          history dataset with the same content, this is copied into the
+          library instead of uploading the file again, and given the name and
+          ``tags`` the upload would have given it
+        """
+        upload_index = self.gi.upload_index
+        if upload_index is not None:
+            digest = upload_index.hash_file(file_local_path)
+            for entry in upload_index.find(self.gi, file_local_path, digest, file_type, dbkey, srcs=('hda',)):
+                return [self._copy_uploaded_dataset(library_id, entry, file_local_path, folder_id, tags)]
+        ret = self._do_upload(library_id, file_local_path=file_local_path,
+                              folder_id=folder_id, file_type=file_type,
+                              dbkey=dbkey,
+                              tags=tags, resumable=resumable,
+                              chunk_size=chunk_size, parallel=parallel,
+                              resume_storage=resume_storage)
+        if upload_index is not None:
+            upload_index.add(self.gi, digest, file_type, dbkey, 'ld', library_id, ret[0]['id'])
+        return ret
+
+    def _copy_uploaded_dataset(self, library_id, entry, file_local_path, folder_id, tags):
+        """
+        Copy a history dataset found in the upload index into a library,
+        instead of uploading the same file again, and update it like the
+        upload would have.
+        """
+        ld = self.copy_from_dataset(library_id, entry.dataset_id, folder_id=folder_id)
+        updates = {}
+        name = os.path.basename(file_local_path)
+        if ld.get('name') != name:
+            updates['name'] = name
+        if tags:
+            updates['tags'] = tags
+        if updates:
+            ld = self.update_library_dataset(ld['id'], **updates)
+        return ld
 
     def upload_file_from_server(self, library_id, server_dir, folder_id=None,
                                 file_type='auto', dbkey='?', link_data_only=None,
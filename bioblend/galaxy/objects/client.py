@@ -33,6 +33,10 @@ class ObjClient(metaclass=abc.ABCMeta):
         associated to the various entities, these are the ones that should be
         used to retrieve their basic info.
 
+        Where Galaxy supports it (e.g. for histories), a ``keys`` argument
+        restricts the fields returned for each entity; the other attributes
+        of such previews are fetched when first accessed.
+
         :rtype: list
         :return: a list of object previews
         """
@@ -44,7 +48,9 @@ class ObjClient(metaclass=abc.ABCMeta):
         Get a list of objects.
 
         This method first gets the entity summaries, then gets the complete
-        description for each entity with an additional GET call, so may be slow.
+        description for each entity with additional GET calls, so may be slow.
+        These calls are made concurrently by up to ``max_workers`` threads
+        (see :class:`~.galaxy_instance.GalaxyInstance`).
 
         :rtype: list
         :return: a list of objects
@@ -68,6 +74,21 @@ class ObjClient(metaclass=abc.ABCMeta):
         self.log.error(msg)
         raise err_type(msg)
 
+    def _map(self, func, items):
+        """
+        Call ``func`` on each of ``items`` making up to
+        ``self.obj_gi.max_workers`` concurrent calls with the executor of the
+        Galaxy instance (in the priority lane of the current thread), and
+        return the results in the same order as ``items``. If any call
+        fails, the exception of the first failed one is raised.
+        """
+        items = list(items)
+        if min(self.obj_gi.max_workers, len(items)) <= 1:
+            return [func(_) for _ in items]
+        result = self.gi.executor.map(func, items, concurrency=self.obj_gi.max_workers)
+        result.raise_errors()
+        return list(result)
+
     def _get_dict(self, meth_name, reply):
         if reply is None:
             self._error('%s: no reply' % meth_name)
@@ -81,18 +102,56 @@ class ObjClient(metaclass=abc.ABCMeta):
 
 class ObjDatasetContainerClient(ObjClient):
 
-    def _get_container(self, id_, ctype):
-        show_fname = 'show_%s' % ctype.__name__.lower()
-        gi_client = getattr(self.gi, ctype.API_MODULE)
-        show_f = getattr(gi_client, show_fname)
-        res = show_f(id_)
-        cdict = self._get_dict(show_fname, res)
+    def _get_container(self, id_, ctype, cdict=None):
+        """
+        Return the ``ctype`` wrapper for the container with id ``id_``. Its
+        content infos are only fetched when first accessed.
+
+        If ``cdict`` (a container dictionary freshly obtained from a listing
+        or a write request) is provided, no request is made. The attributes
+        missing from ``cdict`` are fetched when first accessed, and a wrapper
+        already in the identity map is updated in place with ``cdict``.
+        """
+        def fetch():
+            return ctype(self._fetch_container(id_, ctype, cdict=cdict), gi=self.obj_gi)
+
+        def update(container):
+            container._reinit(self._fetch_container(id_, ctype, cdict=cdict), gi=self.obj_gi)
+
+        return self.obj_gi._get_wrapper(ctype, id_, fetch, update=update if cdict is not None else None)
+
+    def _fetch_container(self, id_, ctype, cdict=None):
+        """
+        Return the dictionary for a new ``ctype`` wrapper.
+        """
+        if cdict is None:
+            show_fname = 'show_%s' % ctype.__name__.lower()
+            gi_client = getattr(self.gi, ctype.API_MODULE)
+            res = getattr(gi_client, show_fname)(id_)
+            cdict = self._get_dict(show_fname, res)
+            marker = wrappers._Owned
+        else:
+            marker = wrappers._Partial
         cdict['id'] = id_  # overwrite unencoded id
-        c_infos = show_f(id_, contents=True)
-        if not isinstance(c_infos, Sequence):
-            self._error(f'{show_fname}: unexpected reply: {c_infos!r}')
-        c_infos = [ctype.CONTENT_INFO_TYPE(_) for _ in c_infos]
-        return ctype(cdict, content_infos=c_infos, gi=self.obj_gi)
+        return marker(cdict)
+
+    @abc.abstractmethod
+    def _fetch_preview(self, id_):
+        """
+        Return the preview of the container with id ``id_``, with a single
+        request.
+        """
+        pass
+
+    @abc.abstractmethod
+    def _fetch_content_infos(self, id_, offset, limit, filters):
+        """
+        Return up to ``limit`` content infos, starting from ``offset``, for
+        the contents of the container with id ``id_`` matching ``filters``
+        (see :meth:`.wrappers.ContentInfoList.filter`), and whether there are
+        no more contents to fetch.
+        """
+        pass
 
 
 class ObjLibraryClient(ObjDatasetContainerClient):
@@ -112,7 +171,7 @@ class ObjLibraryClient(ObjDatasetContainerClient):
         """
         res = self.gi.libraries.create_library(name, description, synopsis)
         lib_info = self._get_dict('create_library', res)
-        return self.get(lib_info['id'])
+        return self._get_container(lib_info['id'], wrappers.Library, cdict=lib_info)
 
     def get(self, id_):
         """
@@ -123,9 +182,23 @@ class ObjLibraryClient(ObjDatasetContainerClient):
         """
         return self._get_container(id_, wrappers.Library)
 
+    def _fetch_content_infos(self, id_, offset, limit, filters):
+        # Galaxy can neither paginate nor filter library contents
+        c_infos = self.gi.libraries.show_library(id_, contents=True)
+        if not isinstance(c_infos, Sequence):
+            self._error(f'show_library: unexpected reply: {c_infos!r}')
+        c_infos = [wrappers.LibraryContentInfo(wrappers._Owned(_), gi=self.obj_gi) for _ in c_infos]
+        c_infos = [_ for _ in c_infos if all(_.wrapped.get(k) == v for k, v in filters.items())]
+        return c_infos[offset:], True
+
+    def _fetch_preview(self, id_):
+        # The library dicts in the listing are the same returned by show_library()
+        res = self.gi.libraries.show_library(id_)
+        return wrappers.LibraryPreview(wrappers._Owned(self._get_dict('show_library', res)), gi=self.obj_gi)
+
     def get_previews(self, name=None, deleted=False):
         dicts = self.gi.libraries.get_libraries(name=name, deleted=deleted)
-        return [wrappers.LibraryPreview(_, gi=self.obj_gi) for _ in dicts]
+        return [wrappers.LibraryPreview(wrappers._Owned(_), gi=self.obj_gi) for _ in dicts]
 
     def list(self, name=None, deleted=False):
         """
@@ -143,9 +216,11 @@ class ObjLibraryClient(ObjDatasetContainerClient):
             # return Library objects only for not-deleted libraries since Galaxy
             # does not filter them out and Galaxy release_14.08 and earlier
             # crashes when trying to get a deleted library
-            return [self.get(_['id']) for _ in dicts if not _['deleted']]
-        else:
-            return [self.get(_['id']) for _ in dicts]
+            dicts = [_ for _ in dicts if not _['deleted']]
+        # The library dicts in the listing are the same returned by
+        # show_library() and the contents are fetched lazily, so no more
+        # requests are needed
+        return [self._get_container(_['id'], wrappers.Library, cdict=_) for _ in dicts]
 
     def delete(self, id_=None, name=None):
         """
@@ -161,6 +236,7 @@ class ObjLibraryClient(ObjDatasetContainerClient):
             res = self.gi.libraries.delete_library(id_)
             if not isinstance(res, Mapping):
                 self._error(f'delete_library: unexpected reply: {res!r}')
+            self.obj_gi._forget_wrapper(wrappers.Library, id_)
 
 
 class ObjHistoryClient(ObjDatasetContainerClient):
@@ -180,7 +256,7 @@ class ObjHistoryClient(ObjDatasetContainerClient):
         """
         res = self.gi.histories.create_history(name=name)
         hist_info = self._get_dict('create_history', res)
-        return self.get(hist_info['id'])
+        return self._get_container(hist_info['id'], wrappers.History, cdict=hist_info)
 
     def get(self, id_):
         """
@@ -191,9 +267,53 @@ class ObjHistoryClient(ObjDatasetContainerClient):
         """
         return self._get_container(id_, wrappers.History)
 
-    def get_previews(self, name=None, deleted=False):
-        dicts = self.gi.histories.get_histories(name=name, deleted=deleted)
-        return [wrappers.HistoryPreview(_, gi=self.obj_gi) for _ in dicts]
+    def _fetch_content_infos(self, id_, offset, limit, filters):
+        kwargs = {}
+        for key in ('deleted', 'visible'):
+            if key in filters:
+                kwargs[key] = filters[key]
+        if 'state' in filters:
+            kwargs['states'] = [filters['state']]
+        if 'type' in filters:
+            try:
+                kwargs['types'] = [{'file': 'dataset', 'collection': 'dataset_collection'}[filters['type']]]
+            except KeyError:
+                return [], True
+        c_infos = self.gi.histories.show_history(id_, contents=True, limit=limit, offset=offset, **kwargs)
+        if not isinstance(c_infos, Sequence):
+            self._error(f'show_history: unexpected reply: {c_infos!r}')
+        return ([wrappers.HistoryContentInfo(wrappers._Owned(_), gi=self.obj_gi) for _ in c_infos],
+                len(c_infos) < limit)
+
+    def _fetch_preview(self, id_):
+        # The detailed history dict includes the fields of the listing
+        res = self.gi.histories.show_history(id_)
+        return wrappers.HistoryPreview(wrappers._Owned(self._get_dict('show_history', res)), gi=self.obj_gi)
+
+    def get_previews(self, name=None, deleted=False, keys=None):
+        """
+        Get the previews of the histories owned by the user of this Galaxy
+        instance.
+
+        :type name: str
+        :param name: return only histories with this name
+        :type deleted: bool
+        :param deleted: if ``True``, return histories that have been deleted
+        :type keys: list
+        :param keys: if set, Galaxy returns only these fields (and the id) of
+          each history. The other attributes of the previews are fetched
+          from Galaxy, with one request per preview, when first accessed.
+
+        :rtype: list of :class:`~.wrappers.HistoryPreview`
+        """
+        if keys is None:
+            dicts = self.gi.histories.get_histories(name=name, deleted=deleted)
+            marker = wrappers._Owned
+        else:
+            keys = ['id'] + [_ for _ in keys if _ != 'id']
+            dicts = self.gi.histories.get_histories(name=name, deleted=deleted, keys=keys)
+            marker = wrappers._Partial
+        return [wrappers.HistoryPreview(marker(_), gi=self.obj_gi) for _ in dicts]
 
     def list(self, name=None, deleted=False):
         """
@@ -206,8 +326,8 @@ class ObjHistoryClient(ObjDatasetContainerClient):
 
         :rtype: list of :class:`~.wrappers.History`
         """
-        dicts = self.gi.histories.get_histories(name=name, deleted=deleted)
-        return [self.get(_['id']) for _ in dicts]
+        dicts = self.gi.histories.get_histories(name=name, deleted=deleted, view='detailed')
+        return [self._get_container(_['id'], wrappers.History, cdict=_) for _ in dicts]
 
     def delete(self, id_=None, name=None, purge=False):
         """
@@ -227,6 +347,7 @@ class ObjHistoryClient(ObjDatasetContainerClient):
             res = self.gi.histories.delete_history(id_, purge=purge)
             if not isinstance(res, Mapping):
                 self._error(f'delete_history: unexpected reply: {res!r}')
+            self.obj_gi._forget_wrapper(wrappers.History, id_)
 
 
 class ObjWorkflowClient(ObjClient):
@@ -283,14 +404,22 @@ class ObjWorkflowClient(ObjClient):
         :rtype: :class:`~.wrappers.Workflow`
         :return: the workflow corresponding to ``id_``
         """
+        return self.obj_gi._get_wrapper(wrappers.Workflow, id_, lambda: self._fetch_workflow(id_))
+
+    def _fetch_workflow(self, id_):
         res = self.gi.workflows.show_workflow(id_)
         wf_dict = self._get_dict('show_workflow', res)
-        return wrappers.Workflow(wf_dict, gi=self.obj_gi)
+        return wrappers.Workflow(wrappers._Owned(wf_dict), gi=self.obj_gi)
+
+    def _fetch_preview(self, id_):
+        # The workflow dict includes the fields of the listing
+        res = self.gi.workflows.show_workflow(id_)
+        return wrappers.WorkflowPreview(wrappers._Owned(self._get_dict('show_workflow', res)), gi=self.obj_gi)
 
     # the 'deleted' option is not available for workflows
     def get_previews(self, name=None, published=False):
         dicts = self.gi.workflows.get_workflows(name=name, published=published)
-        return [wrappers.WorkflowPreview(_, gi=self.obj_gi) for _ in dicts]
+        return [wrappers.WorkflowPreview(wrappers._Owned(_), gi=self.obj_gi) for _ in dicts]
 
     # the 'deleted' option is not available for workflows
     def list(self, name=None, published=False):
@@ -305,7 +434,18 @@ class ObjWorkflowClient(ObjClient):
         :rtype: list of :class:`~.wrappers.Workflow`
         """
         dicts = self.gi.workflows.get_workflows(name=name, published=published)
-        return [self.get(_['id']) for _ in dicts]
+        return self._map(lambda _: self._get_updated(_['id']), dicts)
+
+    def _get_updated(self, id_):
+        """
+        Fetch the workflow with id ``id_`` and return its wrapper, updating
+        in place the one in the identity map (if any).
+        """
+        res = self.gi.workflows.show_workflow(id_)
+        wf_dict = self._get_dict('show_workflow', res)
+        return self.obj_gi._get_wrapper(
+            wrappers.Workflow, id_, lambda: wrappers.Workflow(wrappers._Owned(wf_dict), gi=self.obj_gi),
+            update=lambda wf: wf._reinit(wrappers._Owned(wf_dict), gi=self.obj_gi))
 
     def delete(self, id_=None, name=None):
         """
@@ -321,6 +461,7 @@ class ObjWorkflowClient(ObjClient):
             res = self.gi.workflows.delete_workflow(id_)
             if not isinstance(res, str):
                 self._error('delete_workflow: unexpected reply: %r' % res)
+            self.obj_gi._forget_wrapper(wrappers.Workflow, id_)
 
 
 class ObjToolClient(ObjClient):
@@ -347,7 +488,7 @@ class ObjToolClient(ObjClient):
         res = self.gi.tools.show_tool(id_, io_details=io_details,
                                       link_details=link_details)
         tool_dict = self._get_dict('show_tool', res)
-        return wrappers.Tool(tool_dict, gi=self.obj_gi)
+        return wrappers.Tool(wrappers._Owned(tool_dict), gi=self.obj_gi)
 
     def get_previews(self, name=None, trackster=None):
         """
@@ -363,7 +504,7 @@ class ObjToolClient(ObjClient):
         :rtype: list of :class:`~.wrappers.Tool`
         """
         dicts = self.gi.tools.get_tools(name=name, trackster=trackster)
-        return [wrappers.Tool(_, gi=self.obj_gi) for _ in dicts]
+        return [wrappers.Tool(wrappers._Owned(_), gi=self.obj_gi) for _ in dicts]
 
     # the 'deleted' option is not available for tools
     def list(self, name=None, trackster=None):
@@ -412,11 +553,15 @@ class ObjJobClient(ObjClient):
         """
         res = self.gi.jobs.show_job(id_, full_details)
         job_dict = self._get_dict('job_tool', res)
-        return wrappers.Job(job_dict, gi=self.obj_gi)
+        return wrappers.Job(wrappers._Owned(job_dict), gi=self.obj_gi)
+
+    def _fetch_preview(self, id_):
+        res = self.gi.jobs.show_job(id_)
+        return wrappers.JobPreview(wrappers._Owned(self._get_dict('show_job', res)), gi=self.obj_gi)
 
     def get_previews(self):
         dicts = self.gi.jobs.get_jobs()
-        return [wrappers.JobPreview(_, gi=self.obj_gi) for _ in dicts]
+        return [wrappers.JobPreview(wrappers._Owned(_), gi=self.obj_gi) for _ in dicts]
 
     def list(self):
         """
@@ -425,4 +570,4 @@ class ObjJobClient(ObjClient):
         :rtype: list of :class:`~.wrappers.Job`
         """
         dicts = self.gi.jobs.get_jobs()
-        return [self.get(_['id']) for _ in dicts]
+        return self._map(lambda _: self.get(_['id']), dicts)
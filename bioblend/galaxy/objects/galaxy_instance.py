@@ -2,11 +2,16 @@
 A representation of a Galaxy instance based on oo wrappers.
 """
 
+import itertools
+import threading
 import time
+import weakref
 
 import bioblend
 import bioblend.galaxy
 from bioblend.galaxy.datasets import TERMINAL_STATES
+from bioblend.galaxy.executor import MapResult
+from bioblend.galaxyclient import DEFAULT_POOL_SIZE
 from . import client
 
 
@@ -20,6 +25,179 @@ def _get_error_info(hda):
     return msg
 
 
+class IdentityMap:
+    """
+    Keep at most one live wrapper for each Galaxy entity, identified by the
+    wrapper type and the entity id.
+
+    Wrappers are only weakly referenced: they are evicted as soon as they are
+    no longer used elsewhere.
+    """
+
+    def __init__(self):
+        self._wrappers = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._wrappers)
+
+    def get(self, wrapper_type, id_):
+        """
+        Return the live wrapper of type ``wrapper_type`` for the entity with
+        id ``id_``, or ``None``.
+        """
+        with self._lock:
+            return self._wrappers.get((wrapper_type, id_))
+
+    def add(self, wrapper):
+        """
+        Register ``wrapper`` and return it. If a live wrapper for the same
+        entity is already registered, return that one instead.
+        """
+        key = (type(wrapper), wrapper.id)
+        with self._lock:
+            existing = self._wrappers.get(key)
+            if existing is not None:
+                return existing
+            self._wrappers[key] = wrapper
+            return wrapper
+
+    def discard(self, wrapper_type, id_):
+        """
+        Forget the wrapper of type ``wrapper_type`` for the entity with id
+        ``id_``, if any.
+        """
+        with self._lock:
+            self._wrappers.pop((wrapper_type, id_), None)
+
+    def clear(self):
+        """
+        Forget all wrappers.
+        """
+        with self._lock:
+            self._wrappers.clear()
+
+
+class ToolIdIndex:
+    """
+    Set of the ids of the tools available on a Galaxy instance, fetched when
+    first needed and then cached for ``ttl`` seconds.
+
+    The cache is also invalidated when a Tool Shed repository is installed or
+    uninstalled through the :class:`~bioblend.galaxy.toolshed.ToolShedClient`
+    of the same GalaxyInstance.
+    """
+
+    def __init__(self, gi, ttl=300):
+        """
+        :type gi: :class:`~bioblend.galaxy.GalaxyInstance`
+        :param gi: the GalaxyInstance to get the tools from
+
+        :type ttl: float
+        :param ttl: number of seconds after which the tool ids are fetched
+          again
+        """
+        self.gi = gi
+        self.ttl = ttl
+        self._ids = None
+        self._expires = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, tool_id):
+        return tool_id in self.get_ids()
+
+    def get_ids(self):
+        """
+        Return the ids of the available tools.
+
+        :rtype: frozenset
+        """
+        with self._lock:
+            generation = self.gi._toolbox_generation
+            if self._ids is None or time.monotonic() >= self._expires or self._generation != generation:
+                self._ids = frozenset(_['id'] for _ in self.gi.tools.get_tools())
+                self._expires = time.monotonic() + self.ttl
+                self._generation = generation
+            return self._ids
+
+    def invalidate(self):
+        """
+        Discard the cached tool ids.
+        """
+        with self._lock:
+            self._ids = None
+
+
+class UnitOfWork:
+    """
+    Set of modified wrappers whose attribute changes are saved to Galaxy
+    together by :meth:`flush` (called when leaving a ``with`` block without
+    errors).
+
+    While the unit of work is in use as a context manager, the wrappers of
+    its GalaxyInstance modified in the same thread are added automatically.
+    Each wrapper is updated with a single request (none if its attributes
+    have not actually changed), concurrently with the others, with the
+    executor of the underlying :class:`bioblend.galaxy.GalaxyInstance`.
+    Containers which need to be refreshed as a consequence (e.g. the history
+    of an updated dataset) are refreshed only once.
+    """
+
+    def __init__(self, gi):
+        """
+        :type gi: :class:`GalaxyInstance`
+        :param gi: the GalaxyInstance of the wrappers
+        """
+        self.gi = gi
+        self._wrappers = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._wrappers)
+
+    def __enter__(self):
+        self.gi._get_units_of_work().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.gi._get_units_of_work().remove(self)
+        if exc_type is None:
+            self.flush().raise_errors()
+
+    def add(self, *wrappers):
+        """
+        Add wrappers to save when flushing.
+        """
+        with self._lock:
+            for wrapper in wrappers:
+                self._wrappers[id(wrapper)] = wrapper
+
+    def flush(self):
+        """
+        Save the changes of all the wrappers, then forget them. A failed
+        save does not stop the others: the wrappers which could not be saved
+        keep their changes and are added to this unit of work again.
+
+        :rtype: :class:`~bioblend.galaxy.executor.MapResult`
+        :return: the wrappers with changes, in the order they were added
+          (``None`` for the ones which could not be saved), and the
+          exceptions of the failed saves in its ``errors`` dict
+        """
+        with self._lock:
+            wrappers, self._wrappers = list(self._wrappers.values()), {}
+        wrappers = [_ for _ in wrappers if _.changes]
+        result = self.gi.gi.executor.map(lambda w: w._flush(), wrappers, concurrency=self.gi.max_workers)
+        refreshed = set()
+        for wrapper in itertools.chain.from_iterable(_ for _ in result if _ is not None):
+            if id(wrapper) not in refreshed:
+                refreshed.add(id(wrapper))
+                wrapper.refresh()
+        self.add(*(wrappers[_] for _ in result.errors))
+        return MapResult([None if i in result.errors else _ for i, _ in enumerate(wrappers)],
+                         result.errors, result.cancelled, result.elapsed)
+
+
 class GalaxyInstance:
     """
     A representation of an instance of Galaxy, identified by a URL and
@@ -33,6 +211,28 @@ class GalaxyInstance:
     :param api_key: user's API key for the given instance of Galaxy, obtained
       from the Galaxy web UI.
 
+    :type identity_map: bool
+    :param identity_map: if ``True``, getting a history, library, workflow,
+      dataset, dataset collection or library folder returns the same wrapper
+      object as long as it is in use, without contacting Galaxy again. Call
+      the ``refresh()`` method of a wrapper to update it in place with the
+      current state of the entity on the server. Wrappers returned by
+      methods which fetch the entities anyway (e.g. ``list()`` or
+      ``History.get_datasets()``) are updated in place with the fetched
+      data, keeping their unflushed changes. The map is available as the
+      ``identity_map`` attribute (``None`` if disabled).
+
+    :type max_workers: int
+    :param max_workers: maximum number of concurrent requests made by the
+      ``list()`` methods of the clients to get the details of each object.
+      Available as the ``max_workers`` attribute. The underlying
+      :class:`bioblend.galaxy.GalaxyInstance` keeps at least as many
+      connections open.
+
+    The ids of the available tools, needed to check whether workflows are
+    runnable, are cached for 5 minutes in the ``tool_id_index`` attribute
+    (a :class:`ToolIdIndex` object) and shared by all workflow objects.
+
     This is actually a factory class which instantiates the entity-specific
     clients.
 
@@ -42,15 +242,77 @@ class GalaxyInstance:
       gi = GalaxyInstance('http://127.0.0.1:8080', 'foo')
       histories = gi.histories.list()
     """
-    def __init__(self, url, api_key=None, email=None, password=None, verify=True):
-        self.gi = bioblend.galaxy.GalaxyInstance(url, api_key, email, password, verify)
+    def __init__(self, url, api_key=None, email=None, password=None, verify=True,
+                 identity_map=False, max_workers=8):
+        # Keep a connection open for each worker thread
+        self.gi = bioblend.galaxy.GalaxyInstance(url, api_key, email, password, verify,
+                                                 pool_size=max(max_workers, DEFAULT_POOL_SIZE))
         self.log = bioblend.log
+        self.identity_map = IdentityMap() if identity_map else None
+        self.max_workers = max_workers
+        self.tool_id_index = ToolIdIndex(self.gi)
+        self._units_of_work = threading.local()
         self.histories = client.ObjHistoryClient(self)
         self.libraries = client.ObjLibraryClient(self)
         self.workflows = client.ObjWorkflowClient(self)
         self.tools = client.ObjToolClient(self)
         self.jobs = client.ObjJobClient(self)
 
+    def _get_wrapper(self, wrapper_type, id_, fetch, update=None):
+        """
+        Return the wrapper of type ``wrapper_type`` for the entity with id
+        ``id_``, calling ``fetch()`` to build it if it is not in the identity
+        map (or if the identity map is disabled).
+
+        If the wrapper is in the identity map and the caller has just
+        obtained the entity dictionary from Galaxy, ``update(wrapper)`` is
+        called to update the wrapper in place with it.
+        """
+        if self.identity_map is None:
+            return fetch()
+        wrapper = self.identity_map.get(wrapper_type, id_)
+        if wrapper is None:
+            wrapper = self.identity_map.add(fetch())
+        elif update is not None:
+            update(wrapper)
+        return wrapper
+
+    def unit_of_work(self):
+        """
+        Return a new :class:`UnitOfWork` to save the changes made to many
+        wrappers together, e.g.::
+
+          with gi.unit_of_work():
+              for ds in history.get_datasets():
+                  ds.name = ds.name.upper()
+
+        :rtype: :class:`UnitOfWork`
+        """
+        return UnitOfWork(self)
+
+    def _get_units_of_work(self):
+        """
+        Return the stack of the units of work in use in the current thread.
+        """
+        try:
+            return self._units_of_work.stack
+        except AttributeError:
+            stack = self._units_of_work.stack = []
+            return stack
+
+    def _track_changes(self, wrapper):
+        """
+        Add a modified wrapper to the innermost unit of work in use in the
+        current thread, if any.
+        """
+        stack = self._get_units_of_work()
+        if stack:
+            stack[-1].add(wrapper)
+
+    def _forget_wrapper(self, wrapper_type, id_):
+        if self.identity_map is not None:
+            self.identity_map.discard(wrapper_type, id_)
+
     def _wait_datasets(self, datasets, polling_interval, break_on_error=True):
         """
         Wait for datasets to come out of the pending states.
@@ -5,7 +5,10 @@ A basic object-oriented interface for Galaxy entities.
 """
 
 import abc
+import datetime
 import json
+import shutil
+import threading
 from collections.abc import (
     Iterable,
     Mapping,
@@ -13,6 +16,9 @@ from collections.abc import (
 )
 
 import bioblend
+from bioblend.galaxy.cache import dataset_version
+from bioblend.galaxy.table import ContentTable
+from bioblend.util import parse_timestamp
 
 
 __all__ = (
@@ -22,9 +28,11 @@ __all__ = (
     'ContentInfo',
     'LibraryContentInfo',
     'HistoryContentInfo',
+    'ContentInfoList',
     'DatasetContainer',
     'History',
     'Library',
+    'LibraryUploadBatch',
     'Folder',
     'Dataset',
     'HistoryDatasetAssociation',
@@ -41,7 +49,71 @@ __all__ = (
 )
 
 
-class Wrapper(metaclass=abc.ABCMeta):
+_JSON_SCALAR_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def _copy_json(obj):
+    """
+    Return a copy of a deserialized JSON object, sharing only its immutable
+    leaves with the original.
+    """
+    # Check the exact type first, as ABC instance checks are slow
+    obj_type = type(obj)
+    if obj_type in _JSON_SCALAR_TYPES:
+        return obj
+    if obj_type is dict or isinstance(obj, Mapping):
+        return {k: _copy_json(v) for k, v in obj.items()}
+    if obj_type is list or isinstance(obj, tuple):
+        return [_copy_json(_) for _ in obj]
+    return obj
+
+
+class _Owned:
+    """
+    Hand a freshly deserialized dictionary over to a new wrapper, which then
+    uses it as its ``wrapped`` attribute without copying it.  The dictionary
+    must not be used elsewhere afterwards.
+    """
+    __slots__ = ('wrapped',)
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+
+class _Partial(_Owned):
+    """
+    Like :class:`_Owned`, for a dictionary which may lack some of the
+    ``BASE_ATTRS`` of the new wrapper, e.g. one returned by a write request.
+    The missing attributes are fetched by refreshing the wrapper when one of
+    them is first accessed.
+    """
+    __slots__ = ()
+
+
+class _WrapperMeta(abc.ABCMeta):
+    """
+    Metaclass storing the ``BASE_ATTRS`` of wrappers in slots, so that
+    wrapper instances do not need a ``__dict__``.
+
+    Attributes set by a wrapper class besides its ``BASE_ATTRS`` must be
+    listed in its ``__slots__``.
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        slots = namespace.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        inherited = set()
+        for base in bases:
+            for klass in base.__mro__:
+                inherited.update(klass.__dict__.get('__slots__', ()))
+        new_slots = tuple(slots) + tuple(
+            _ for _ in namespace.get('BASE_ATTRS', ()) if _ not in inherited and _ not in slots)
+        namespace['__slots__'] = new_slots
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
+class Wrapper(metaclass=_WrapperMeta):
     """
     Abstract base class for Galaxy entity wrappers.
 
@@ -55,12 +127,15 @@ class Wrapper(metaclass=abc.ABCMeta):
     attribute.
     """
     BASE_ATTRS = ('id', 'name')
+    __slots__ = ('wrapped', '_cached_parent', 'is_modified', 'gi', '_original', '__weakref__')
 
     @abc.abstractmethod
     def __init__(self, wrapped, parent=None, gi=None):
         """
         :type wrapped: dict
-        :param wrapped: JSON-serializable dictionary
+        :param wrapped: JSON-serializable dictionary. It is copied, so that
+          later changes to the wrapper and to the original dictionary do not
+          affect each other
 
         :type parent: :class:`Wrapper`
         :param parent: the parent of this wrapper
@@ -68,19 +143,25 @@ class Wrapper(metaclass=abc.ABCMeta):
         :type gi: :class:`GalaxyInstance`
         :param gi: the GalaxyInstance through which we can access this wrapper
         """
-        if not isinstance(wrapped, Mapping):
+        partial = isinstance(wrapped, _Partial)
+        if isinstance(wrapped, _Owned):
+            wrapped = wrapped.wrapped
+        elif isinstance(wrapped, Mapping):
+            # JSON-serializability is checked only when dumping, see to_json()
+            wrapped = _copy_json(wrapped)
+        else:
             raise TypeError('wrapped object must be a mapping type')
-        # loads(dumps(x)) is a bit faster than deepcopy and allows type checks
-        try:
-            dumped = json.dumps(wrapped)
-        except (TypeError, ValueError):
-            raise ValueError('wrapped object must be JSON-serializable')
-        object.__setattr__(self, 'wrapped', json.loads(dumped))
+        object.__setattr__(self, 'wrapped', wrapped)
         for k in self.BASE_ATTRS:
-            object.__setattr__(self, k, self.wrapped.get(k))
+            # Missing attributes of a partial dictionary are left unset, so
+            # that __getattr__() fetches them
+            if not partial or k in wrapped or k == 'id':
+                object.__setattr__(self, k, wrapped.get(k))
         object.__setattr__(self, '_cached_parent', parent)
         object.__setattr__(self, 'is_modified', False)
         object.__setattr__(self, 'gi', gi)
+        # Original values of the attributes changed since the last flush()
+        object.__setattr__(self, '_original', {})
 
     @abc.abstractproperty
     def gi_module(self):
@@ -115,6 +196,25 @@ class Wrapper(metaclass=abc.ABCMeta):
         """
         return self.__class__(self.wrapped)
 
+    def _reinit(self, wrapped, *args, **kwargs):
+        """
+        Initialize this wrapper again in place with a freshly obtained
+        dictionary (and the other ``__init__()`` arguments), keeping its
+        unflushed changes.
+        """
+        changes = self.changes
+        original = self._original
+        self.__init__(wrapped, *args, **kwargs)
+        for k, v in changes.items():
+            if k in self.wrapped:
+                setattr(self, k, v)
+            else:
+                # Missing from a partial dictionary
+                self.wrapped[k] = v
+                self._original[k] = original[k]
+                if k in self.BASE_ATTRS:
+                    object.__setattr__(self, k, v)
+
     def touch(self):
         """
         Mark this wrapper as having been modified since its creation.
@@ -123,27 +223,87 @@ class Wrapper(metaclass=abc.ABCMeta):
         if self.parent:
             self.parent.touch()
 
+    @property
+    def changes(self):
+        """
+        Mapping from the names of the attributes changed (by assigning them)
+        since this wrapper was created or last flushed, to their new values.
+        Attributes set back to their original value are not included.
+        """
+        return {k: self.wrapped[k] for k in self._original}
+
+    def flush(self):
+        """
+        Save the attribute changes (see :attr:`changes`) to Galaxy with a
+        single update request, or do nothing if there are none.
+
+        Returns: self
+        """
+        for wrapper in self._flush():
+            wrapper.refresh()
+        return self
+
+    def _flush(self):
+        """
+        Save the attribute changes to Galaxy, and return the wrappers which
+        need to be refreshed as a consequence.
+        """
+        changes = self.changes
+        if not changes:
+            return []
+        stale = self._save_changes(changes)
+        object.__setattr__(self, '_original', {})
+        return stale
+
+    def _save_changes(self, changes):
+        """
+        Send the ``changes`` dict to Galaxy, and return the wrappers which
+        need to be refreshed as a consequence.
+        """
+        raise NotImplementedError(f'{self.__class__.__name__} objects cannot be updated')
+
     def to_json(self):
         """
         Return a JSON dump of this wrapper.
         """
-        return json.dumps(self.wrapped)
+        try:
+            return json.dumps(self.wrapped)
+        except (TypeError, ValueError):
+            raise ValueError('wrapped object must be JSON-serializable')
 
     @classmethod
     def from_json(cls, jdef):
         """
         Build a new wrapper from a JSON dump.
         """
-        return cls(json.loads(jdef))
+        return cls(_Owned(json.loads(jdef)))
+
+    def __getattr__(self, name):
+        # Only called if the attribute was not found, i.e. for unset slots
+        if name not in type(self).BASE_ATTRS or name == 'id':
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        if self.gi is not None and self.is_mapped and hasattr(self, 'refresh'):
+            self.refresh()
+        else:
+            object.__setattr__(self, name, self.wrapped.get(name))
+        return object.__getattribute__(self, name)
 
     # FIXME: things like self.x[0] = 'y' do NOT call self.__setattr__
     def __setattr__(self, name, value):
         if name not in self.wrapped:
             raise AttributeError("can't set attribute")
         else:
+            original = self._original
+            if name not in original:
+                original[name] = self.wrapped[name]
+            if original[name] == value:
+                del original[name]
             self.wrapped[name] = value
-            object.__setattr__(self, name, value)
+            if name in self.BASE_ATTRS:
+                object.__setattr__(self, name, value)
             self.touch()
+            if original and self.gi is not None:
+                self.gi._track_changes(self)
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self.wrapped!r})"
@@ -165,7 +325,7 @@ class Step(Wrapper):
     def __init__(self, step_dict, parent):
         super().__init__(step_dict, parent=parent, gi=parent.gi)
         try:
-            stype = step_dict['type']
+            stype = self.wrapped['type']
         except KeyError:
             raise ValueError('not a step dict')
         if stype not in {'data_collection_input', 'data_input', 'parameter_input', 'pause', 'subworkflow', 'tool'}:
@@ -187,25 +347,20 @@ class Workflow(Wrapper):
         'deleted', 'inputs', 'published', 'steps', 'tags'
     )
     POLLING_INTERVAL = 10  # for output state monitoring
+    __slots__ = ('input_labels_to_ids', 'tool_labels_to_ids', 'dag', 'inv_dag',
+                 'source_ids', 'sink_ids')
 
     def __init__(self, wf_dict, gi=None):
         super().__init__(wf_dict, gi=gi)
-        missing_ids = []
-        if gi:
-            tools_list_by_id = [t.id for t in gi.tools.get_previews()]
-        else:
-            tools_list_by_id = []
         tool_labels_to_ids = {}
         for k, v in self.steps.items():
             # convert step ids to str for consistency with outer keys
             v['id'] = str(v['id'])
             for i in v['input_steps'].values():
                 i['source_step'] = str(i['source_step'])
-            step = Step(v, self)
+            step = Step(_Owned(v), self)
             self.steps[k] = step
             if step.type == 'tool':
-                if not step.tool_inputs or step.tool_id not in tools_list_by_id:
-                    missing_ids.append(k)
                 tool_labels_to_ids.setdefault(step.tool_id, set()).add(step.id)
         input_labels_to_ids = {}
         for id_, d in self.inputs.items():
@@ -221,7 +376,6 @@ class Workflow(Wrapper):
             "inputs is {!r}, while data_collection_input_ids is {!r}, data_input_ids is {!r} and parameter_input_ids is {!r}".format(
                 self.inputs, self.data_collection_input_ids, self.data_input_ids, self.parameter_input_ids)
         object.__setattr__(self, 'sink_ids', tails - heads)
-        object.__setattr__(self, 'missing_ids', missing_ids)
 
     @property
     def gi_module(self):
@@ -304,6 +458,19 @@ class Workflow(Wrapper):
         """
         return set(self.input_labels_to_ids)
 
+    @property
+    def missing_ids(self):
+        """
+        Return the ids of the tool steps whose tool is not available on
+        Galaxy or which lack the tool inputs.
+
+        Tool availability is looked up in the ``tool_id_index`` of the
+        GalaxyInstance, so that it is not fetched again for each workflow.
+        """
+        tool_ids = self.gi.tool_id_index.get_ids() if self.gi is not None else frozenset()
+        return [k for k, step in self.steps.items()
+                if step.type == 'tool' and (not step.tool_inputs or step.tool_id not in tool_ids)]
+
     @property
     def is_runnable(self):
         """
@@ -449,15 +616,17 @@ class Workflow(Wrapper):
         res = self.gi.gi.workflows.run_workflow(self.id, **kwargs)
         # res structure: {'history': HIST_ID, 'outputs': [CI_ID, CI_ID, ...]}
         out_hist = self.gi.histories.get(res['history'])
-        content_infos_dict = dict()
-        for ci in out_hist.content_infos:
-            content_infos_dict[ci.id] = ci
+        c_dicts = self.gi.gi.histories.show_history(out_hist.id, contents=True, ids=res['outputs'])
+        c_dicts = {_['id']: _ for _ in c_dicts}
         outputs = []
         for output_id in res['outputs']:
-            if content_infos_dict[output_id].type == 'file':
+            c_dict = c_dicts.get(output_id)
+            if c_dict is None:
                 outputs.append(out_hist.get_dataset(output_id))
-            elif content_infos_dict[output_id].type == 'collection':
-                outputs.append(out_hist.get_dataset_collection(output_id))
+            elif c_dict.get('history_content_type') == 'dataset_collection':
+                outputs.append(out_hist._wrap_dataset_collection(c_dict, complete=False))
+            else:
+                outputs.append(out_hist._wrap_dataset(c_dict, complete=False))
 
         if wait:
             self.gi._wait_datasets(outputs, polling_interval=polling_interval,
@@ -493,6 +662,7 @@ class Dataset(Wrapper, metaclass=abc.ABCMeta):
         'data_type', 'file_ext', 'file_name', 'file_size', 'genome_build', 'misc_info', 'state'
     )
     POLLING_INTERVAL = 1  # for state monitoring
+    __slots__ = ('container',)
 
     @abc.abstractmethod
     def __init__(self, ds_dict, container, gi=None):
@@ -553,6 +723,11 @@ class Dataset(Wrapper, metaclass=abc.ABCMeta):
 
         See :meth:`.get_stream` for info on other params.
         """
+        cached_path = self._get_cached_path(chunk_size=chunk_size)
+        if cached_path is not None:
+            with open(cached_path, 'rb') as f:
+                shutil.copyfileobj(f, file_object, chunk_size)
+            return
         for chunk in self.get_stream(chunk_size=chunk_size):
             file_object.write(chunk)
 
@@ -562,8 +737,46 @@ class Dataset(Wrapper, metaclass=abc.ABCMeta):
 
         See :meth:`.get_stream` for param info.
         """
+        cached_path = self._get_cached_path(chunk_size=chunk_size)
+        if cached_path is not None:
+            with open(cached_path, 'rb') as f:
+                return f.read()
         return b''.join(self.get_stream(chunk_size=chunk_size))
 
+    def _get_cached_path(self, chunk_size=bioblend.CHUNK_SIZE):
+        """
+        Return the path of the contents of this dataset in the content cache
+        of the Galaxy instance, downloading them if needed, or ``None`` if
+        the contents cannot be cached.
+        """
+        content_cache = self.gi.gi.content_cache
+        version = dataset_version(self.wrapped)
+        if content_cache is None or version is None:
+            return None
+        cached_path, _ = content_cache.get_or_fetch(
+            self.gi.gi.base_url, f'{self.SRC}:{self.id}', version,
+            lambda: (self.get_stream(chunk_size=chunk_size), {}))
+        return cached_path
+
+    def get_cached_path(self):
+        """
+        Return the path of a local copy of the contents of this dataset in
+        the content cache of the Galaxy instance, downloading them if
+        needed. The dataset must be in the 'ok' state.
+
+        See :meth:`~bioblend.galaxy.datasets.DatasetClient.get_cached_path`
+        for more info.
+
+        :rtype: str
+        :return: path of the cached dataset contents
+        """
+        if self.gi.gi.content_cache is None:
+            raise ValueError('The content_cache attribute of the Galaxy instance is not set')
+        cached_path = self._get_cached_path()
+        if cached_path is None:
+            raise RuntimeError(f'Dataset {self.id} is in state {self.state}, its contents cannot be cached')
+        return cached_path
+
     def refresh(self):
         """
         Re-fetch the attributes pertaining to this object.
@@ -572,7 +785,7 @@ class Dataset(Wrapper, metaclass=abc.ABCMeta):
         """
         gi_client = getattr(self.gi.gi, self.container.API_MODULE)
         ds_dict = gi_client.show_dataset(self.container.id, self.id)
-        self.__init__(ds_dict, self.container, self.gi)
+        self.__init__(_Owned(ds_dict), self.container, self.gi)
         return self
 
     def wait(self, polling_interval=POLLING_INTERVAL, break_on_error=True):
@@ -638,9 +851,14 @@ class HistoryDatasetAssociation(Dataset):
         res = self.gi.gi.histories.update_dataset(self.container.id, self.id, **kwds)
         # Refresh also the history because the dataset may have been (un)deleted
         self.container.refresh()
-        self.__init__(res, self.container, gi=self.gi)
+        self.__init__(_Owned(res), self.container, gi=self.gi)
         return self
 
+    def _save_changes(self, changes):
+        res = self.gi.gi.histories.update_dataset(self.container.id, self.id, **changes)
+        self.__init__(_Owned(res), self.container, gi=self.gi)
+        return [self.container]
+
     def delete(self, purge=False):
         """
         Delete this history dataset.
@@ -665,6 +883,7 @@ class DatasetCollection(Wrapper, metaclass=abc.ABCMeta):
     BASE_ATTRS = Wrapper.BASE_ATTRS + (
         'state', 'deleted', 'collection_type'
     )
+    __slots__ = ('container',)
 
     @abc.abstractmethod
     def __init__(self, dsc_dict, container, gi=None):
@@ -679,7 +898,7 @@ class DatasetCollection(Wrapper, metaclass=abc.ABCMeta):
         """
         gi_client = getattr(self.gi.gi, self.container.API_MODULE)
         dsc_dict = gi_client.show_dataset_collection(self.container.id, self.id)
-        self.__init__(dsc_dict, self.container, self.gi)
+        self.__init__(_Owned(dsc_dict), self.container, self.gi)
         return self
 
 
@@ -763,9 +982,14 @@ class LibraryDataset(LibRelatedDataset):
         """
         res = self.gi.gi.libraries.update_library_dataset(self.id, **kwds)
         self.container.refresh()
-        self.__init__(res, self.container, gi=self.gi)
+        self.__init__(_Owned(res), self.container, gi=self.gi)
         return self
 
+    def _save_changes(self, changes):
+        res = self.gi.gi.libraries.update_library_dataset(self.id, **changes)
+        self.__init__(_Owned(res), self.container, gi=self.gi)
+        return [self.container]
+
 
 class ContentInfo(Wrapper, metaclass=abc.ABCMeta):
     """
@@ -807,31 +1031,231 @@ class HistoryContentInfo(ContentInfo):
         return self.gi.histories
 
 
+class ContentInfoList(Sequence):
+    """
+    Read-only sequence of the :class:`ContentInfo` objects for the contents
+    of a dataset container, fetched from Galaxy only when needed.
+
+    For histories, contents are fetched ``page_size`` at a time, so that
+    e.g. ``content_infos[:10]`` or iterating until some item is found does
+    not load the whole history.
+    """
+    PAGE_SIZE = 500
+
+    def __init__(self, client, container_id, filters=None, page_size=None):
+        """
+        :type client: :class:`~.client.ObjDatasetContainerClient`
+        :param client: the client for the container type
+
+        :type container_id: str
+        :param container_id: the container id
+
+        :type filters: dict
+        :param filters: see :meth:`filter`
+
+        :type page_size: int
+        :param page_size: number of content infos to fetch at a time
+        """
+        self.client = client
+        self.container_id = container_id
+        self.filters = filters or {}
+        self.page_size = page_size or self.PAGE_SIZE
+        self._items = []
+        self._complete = False
+        # Hash indexes of the content infos by attribute, then value
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _load(self, n=None):
+        """
+        Fetch pages until more than ``n`` items (all of them if ``n`` is
+        ``None``) are loaded.
+        """
+        with self._lock:
+            while not self._complete and (n is None or len(self._items) <= n):
+                c_infos, self._complete = self.client._fetch_content_infos(
+                    self.container_id, len(self._items), self.page_size, self.filters)
+                self._items.extend(c_infos)
+
+    def __len__(self):
+        self._load()
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop = index.start, index.stop
+            if (start is None or start >= 0) and stop is not None and stop >= 0 and (index.step or 1) > 0:
+                self._load(stop - 1)
+            else:
+                self._load()
+        elif index >= 0:
+            self._load(index)
+        else:
+            self._load()
+        return self._items[index]
+
+    def __iter__(self):
+        i = 0
+        while True:
+            self._load(i)
+            if i >= len(self._items):
+                return
+            yield self._items[i]
+            i += 1
+
+    def _extend(self, c_infos):
+        """
+        Add the content infos of contents just created in the container.
+
+        Nothing is done if the contents have not been completely fetched
+        yet, since the new contents will then be fetched with the others.
+        """
+        with self._lock:
+            if self._complete:
+                c_infos = [_ for _ in c_infos if all(_.wrapped.get(k) == v for k, v in self.filters.items())]
+                self._items.extend(c_infos)
+                for key, index in self._indexes.items():
+                    for c_info in c_infos:
+                        index.setdefault(c_info.wrapped.get(key), []).append(c_info)
+
+    def _merge(self, c_infos):
+        """
+        Merge the content infos of contents just updated in the container:
+        replace the ones with the same id and type, and add the new ones.
+
+        Nothing is done if the contents have not been completely fetched
+        yet.
+        """
+        with self._lock:
+            if not self._complete:
+                return
+            positions = {(c_info.id, c_info.type): i for i, c_info in enumerate(self._items)}
+            removed = set()
+            for c_info in c_infos:
+                matches = all(c_info.wrapped.get(k) == v for k, v in self.filters.items())
+                i = positions.get((c_info.id, c_info.type))
+                if i is None:
+                    if matches:
+                        positions[c_info.id, c_info.type] = len(self._items)
+                        self._items.append(c_info)
+                elif matches:
+                    self._items[i] = c_info
+                else:
+                    removed.add(i)
+            if removed:
+                self._items = [_ for i, _ in enumerate(self._items) if i not in removed]
+            self._indexes = {}
+
+    def lookup(self, key, value):
+        """
+        Return the content infos whose ``key`` attribute (e.g. ``id``,
+        ``name``, ``type`` or ``state``) is equal to ``value``.
+
+        All the contents are fetched, and a hash index for ``key`` is built
+        the first time it is used, so that later lookups take constant time.
+
+        :rtype: list of :class:`ContentInfo`
+        """
+        self._load()
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = {}
+                for c_info in self._items:
+                    index.setdefault(c_info.wrapped.get(key), []).append(c_info)
+            return list(index.get(value, ()))
+
+    def to_table(self):
+        """
+        Return all the content infos as a compact
+        :class:`~bioblend.galaxy.table.ContentTable`, with a column for each
+        attribute.
+
+        :rtype: :class:`~bioblend.galaxy.table.ContentTable`
+        """
+        return ContentTable.from_dicts(_.wrapped for _ in self)
+
+    def filter(self, type=None, state=None, visible=None, deleted=None):
+        """
+        Return a new sequence with only the contents matching all the given
+        conditions. For histories, the filtering is done by Galaxy.
+
+        :type type: str
+        :param type: content type: ``file`` or ``collection`` for histories,
+          ``file`` or ``folder`` for libraries
+
+        :type state: str
+        :param state: content state, e.g. ``ok`` (histories only)
+
+        :type visible: bool
+        :param visible: whether the contents are visible (histories only)
+
+        :type deleted: bool
+        :param deleted: whether the contents are deleted (histories only)
+
+        :rtype: :class:`ContentInfoList`
+        """
+        filters = dict(self.filters)
+        for k, v in (('type', type), ('state', state), ('visible', visible), ('deleted', deleted)):
+            if v is not None:
+                filters[k] = v
+        return self.__class__(self.client, self.container_id, filters=filters, page_size=self.page_size)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(container_id={self.container_id!r}, filters={self.filters!r})'
+
+
 class DatasetContainer(Wrapper, metaclass=abc.ABCMeta):
     """
     Abstract base class for dataset containers (histories and libraries).
     """
     BASE_ATTRS = Wrapper.BASE_ATTRS + ('deleted',)
+    __slots__ = ('content_infos',)
 
     @abc.abstractmethod
     def __init__(self, c_dict, content_infos=None, gi=None):
         """
         :type content_infos: list of :class:`ContentInfo`
-        :param content_infos: info objects for the container's contents
+        :param content_infos: info objects for the container's contents. If
+          ``None`` and ``gi`` is provided, a :class:`ContentInfoList` which
+          fetches them from Galaxy when needed is used
         """
         super().__init__(c_dict, gi=gi)
         if content_infos is None:
-            content_infos = []
+            if gi is not None and self.id is not None:
+                content_infos = ContentInfoList(self.gi_module, self.id)
+            else:
+                content_infos = []
         object.__setattr__(self, 'content_infos', content_infos)
 
+    def _reset_content_infos(self):
+        """
+        Fetch the content infos again from Galaxy when next needed.
+        """
+        object.__setattr__(self, 'content_infos', ContentInfoList(self.gi_module, self.id))
+
+    def _lookup_content_infos(self, key, value):
+        """
+        Return the content infos whose ``key`` attribute is ``value``.
+        """
+        if isinstance(self.content_infos, ContentInfoList):
+            return self.content_infos.lookup(key, value)
+        return [_ for _ in self.content_infos if _.wrapped.get(key) == value]
+
     @property
     def dataset_ids(self):
         """
         Return the ids of the contained datasets.
         """
-        return [_.id for _ in self.content_infos if _.type == 'file']
+        return [_.id for _ in self._lookup_content_infos('type', 'file')]
 
     def preview(self):
+        try:
+            return self.gi_module._fetch_preview(self.id)
+        except bioblend.ConnectionError:
+            # e.g. a deleted library, which cannot be shown by some Galaxy
+            # releases: look for it in the listings
+            pass
         getf = self.gi_module.get_previews
         # self.state could be stale: check both regular and deleted containers
         try:
@@ -849,9 +1273,8 @@ class DatasetContainer(Wrapper, metaclass=abc.ABCMeta):
 
         Returns: self
         """
-        fresh = self.gi_module.get(self.id)
-        self.__init__(
-            fresh.wrapped, content_infos=fresh.content_infos, gi=self.gi)
+        c_dict = self.gi_module._fetch_container(self.id, self.__class__)
+        self.__init__(c_dict, gi=self.gi)
         return self
 
     def get_dataset(self, ds_id):
@@ -865,9 +1288,24 @@ class DatasetContainer(Wrapper, metaclass=abc.ABCMeta):
           :class:`~.LibraryDataset`
         :return: the dataset corresponding to ``ds_id``
         """
-        gi_client = getattr(self.gi.gi, self.API_MODULE)
-        ds_dict = gi_client.show_dataset(self.id, ds_id)
-        return self.DS_TYPE(ds_dict, self, gi=self.gi)
+        def fetch():
+            gi_client = getattr(self.gi.gi, self.API_MODULE)
+            ds_dict = gi_client.show_dataset(self.id, ds_id)
+            return self.DS_TYPE(_Owned(ds_dict), self, gi=self.gi)
+
+        return self.gi._get_wrapper(self.DS_TYPE, ds_id, fetch)
+
+    def _wrap_dataset(self, ds_dict, complete=True):
+        """
+        Return the dataset wrapper for a freshly obtained dataset dictionary.
+        If ``complete`` is ``False``, the attributes missing from
+        ``ds_dict`` are fetched when first accessed. A wrapper already in
+        the identity map is updated in place with ``ds_dict``.
+        """
+        marker = _Owned if complete else _Partial
+        return self.gi._get_wrapper(
+            self.DS_TYPE, ds_dict['id'], lambda: self.DS_TYPE(marker(ds_dict), self, gi=self.gi),
+            update=lambda ds: ds._reinit(marker(ds_dict), self, gi=self.gi))
 
     def get_datasets(self, name=None):
         """
@@ -892,8 +1330,8 @@ class DatasetContainer(Wrapper, metaclass=abc.ABCMeta):
         if name is None:
             ds_ids = self.dataset_ids
         else:
-            ds_ids = [_.id for _ in self.content_infos if _.name == name]
-        return [self.get_dataset(_) for _ in ds_ids]
+            ds_ids = [_.id for _ in self._lookup_content_infos('name', name) if _.type == 'file']
+        return self.gi_module._map(self.get_dataset, ds_ids)
 
 
 class History(DatasetContainer):
@@ -905,6 +1343,8 @@ class History(DatasetContainer):
     DSC_TYPE = HistoryDatasetCollectionAssociation
     CONTENT_INFO_TYPE = HistoryContentInfo
     API_MODULE = 'histories'
+    # Overlap in seconds between incremental refreshes, see refresh()
+    REFRESH_OVERLAP = 60
 
     def __init__(self, hist_dict, content_infos=None, gi=None):
         super().__init__(hist_dict, content_infos=content_infos, gi=gi)
@@ -913,6 +1353,85 @@ class History(DatasetContainer):
     def gi_module(self):
         return self.gi.histories
 
+    def refresh(self, incremental=False):
+        """
+        Re-fetch the attributes pertaining to this object.
+
+        :type incremental: bool
+        :param incremental: if ``True`` and the content infos have already
+          been fetched, fetch only the history contents updated since the
+          latest update time of the known ones (minus ``REFRESH_OVERLAP``
+          seconds) and merge them into the content infos. The dataset and
+          dataset collection objects of the identity map (if enabled) are
+          also updated. If the content infos have not been fetched yet, or
+          Galaxy cannot filter the contents by update time, do a full
+          refresh.
+
+        Returns: self
+        """
+        content_infos = self.content_infos
+        if not incremental or not isinstance(content_infos, ContentInfoList) or not content_infos._complete:
+            return super().refresh()
+        update_times = [_.wrapped.get('update_time') for _ in content_infos]
+        if not update_times or None in update_times:
+            return super().refresh()
+        # Contents updated while they were being fetched may have an update
+        # time earlier than the latest one
+        since = parse_timestamp(max(update_times)) - datetime.timedelta(seconds=self.REFRESH_OVERLAP)
+        try:
+            c_dicts = self.gi.gi.histories.show_history(
+                self.id, contents=True, update_time_gt=since.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+        except bioblend.ConnectionError:
+            return super().refresh()
+        c_dict = self.gi_module._fetch_container(self.id, self.__class__)
+        self.__init__(c_dict, content_infos=content_infos, gi=self.gi)
+        c_infos = [self.CONTENT_INFO_TYPE(_Owned(_), gi=self.gi) for _ in c_dicts]
+        content_infos._merge(c_infos)
+        self._update_live_contents(c_infos)
+        return self
+
+    def _update_live_contents(self, c_infos):
+        """
+        Update the wrappers in the identity map for the contents just updated.
+        """
+        identity_map = self.gi.identity_map
+        if identity_map is None:
+            return
+        ds_ids = [_.id for _ in c_infos if _.type == 'file' and identity_map.get(self.DS_TYPE, _.id) is not None]
+        if ds_ids:
+            for ds_dict in self.gi.gi.histories.show_datasets(self.id, ds_ids):
+                ds = identity_map.get(self.DS_TYPE, ds_dict['id'])
+                if ds is not None:
+                    ds._reinit(_Owned(ds_dict), ds.container, gi=self.gi)
+        for c_info in c_infos:
+            if c_info.type == 'collection':
+                dsc = identity_map.get(self.DSC_TYPE, c_info.id)
+                if dsc is not None:
+                    dsc.refresh()
+
+    def get_datasets(self, name=None):
+        """
+        Get all datasets contained inside this history, with a single
+        request.
+
+        :type name: str
+        :param name: return only datasets with this name
+
+        :rtype: list of :class:`~.HistoryDatasetAssociation`
+        :return: datasets with the given name contained inside this history
+        """
+        return [self._wrap_dataset(_) for _ in self.gi.gi.histories.show_datasets(self.id, name=name)]
+
+    def _wrap_dataset_collection(self, dsc_dict, complete=True):
+        """
+        Return the dataset collection wrapper for a freshly obtained dataset
+        collection dictionary, see :meth:`_wrap_dataset`.
+        """
+        marker = _Owned if complete else _Partial
+        return self.gi._get_wrapper(
+            self.DSC_TYPE, dsc_dict['id'], lambda: self.DSC_TYPE(marker(dsc_dict), self, gi=self.gi),
+            update=lambda dsc: dsc._reinit(marker(dsc_dict), self, gi=self.gi))
+
     def update(self, **kwds):
         """
         Update history metadata information. Some of the attributes that can be
@@ -944,6 +1463,10 @@ class History(DatasetContainer):
         self.refresh()
         return self
 
+    def _save_changes(self, changes):
+        self.gi.gi.histories.update_history(self.id, **changes)
+        return []
+
     def delete(self, purge=False):
         """
         Delete this history.
@@ -978,8 +1501,8 @@ class History(DatasetContainer):
         if not isinstance(res, Mapping):
             raise RuntimeError(
                 'upload_dataset_from_library: unexpected reply: %r' % res)
-        self.refresh()
-        return self.get_dataset(res['id'])
+        self._reset_content_infos()
+        return self._wrap_dataset(res, complete=False)
 
     def upload_file(self, path, **kwargs):
         """
@@ -995,11 +1518,19 @@ class History(DatasetContainer):
         :return: the uploaded dataset
         """
         out_dict = self.gi.gi.tools.upload_file(path, self.id, **kwargs)
-        self.refresh()
-        return self.get_dataset(out_dict['outputs'][0]['id'])
+        return self._post_upload(out_dict)
 
     upload_dataset = upload_file
 
+    def _post_upload(self, out_dict):
+        """
+        Return the wrapper for the dataset just uploaded to this history,
+        built from the upload response ``out_dict``, and mark the content
+        infos as stale.
+        """
+        self._reset_content_infos()
+        return self._wrap_dataset(out_dict['outputs'][0], complete=False)
+
     def upload_from_ftp(self, path, **kwargs):
         """
         Upload the file specified by ``path`` from the user's FTP directory to
@@ -1015,8 +1546,7 @@ class History(DatasetContainer):
         :return: the uploaded dataset
         """
         out_dict = self.gi.gi.tools.upload_from_ftp(path, self.id, **kwargs)
-        self.refresh()
-        return self.get_dataset(out_dict['outputs'][0]['id'])
+        return self._post_upload(out_dict)
 
     def paste_content(self, content, **kwargs):
         """
@@ -1032,8 +1562,7 @@ class History(DatasetContainer):
         :return: the uploaded dataset
         """
         out_dict = self.gi.gi.tools.paste_content(content, self.id, **kwargs)
-        self.refresh()
-        return self.get_dataset(out_dict['outputs'][0]['id'])
+        return self._post_upload(out_dict)
 
     def export(self, gzip=True, include_hidden=False, include_deleted=False,
                wait=False, maxwait=None):
@@ -1056,6 +1585,18 @@ class History(DatasetContainer):
         return self.gi.gi.histories.download_history(
             self.id, jeha_id, outf, chunk_size=chunk_size)
 
+    def extract(self, jeha_id=None, path=None, callback=None,
+                chunk_size=bioblend.CHUNK_SIZE, **kwds):
+        """
+        Download an export archive for this history and extract it on the
+        fly.  See
+        :meth:`~bioblend.galaxy.histories.HistoryClient.extract_history`
+        for parameter and return value info.
+        """
+        return self.gi.gi.histories.extract_history(
+            self.id, jeha_id=jeha_id, path=path, callback=callback,
+            chunk_size=chunk_size, **kwds)
+
     def create_dataset_collection(self, collection_description):
         """
         Create a new dataset collection in the history by providing a collection description.
@@ -1080,8 +1621,11 @@ class History(DatasetContainer):
         :rtype: :class:`~.HistoryDatasetCollectionAssociation`
         :return: the dataset collection corresponding to ``dsc_id``
         """
-        dsc_dict = self.gi.gi.histories.show_dataset_collection(self.id, dsc_id)
-        return self.DSC_TYPE(dsc_dict, self, gi=self.gi)
+        def fetch():
+            dsc_dict = self.gi.gi.histories.show_dataset_collection(self.id, dsc_id)
+            return self.DSC_TYPE(_Owned(dsc_dict), self, gi=self.gi)
+
+        return self.gi._get_wrapper(self.DSC_TYPE, dsc_id, fetch)
 
 
 class Library(DatasetContainer):
@@ -1105,7 +1649,7 @@ class Library(DatasetContainer):
         """
         Return the ids of the contained folders.
         """
-        return [_.id for _ in self.content_infos if _.type == 'folder']
+        return [_.id for _ in self._lookup_content_infos('type', 'folder')]
 
     def delete(self):
         """
@@ -1115,13 +1659,54 @@ class Library(DatasetContainer):
         self.refresh()
         self.unmap()
 
+    def batch(self):
+        """
+        Return a new :class:`LibraryUploadBatch` to queue uploads to this
+        library and submit them together, e.g.::
+
+          with library.batch() as batch:
+              for path in paths:
+                  batch.upload_from_local(path)
+          datasets = batch.datasets
+
+        :rtype: :class:`~.LibraryUploadBatch`
+        """
+        return LibraryUploadBatch(self)
+
     def _pre_upload(self, folder):
         """
         Return the id of the given folder, after sanity checking.
         """
         if not self.is_mapped:
             raise RuntimeError('library is not mapped to a Galaxy object')
-        return None if folder is None else folder.id
+        if folder is None:
+            # Save a request to find the root folder for each upload
+            return self.wrapped.get('root_folder_id')
+        return folder.id
+
+    def _post_upload(self, ds_dicts, folder_id):
+        """
+        Return the wrappers for the datasets just uploaded to the folder with
+        id ``folder_id``, described by the upload responses ``ds_dicts``, and
+        add them to the content infos.
+        """
+        ds_dicts = [{'id': _.get('library_dataset_id', _['id']), 'name': _.get('name')} for _ in ds_dicts]
+        if folder_id is None or folder_id == self.wrapped.get('root_folder_id'):
+            folder_path = ''
+        else:
+            folder_path = None
+        content_infos = self.content_infos
+        if isinstance(content_infos, ContentInfoList):
+            if content_infos._complete and folder_path is None:
+                folder_path = next((_.name for _ in content_infos.lookup('id', folder_id)), None)
+            if folder_path is None:
+                self._reset_content_infos()
+            else:
+                content_infos._extend([
+                    LibraryContentInfo(_Owned({'id': _['id'], 'name': '{}/{}'.format(folder_path, _['name']), 'type': 'file'}),
+                                       gi=self.gi)
+                    for _ in ds_dicts])
+        return [self._wrap_dataset(_, complete=False) for _ in ds_dicts]
 
     def upload_data(self, data, folder=None, **kwargs):
         """
@@ -1141,8 +1726,7 @@ class Library(DatasetContainer):
         fid = self._pre_upload(folder)
         res = self.gi.gi.libraries.upload_file_contents(
             self.id, data, folder_id=fid, **kwargs)
-        self.refresh()
-        return self.get_dataset(res[0]['id'])
+        return self._post_upload(res, fid)[0]
 
     def upload_from_url(self, url, folder=None, **kwargs):
         """
@@ -1156,8 +1740,7 @@ class Library(DatasetContainer):
         fid = self._pre_upload(folder)
         res = self.gi.gi.libraries.upload_file_from_url(
             self.id, url, folder_id=fid, **kwargs)
-        self.refresh()
-        return self.get_dataset(res[0]['id'])
+        return self._post_upload(res, fid)[0]
 
     def upload_from_local(self, path, folder=None, **kwargs):
         """
@@ -1171,8 +1754,7 @@ class Library(DatasetContainer):
         fid = self._pre_upload(folder)
         res = self.gi.gi.libraries.upload_file_from_local_path(
             self.id, path, folder_id=fid, **kwargs)
-        self.refresh()
-        return self.get_dataset(res[0]['id'])
+        return self._post_upload(res, fid)[0]
 
     def upload_from_galaxy_fs(self, paths, folder=None, link_data_only=None, **kwargs):
         """
@@ -1208,11 +1790,7 @@ class Library(DatasetContainer):
         if not isinstance(res, Sequence):
             raise RuntimeError(
                 'upload_from_galaxy_filesystem: unexpected reply: %r' % res)
-        new_datasets = [
-            self.get_dataset(ds_info['id']) for ds_info in res
-        ]
-        self.refresh()
-        return new_datasets
+        return self._post_upload(res, fid)
 
     def copy_from_dataset(self, hda, folder=None, message=''):
         """
@@ -1226,8 +1804,7 @@ class Library(DatasetContainer):
         fid = self._pre_upload(folder)
         res = self.gi.gi.libraries.copy_from_dataset(
             self.id, hda.id, folder_id=fid, message=message)
-        self.refresh()
-        return self.get_dataset(res['library_dataset_id'])
+        return self._post_upload([res], fid)[0]
 
     def create_folder(self, name, description=None, base_folder=None):
         """
@@ -1259,8 +1836,11 @@ class Library(DatasetContainer):
         :rtype: :class:`~.Folder`
         :return: the folder corresponding to ``f_id``
         """
-        f_dict = self.gi.gi.libraries.show_folder(self.id, f_id)
-        return Folder(f_dict, self, gi=self.gi)
+        def fetch():
+            f_dict = self.gi.gi.libraries.show_folder(self.id, f_id)
+            return Folder(_Owned(f_dict), self, gi=self.gi)
+
+        return self.gi._get_wrapper(Folder, f_id, fetch)
 
     @property
     def root_folder(self):
@@ -1273,11 +1853,129 @@ class Library(DatasetContainer):
         return self.get_folder(self.gi.gi.libraries._get_root_folder_id(self.id))
 
 
+class LibraryUploadBatch:
+    """
+    Uploads to a library, queued and then submitted together by
+    :meth:`submit` (called when leaving a ``with`` block without errors).
+
+    URL uploads and uploads from the Galaxy filesystem to the same folder
+    with the same options are sent with a single request, the other uploads
+    are sent concurrently. The content infos of the library are then updated
+    from the upload responses, without fetching them again.
+    """
+    # Library client methods accepting several newline-separated sources
+    MERGEABLE = frozenset(('upload_file_from_url', 'upload_from_galaxy_filesystem'))
+
+    def __init__(self, library):
+        """
+        :type library: :class:`Library`
+        :param library: the library to upload to
+        """
+        self.library = library
+        self.datasets = None
+        self._queue = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.submit()
+
+    def _add(self, meth_name, sources, folder, kwargs):
+        self._queue.append((meth_name, list(sources), self.library._pre_upload(folder), kwargs))
+
+    def upload_data(self, data, folder=None, **kwargs):
+        """
+        Queue an upload of ``data``, see :meth:`Library.upload_data`.
+        """
+        self._add('upload_file_contents', [data], folder, kwargs)
+
+    def upload_from_url(self, url, folder=None, **kwargs):
+        """
+        Queue an upload from ``url``, see :meth:`Library.upload_from_url`.
+        """
+        self._add('upload_file_from_url', [url], folder, kwargs)
+
+    def upload_from_local(self, path, folder=None, **kwargs):
+        """
+        Queue an upload of the local file ``path``, see
+        :meth:`Library.upload_from_local`.
+        """
+        self._add('upload_file_from_local_path', [path], folder, kwargs)
+
+    def upload_from_galaxy_fs(self, paths, folder=None, link_data_only=None, **kwargs):
+        """
+        Queue an upload of server-side files, see
+        :meth:`Library.upload_from_galaxy_fs`.
+        """
+        if isinstance(paths, str):
+            paths = (paths,)
+        kwargs['link_data_only'] = link_data_only
+        self._add('upload_from_galaxy_filesystem', paths, folder, kwargs)
+
+    def copy_from_dataset(self, hda, folder=None, message=''):
+        """
+        Queue a copy of a history dataset, see
+        :meth:`Library.copy_from_dataset`.
+        """
+        self._add('copy_from_dataset', [hda.id], folder, {'message': message})
+
+    def submit(self):
+        """
+        Submit the queued uploads.
+
+        :rtype: list of :class:`~.LibraryDataset`
+        :return: the uploaded datasets, in the order in which the uploads
+          were queued (uploads merged into a single request are returned at
+          the position of the first one). They are also stored in the
+          ``datasets`` attribute
+        """
+        library = self.library
+        queue, self._queue = self._queue, []
+        requests = []
+        merged = {}
+        for meth_name, sources, folder_id, kwargs in queue:
+            if meth_name in self.MERGEABLE:
+                key = (meth_name, folder_id, repr(sorted(kwargs.items())))
+                if key in merged:
+                    merged[key][1].extend(sources)
+                    continue
+                merged[key] = (meth_name, sources, folder_id, kwargs)
+            requests.append((meth_name, sources, folder_id, kwargs))
+
+        def upload(request):
+            meth_name, sources, folder_id, kwargs = request
+            res = getattr(library.gi.gi.libraries, meth_name)(library.id, '\n'.join(sources), folder_id=folder_id, **kwargs)
+            if isinstance(res, Mapping):
+                res = [res]
+            if not isinstance(res, Sequence):
+                raise RuntimeError(f'{meth_name}: unexpected reply: {res!r}')
+            return res
+
+        try:
+            responses = library.gi_module._map(upload, requests)
+        except Exception:
+            # Some uploads may have succeeded
+            library._reset_content_infos()
+            raise
+        # Update the content infos once per folder
+        folder_responses = {}
+        for request, res in zip(requests, responses):
+            folder_responses.setdefault(request[2], []).extend(res)
+        datasets = {}
+        for folder_id, ds_dicts in folder_responses.items():
+            datasets.update((_.id, _) for _ in library._post_upload(ds_dicts, folder_id))
+        self.datasets = [datasets[_.get('library_dataset_id', _['id'])] for res in responses for _ in res]
+        return self.datasets
+
+
 class Folder(Wrapper):
     """
     Maps to a folder in a Galaxy library.
     """
     BASE_ATTRS = Wrapper.BASE_ATTRS + ('description', 'deleted', 'item_count')
+    __slots__ = ('container',)
 
     def __init__(self, f_dict, container, gi=None):
         super().__init__(f_dict, gi=gi)
@@ -1327,7 +2025,7 @@ class Folder(Wrapper):
         Returns: self
         """
         f_dict = self.gi.gi.libraries.show_folder(self.container.id, self.id)
-        self.__init__(f_dict, self.container, gi=self.gi)
+        self.__init__(_Owned(f_dict), self.container, gi=self.gi)
         return self
 
 
@@ -1380,7 +2078,9 @@ class Tool(Wrapper):
             if isinstance(v, Dataset):
                 inputs[k] = {'src': v.SRC, 'id': v.id}
         out_dict = self.gi.gi.tools.run_tool(history.id, self.id, inputs)
-        outputs = [history.get_dataset(_['id']) for _ in out_dict['outputs']]
+        history._reset_content_infos()
+        # The outputs returned by Galaxy are full dataset dictionaries
+        outputs = [history._wrap_dataset(_, complete=False) for _ in out_dict['outputs']]
         if wait:
             self.gi._wait_datasets(outputs, polling_interval=polling_interval)
         return outputs
@@ -1413,6 +2113,16 @@ class Preview(Wrapper, metaclass=abc.ABCMeta):
     def __init__(self, pw_dict, gi=None):
         super().__init__(pw_dict, gi=gi)
 
+    def refresh(self):
+        """
+        Re-fetch the attributes pertaining to this object.
+
+        Returns: self
+        """
+        preview = self.gi_module._fetch_preview(self.id)
+        self.__init__(_Owned(preview.wrapped), gi=self.gi)
+        return self
+
 
 class LibraryPreview(Preview):
     """
@@ -0,0 +1,231 @@
+"""
+A small query builder for the listings of Galaxy items, translated to the
+``q``/``qv``, ``order``, ``limit``, ``offset`` and ``keys`` parameters of the
+Galaxy API, e.g.::
+
+    from bioblend.galaxy.query import Query
+
+    q = Query().filter('name', 'RNA', op='contains').tag('paper').updated_after('2020-07-01')
+    gi.histories.get_histories(query=q.order_by('update_time', desc=True).limit(10))
+
+For the listings which Galaxy cannot filter (e.g. libraries and tools), the
+same query is applied to the returned items instead.
+"""
+import copy
+import datetime
+import re
+
+from bioblend.util import parse_timestamp
+
+# Filter operators understood by Galaxy's filter parsers
+OPS = ('eq', 'contains', 'like', 'in', 'has', 'lt', 'le', 'gt', 'ge')
+# Filter attributes holding ISO 8601 timestamps
+TIMESTAMP_ATTRS = frozenset(('create_time', 'update_time'))
+
+
+def _format_value(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return ','.join(str(_) for _ in value)
+    return value
+
+
+def _timestamp(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value
+    return parse_timestamp(value)
+
+
+def _like_regex(pattern):
+    """
+    Translate an SQL ``LIKE`` pattern to a regular expression.
+    """
+    return re.compile(''.join(
+        '.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern), re.IGNORECASE | re.DOTALL)
+
+
+class Query:
+    """
+    Filters, ordering, pagination and field projection for a listing.
+
+    Every method returns a new query, so that a query can be used as a base
+    for several others.
+    """
+
+    def __init__(self):
+        self.filters = []
+        self.order = None
+        self._limit = None
+        self._offset = None
+        self._keys = None
+
+    def _copy(self):
+        new = copy.copy(self)
+        new.filters = list(self.filters)
+        return new
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.to_params())
+
+    def filter(self, attr, value, op='eq'):
+        """
+        Return a query selecting only the items for which ``attr`` matches
+        ``value`` according to the ``op`` operator.
+
+        :type attr: str
+        :param attr: name of the attribute to filter on, e.g. ``name``,
+          ``deleted``, ``state`` or ``update_time``
+
+        :param value: value to compare with. Timestamps can be given as
+          :class:`datetime.datetime` objects (naive ones are assumed to be
+          in UTC) or ISO 8601 strings, and the values for the ``in`` operator
+          as lists.
+
+        :type op: str
+        :param op: one of ``eq`` (equals), ``contains`` (case-insensitive
+          substring), ``like`` (case-insensitive SQL ``LIKE`` pattern), ``in``
+          (one of several values), ``has`` (list attribute containing the
+          value, e.g. for tags), ``lt``, ``le``, ``gt`` or ``ge``
+
+        :rtype: :class:`Query`
+        :return: the new query
+        """
+        if op not in OPS:
+            raise ValueError("Unknown filter operator {!r}, it must be one of: {}".format(op, ', '.join(OPS)))
+        new = self._copy()
+        new.filters.append((attr, op, value))
+        return new
+
+    def tag(self, tag):
+        """
+        Return a query selecting only the items with the given tag.
+        """
+        return self.filter('tag', tag, op='has')
+
+    def updated_after(self, time):
+        """
+        Return a query selecting only the items updated after ``time``.
+        """
+        return self.filter('update_time', time, op='gt')
+
+    def updated_before(self, time):
+        """
+        Return a query selecting only the items updated before ``time``.
+        """
+        return self.filter('update_time', time, op='lt')
+
+    def order_by(self, key, desc=False):
+        """
+        Return a query sorting the items by ``key``, in descending order if
+        ``desc`` is ``True``.
+        """
+        new = self._copy()
+        new.order = (key, desc)
+        return new
+
+    def limit(self, limit):
+        """
+        Return a query returning at most ``limit`` items.
+        """
+        new = self._copy()
+        new._limit = limit
+        return new
+
+    def offset(self, offset):
+        """
+        Return a query skipping the first ``offset`` items.
+        """
+        new = self._copy()
+        new._offset = offset
+        return new
+
+    def keys(self, *keys):
+        """
+        Return a query returning only the given fields of each item.
+        """
+        new = self._copy()
+        new._keys = (new._keys or []) + list(keys)
+        return new
+
+    def to_params(self):
+        """
+        Translate this query to Galaxy API request parameters.
+
+        :rtype: dict
+        :return: the request parameters
+        """
+        params = {}
+        if self.filters:
+            params['q'] = [attr if op == 'eq' else '{}-{}'.format(attr, op) for attr, op, _ in self.filters]
+            params['qv'] = [_format_value(value) for _, _, value in self.filters]
+        if self.order is not None:
+            key, desc = self.order
+            params['order'] = '{}-{}'.format(key, 'dsc' if desc else 'asc')
+        if self._limit is not None:
+            params['limit'] = self._limit
+        if self._offset is not None:
+            params['offset'] = self._offset
+        if self._keys:
+            params['keys'] = ','.join(self._keys)
+        return params
+
+    def matches(self, item):
+        """
+        Return whether the item dict ``item`` matches all the filters.
+        """
+        return all(self._match(item, attr, op, value) for attr, op, value in self.filters)
+
+    @staticmethod
+    def _match(item, attr, op, value):
+        item_value = item.get('tags' if attr == 'tag' else attr)
+        if item_value is None:
+            return False
+        if op == 'eq':
+            return item_value == value
+        if op == 'contains':
+            return str(value).lower() in str(item_value).lower()
+        if op == 'like':
+            return _like_regex(str(value)).fullmatch(str(item_value)) is not None
+        if op == 'in':
+            values = value.split(',') if isinstance(value, str) else value
+            return item_value in values
+        if op == 'has':
+            return value in item_value
+        if attr in TIMESTAMP_ATTRS or isinstance(value, datetime.datetime):
+            item_value, value = _timestamp(item_value), _timestamp(value)
+        return {
+            'lt': item_value < value,
+            'le': item_value <= value,
+            'gt': item_value > value,
+            'ge': item_value >= value,
+        }[op]
+
+    def apply(self, items):
+        """
+        Apply this query to a list of item dicts, for the listings which
+        cannot be filtered by Galaxy.
+
+        :type items: list of dicts
+        :param items: the items to filter
+
+        :rtype: list of dicts
+        :return: the matching items, sorted, paginated and projected as
+          requested
+        """
+        items = [_ for _ in items if self.matches(_)]
+        if self.order is not None:
+            key, desc = self.order
+            # Items without the key go last
+            present = sorted((_ for _ in items if _.get(key) is not None), key=lambda _: _[key], reverse=desc)
+            items = present + [_ for _ in items if _.get(key) is None]
+        start = self._offset or 0
+        stop = None if self._limit is None else start + self._limit
+        items = items[start:stop]
+        if self._keys:
+            items = [{k: _[k] for k in self._keys if k in _} for _ in items]
+        return items
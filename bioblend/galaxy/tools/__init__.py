@@ -4,7 +4,9 @@ Contains possible interaction dealing with Galaxy tools.
 from os.path import basename
 
 from bioblend.galaxy.client import Client
+from bioblend.galaxy.query import Query
 from bioblend.util import attach_file
+from bioblend.util.tus import DEFAULT_CHUNK_SIZE
 
 
 class ToolClient(Client):
@@ -13,7 +15,7 @@ class ToolClient(Client):
         self.module = 'tools'
         super().__init__(galaxy_instance)
 
-    def get_tools(self, tool_id=None, name=None, trackster=None):
+    def get_tools(self, tool_id=None, name=None, trackster=None, query=None):
         """
         Get all tools or filter the specific one(s) via the provided ``name``
         or ``tool_id``. Provide only one argument, ``name`` or ``tool_id``,
@@ -32,6 +34,11 @@ class ToolClient(Client):
         :param trackster: whether to return only tools that are compatible with
           Trackster
 
+        :type query: :class:`~bioblend.galaxy.query.Query`
+        :param query: additional filters, ordering, pagination and fields.
+          Galaxy cannot filter tools, so they are applied to the whole list of
+          tools.
+
         :rtype: list
         :return: List of tool descriptions.
 
@@ -39,13 +46,12 @@ class ToolClient(Client):
         """
         if tool_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or tool_id, but not both')
-        tools = self._raw_get_tool(in_panel=False, trackster=trackster)
+        query = query or Query()
         if tool_id is not None:
-            tool = next((_ for _ in tools if _['id'] == tool_id), None)
-            tools = [tool] if tool is not None else []
+            query = query.filter('id', tool_id)
         elif name is not None:
-            tools = [_ for _ in tools if _['name'] == name]
-        return tools
+            query = query.filter('name', name)
+        return query.apply(self._raw_get_tool(in_panel=False, trackster=trackster))
 
     def get_tool_panel(self):
         """
@@ -236,17 +242,94 @@ class ToolClient(Client):
         :param space_to_tab: whether to convert spaces to tabs. Default is
           ``False``. Applicable only if to_posix_lines is ``True``
 
+        :type resumable: bool
+        :param resumable: if ``True``, first stage the file on Galaxy's
+          resumable upload (tus) endpoint in chunks, instead of sending it in a
+          single multipart request. Default is ``False``
+
+        :type chunk_size: int
+        :param chunk_size: when ``resumable`` is ``True``, the number of bytes
+          sent with each chunk request. Default is 10 MiB
+
+        :type parallel: int
+        :param parallel: when ``resumable`` is ``True``, the maximum number of
+          parts of the file to send concurrently, if supported by the server.
+          Default is 1
+
+        :type resume_storage: :class:`~collections.abc.MutableMapping`
+        :param resume_storage: when ``resumable`` is ``True``, a persistent
+          mapping (e.g. a :mod:`shelve` object) where the state of unfinished
+          uploads is recorded, so that an interrupted upload of the same file
+          can be resumed by calling this method again
+
         :rtype: dict
-        :return: Information about the created upload job
+        :return: Information about the created upload job. If the
+          ``upload_index`` of the Galaxy instance contains a reusable dataset
+          with the same content, this is copied into the history instead
+          (and renamed to ``file_name``) and the returned ``jobs`` list is
+          empty. The upload index is not used if the upload would change the
+          contents of the file (i.e. ``to_posix_lines`` is ``False``,
+          ``space_to_tab`` is ``True`` or another ``tool_id`` is given)
         """
         if "file_name" not in keywords:
             keywords["file_name"] = basename(path)
+        upload_index = self.gi.upload_index
+        if upload_index is not None and not self._can_reuse_upload(keywords):
+            upload_index = None
+        if upload_index is not None:
+            file_type = keywords.get('file_type', 'auto')
+            dbkey = keywords.get('dbkey', '?')
+            digest = upload_index.hash_file(path)
+            for entry in upload_index.find(self.gi, path, digest, file_type, dbkey):
+                return self._copy_uploaded_dataset(entry, history_id, keywords["file_name"])
         payload = self._upload_payload(history_id, **keywords)
-        payload["files_0|file_data"] = attach_file(path, name=keywords["file_name"])
-        try:
-            return self._post(payload, files_attached=True)
-        finally:
-            payload["files_0|file_data"].close()
+        if keywords.get('resumable', False):
+            payload["files_0|file_data"] = self.gi._tus_upload(
+                path, file_name=keywords["file_name"],
+                chunk_size=keywords.get('chunk_size', DEFAULT_CHUNK_SIZE),
+                parallel=keywords.get('parallel', 1),
+                storage=keywords.get('resume_storage'))
+            ret = self._post(payload)
+        else:
+            payload["files_0|file_data"] = attach_file(path, name=keywords["file_name"])
+            try:
+                ret = self._post(payload, files_attached=True)
+            finally:
+                payload["files_0|file_data"].close()
+        if upload_index is not None:
+            upload_index.add(self.gi, digest, file_type, dbkey, 'hda', history_id, ret['outputs'][0]['id'])
+        return ret
+
+    @staticmethod
+    def _can_reuse_upload(keywords):
+        """
+        Return whether an upload with the given keywords stores the file
+        contents as they are (apart from line endings), so that a dataset
+        with the same contents can be reused instead.
+        """
+        if keywords.get('tool_id', 'upload1') != 'upload1':
+            return False
+        return keywords.get('to_posix_lines', True) and not keywords.get('space_to_tab', False)
+
+    def _copy_uploaded_dataset(self, entry, history_id, file_name):
+        """
+        Copy a previously uploaded dataset found in the upload index into a
+        history, instead of uploading the same file again.
+
+        :rtype: dict
+        :return: Information about the new dataset, in the same format
+          returned by :meth:`upload_file`
+        """
+        source = 'hda' if entry.src == 'hda' else 'library'
+        hda = self.gi.histories.copy_dataset(history_id, entry.dataset_id, source=source)
+        if hda.get('name') != file_name:
+            hda = self.gi.histories.update_dataset(history_id, hda['id'], name=file_name)
+        return {
+            'outputs': [hda],
+            'jobs': [],
+            'output_collections': [],
+            'implicit_collections': [],
+        }
 
     def upload_from_ftp(self, path, history_id, **keywords):
         """
@@ -291,6 +374,129 @@ class ToolClient(Client):
 
     put_url = paste_content
 
+    def upload_batch(self, history_id, elements, collection_type=None,
+                     collection_name=None, file_type='auto', dbkey='?',
+                     to_posix_lines=True, space_to_tab=False,
+                     resumable=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Upload many local files, URLs and pasted contents to the history
+        specified by ``history_id`` with a single request to Galaxy's data
+        fetch API, optionally building a dataset collection from them.
+
+        :type history_id: str
+        :param history_id: id of the history where to upload the datasets
+
+        :type elements: list of dicts
+        :param elements: descriptions of the datasets to upload. Each dict
+          must contain exactly one of the keys ``path`` (path of a local
+          file), ``url`` (URL of a file to fetch) or ``content`` (content of
+          the new dataset), and may contain the keys ``name``, ``file_type``
+          and ``dbkey`` to override the corresponding defaults for that
+          dataset. For example::
+
+            [{'path': '/data/sample1.fastq', 'file_type': 'fastqsanger'},
+             {'url': 'https://example.org/sample2.fastq', 'name': 'sample2'},
+             {'content': 'chr1\t10\t20\n', 'name': 'region.bed'}]
+
+        :type collection_type: str
+        :param collection_type: if set (e.g. to ``list`` or ``paired``), build
+          a dataset collection of this type from the uploaded datasets, using
+          the element names as collection element identifiers. For a
+          ``paired`` collection, the 2 elements are named ``forward`` and
+          ``reverse`` if no name is given
+
+        :type collection_name: str
+        :param collection_name: name of the new dataset collection
+
+        :type file_type: str
+        :param file_type: default Galaxy datatype for the new datasets,
+          default is auto
+
+        :type dbkey: str
+        :param dbkey: default genome dbkey for the new datasets
+
+        :type to_posix_lines: bool
+        :param to_posix_lines: if ``True`` (the default), convert universal
+          line endings to POSIX line endings
+
+        :type space_to_tab: bool
+        :param space_to_tab: whether to convert spaces to tabs. Default is
+          ``False``
+
+        :type resumable: bool
+        :param resumable: if ``True``, stage the local files on Galaxy's
+          resumable upload (tus) endpoint before sending the request, see
+          :meth:`upload_file`
+
+        :type chunk_size: int
+        :param chunk_size: when ``resumable`` is ``True``, the number of bytes
+          sent with each chunk request
+
+        :rtype: dict
+        :return: Information about the created upload jobs, datasets and
+          collections
+        """
+        fetch_elements = []
+        files = []
+        for element in elements:
+            sources = [k for k in ('path', 'url', 'content') if element.get(k) is not None]
+            if len(sources) != 1:
+                raise ValueError("Each element must contain exactly one of 'path', 'url' or 'content', got: %r" % element)
+            fetch_element = {
+                'ext': element.get('file_type', file_type),
+                'dbkey': element.get('dbkey', dbkey),
+                'to_posix_lines': to_posix_lines,
+                'space_to_tab': space_to_tab,
+            }
+            name = element.get('name')
+            if 'path' in sources:
+                if name is None:
+                    name = basename(element['path'])
+                fetch_element['src'] = 'files'
+                files.append((element['path'], name))
+            elif 'url' in sources:
+                fetch_element['src'] = 'url'
+                fetch_element['url'] = element['url']
+            else:
+                fetch_element['src'] = 'pasted'
+                fetch_element['paste_content'] = element['content']
+            if name is not None:
+                fetch_element['name'] = name
+            fetch_elements.append(fetch_element)
+        if collection_type is None:
+            target = {'destination': {'type': 'hdas'}}
+        else:
+            if collection_type == 'paired':
+                if len(fetch_elements) != 2:
+                    raise ValueError('A paired collection needs exactly 2 elements')
+                for fetch_element, default_name in zip(fetch_elements, ('forward', 'reverse')):
+                    fetch_element.setdefault('name', default_name)
+            if any('name' not in _ for _ in fetch_elements):
+                raise ValueError('All elements of a collection need a name')
+            target = {
+                'destination': {'type': 'hdca'},
+                'collection_type': collection_type,
+            }
+            if collection_name is not None:
+                target['name'] = collection_name
+        target['elements'] = fetch_elements
+        payload = {
+            'history_id': history_id,
+            'targets': [target],
+        }
+        url = '/'.join((self._make_url(), 'fetch'))
+        if resumable:
+            for i, (path, name) in enumerate(files):
+                payload['files_%d|file_data' % i] = self.gi._tus_upload(path, file_name=name, chunk_size=chunk_size)
+            return self._post(payload, url=url)
+        for i, (path, name) in enumerate(files):
+            payload['files_%d|file_data' % i] = attach_file(path, name=name)
+        try:
+            return self._post(payload, url=url, files_attached=bool(files))
+        finally:
+            for i in range(len(files)):
+                payload['files_%d|file_data' % i].close()
+
     def _upload_payload(self, history_id, **keywords):
         payload = {}
         payload["history_id"] = history_id
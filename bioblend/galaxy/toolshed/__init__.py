@@ -141,7 +141,9 @@ class ToolShedClient(Client):
             payload['new_tool_panel_section_label'] = new_tool_panel_section_label
 
         url = self._make_url() + '/new/install_repository_revision'
-        return self._post(url=url, payload=payload)
+        ret = self._post(url=url, payload=payload)
+        self.gi._toolbox_generation += 1
+        return ret
 
     def uninstall_repository_revision(self, name, owner, changeset_revision,
                                       tool_shed_url, remove_from_disk=True):
@@ -175,4 +177,6 @@ class ToolShedClient(Client):
             'changeset_revision': changeset_revision,
             'remove_from_disk': remove_from_disk
         }
-        return self._delete(params=payload)
+        ret = self._delete(params=payload)
+        self.gi._toolbox_generation += 1
+        return ret
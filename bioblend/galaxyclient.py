@@ -6,27 +6,63 @@ should not use it directly.
 A base representation of an instance
 """
 import base64
+import http.cookiejar
 import json
+import threading
 from urllib.parse import (
     urljoin,
     urlparse,
 )
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests_toolbelt import MultipartEncoder
 
 from bioblend import ConnectionError
-from bioblend.util import FileStream
+from bioblend.util import (
+    endpoint,
+    FileStream,
+)
+from bioblend.util.limiter import (
+    AIMDLimiter,
+    CONGESTION_STATUS_CODES,
+)
+
+# Default maximum number of connections kept open to the server, the same as
+# for requests' HTTPAdapter
+DEFAULT_POOL_SIZE = 10
 
 
 class GalaxyClient:
 
-    def __init__(self, url, key=None, email=None, password=None, verify=True, timeout=None):
+    def __init__(self, url, key=None, email=None, password=None, verify=True, timeout=None,
+                 pool_size=DEFAULT_POOL_SIZE, adaptive_concurrency=False, max_rate=None, reserved_slots=None):
         """
         :param verify: Whether to verify the server's TLS certificate
         :type verify: bool
         :param timeout: Timeout for requests operations, set to None for no timeout (the default).
         :type timeout: float
+        :param pool_size: Maximum number of connections to the server kept open
+          for reuse, shared by all the threads using this instance. Set it to
+          at least the number of threads making concurrent requests. If
+          ``adaptive_concurrency``, ``max_rate`` or ``reserved_slots`` is
+          set, it is also the maximum number of concurrent requests.
+        :type pool_size: int
+        :param adaptive_concurrency: Whether to adapt the number of concurrent
+          requests (starting from half of ``pool_size``, up to ``pool_size``)
+          to the load of the server, reducing it when the server is slow or
+          answers that it is overloaded, see
+          :class:`~bioblend.util.limiter.AIMDLimiter`. Disabled by default.
+          The limiter is available as the ``limiter`` attribute (``None`` if
+          requests are not limited).
+        :type adaptive_concurrency: bool
+        :param max_rate: Maximum number of requests started per second, ``None``
+          for no maximum
+        :type max_rate: float
+        :param reserved_slots: Number of concurrent requests reserved for the
+          interactive priority lane, by default a fifth of ``pool_size`` if
+          ``adaptive_concurrency`` is ``True``, 0 otherwise
+        :type reserved_slots: int
         """
         # Make sure the url scheme is defined (otherwise requests will not work)
         if not urlparse(url).scheme:
@@ -42,9 +78,51 @@ class GalaxyClient:
             self._key = None
             self.email = email
             self.password = password
+        self._key_lock = threading.Lock()
         self.json_headers = {'Content-Type': 'application/json'}
         self.verify = verify
         self.timeout = timeout
+        # Per-instance GET retry settings, None to use the defaults of Client
+        self._max_get_attempts = None
+        self._get_retry_delay = None
+        self.session = requests.Session()
+        # Requests are authenticated by the API key only, so do not let
+        # threads share session cookies
+        self.session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        self.pool_size = pool_size
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.limiter = None
+        if adaptive_concurrency or max_rate is not None or reserved_slots is not None:
+            if reserved_slots is None and not adaptive_concurrency:
+                # Only max_rate is set, do not hold back background requests
+                reserved_slots = 0
+            self.limiter = AIMDLimiter(pool_size, max_rate=max_rate, adaptive=adaptive_concurrency,
+                                       reserved_slots=reserved_slots)
+
+    def _send(self, method, url, **kwargs):
+        """
+        Send a request through the session, within the concurrency limit of
+        the priority lane of the current thread.
+
+        :rtype: requests.Response
+        :return: the response object
+        """
+        limiter = self.limiter
+        if limiter is None:
+            return self.session.request(method, url, **kwargs)
+        ticket = limiter.acquire()
+        try:
+            r = self.session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            limiter.release(ticket, congested=True)
+            raise
+        except BaseException:
+            limiter.release(ticket)
+            raise
+        limiter.release(ticket, congested=r.status_code in CONGESTION_STATUS_CODES, key=(method, endpoint(url)))
+        return r
 
     def make_get_request(self, url, **kwargs):
         """
@@ -64,13 +142,13 @@ class GalaxyClient:
         """
         params = kwargs.get('params')
         if params is not None and params.get('key', False) is False:
-            params['key'] = self.key
+            params = dict(params, key=self.key)
         else:
             params = self.default_params
         kwargs['params'] = params
         kwargs.setdefault('verify', self.verify)
         kwargs.setdefault('timeout', self.timeout)
-        r = requests.get(url, **kwargs)
+        r = self._send('GET', url, **kwargs)
         return r
 
     def make_post_request(self, url, payload, params=None, files_attached=False):
@@ -99,7 +177,7 @@ class GalaxyClient:
             return d
 
         if params is not None and params.get('key', False) is False:
-            params['key'] = self.key
+            params = dict(params, key=self.key)
         else:
             params = self.default_params
 
@@ -118,9 +196,9 @@ class GalaxyClient:
             headers = self.json_headers
             post_params = params
 
-        r = requests.post(url, data=payload, headers=headers,
-                          verify=self.verify, params=post_params,
-                          timeout=self.timeout, allow_redirects=False)
+        r = self._send('POST', url, data=payload, headers=headers,
+                       verify=self.verify, params=post_params,
+                       timeout=self.timeout, allow_redirects=False)
         if r.status_code == 200:
             try:
                 return r.json()
@@ -148,14 +226,14 @@ class GalaxyClient:
         :return: the response object.
         """
         if params is not None and params.get('key', False) is False:
-            params['key'] = self.key
+            params = dict(params, key=self.key)
         else:
             params = self.default_params
         if payload is not None:
             payload = json.dumps(payload)
         headers = self.json_headers
-        r = requests.delete(url, verify=self.verify, data=payload, params=params,
-                            headers=headers, timeout=self.timeout, allow_redirects=False)
+        r = self._send('DELETE', url, verify=self.verify, data=payload, params=params,
+                       headers=headers, timeout=self.timeout, allow_redirects=False)
         return r
 
     def make_put_request(self, url, payload=None, params=None):
@@ -168,14 +246,14 @@ class GalaxyClient:
         :return: The decoded response.
         """
         if params is not None and params.get('key', False) is False:
-            params['key'] = self.key
+            params = dict(params, key=self.key)
         else:
             params = self.default_params
 
         payload = json.dumps(payload)
         headers = self.json_headers
-        r = requests.put(url, data=payload, params=params, headers=headers,
-                         verify=self.verify, timeout=self.timeout, allow_redirects=False)
+        r = self._send('PUT', url, data=payload, params=params, headers=headers,
+                       verify=self.verify, timeout=self.timeout, allow_redirects=False)
         if r.status_code == 200:
             try:
                 return r.json()
@@ -196,14 +274,14 @@ class GalaxyClient:
         :return: The decoded response.
         """
         if params is not None and params.get('key', False) is False:
-            params['key'] = self.key
+            params = dict(params, key=self.key)
         else:
             params = self.default_params
 
         payload = json.dumps(payload)
         headers = self.json_headers
-        r = requests.patch(url, data=payload, params=params, headers=headers,
-                           verify=self.verify, timeout=self.timeout, allow_redirects=False)
+        r = self._send('PATCH', url, data=payload, params=params, headers=headers,
+                       verify=self.verify, timeout=self.timeout, allow_redirects=False)
         if r.status_code == 200:
             try:
                 return r.json()
@@ -217,23 +295,33 @@ class GalaxyClient:
     @property
     def key(self):
         if not self._key and self.email is not None and self.password is not None:
-            unencoded_credentials = f"{self.email}:{self.password}"
-            authorization = base64.b64encode(unencoded_credentials.encode())
-            headers = self.json_headers.copy()
-            headers["Authorization"] = authorization
-            auth_url = "%s/authenticate/baseauth" % self.url
-            # make_post_request uses default_params, which uses this and
-            # sets wrong headers - so using lower level method.
-            r = requests.get(auth_url, verify=self.verify, headers=headers)
-            if r.status_code != 200:
-                raise Exception("Failed to authenticate user.")
-            response = r.json()
-            if isinstance(response, str):
-                # bug in Tool Shed
-                response = json.loads(response)
-            self._key = response["api_key"]
+            with self._key_lock:
+                # Another thread may have fetched the key meanwhile
+                if not self._key:
+                    self._key = self._fetch_key()
         return self._key
 
+    def _fetch_key(self):
+        """
+        Get the user's API key from the server using ``email`` and
+        ``password``.
+        """
+        unencoded_credentials = f"{self.email}:{self.password}"
+        authorization = base64.b64encode(unencoded_credentials.encode())
+        headers = self.json_headers.copy()
+        headers["Authorization"] = authorization
+        auth_url = "%s/authenticate/baseauth" % self.url
+        # make_post_request uses default_params, which uses this and
+        # sets wrong headers - so using lower level method.
+        r = self.session.get(auth_url, verify=self.verify, headers=headers)
+        if r.status_code != 200:
+            raise Exception("Failed to authenticate user.")
+        response = r.json()
+        if isinstance(response, str):
+            # bug in Tool Shed
+            response = json.loads(response)
+        return response["api_key"]
+
     @property
     def default_params(self):
         return {'key': self.key}
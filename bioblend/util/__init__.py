@@ -1,5 +1,11 @@
+import datetime
 import os
+import re
 from collections import namedtuple
+from urllib.parse import urlsplit
+
+# Galaxy encoded ids, replaced in the URL paths to group requests by endpoint
+_ID_RE = re.compile(r'/[0-9a-f]{16,}(?=/|$)')
 
 
 class Bunch:
@@ -51,7 +57,47 @@ def attach_file(path, name=None):
     return attachment
 
 
+def _strptime_iso(timestamp):
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(timestamp, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Invalid timestamp: %r' % timestamp)
+
+
+# datetime.fromisoformat() is much faster, but needs Python >= 3.7
+_fromisoformat = getattr(datetime.datetime, 'fromisoformat', _strptime_iso)
+
+
+def parse_timestamp(timestamp):
+    """
+    Parse a timestamp returned by Galaxy, i.e. in ISO 8601 format (e.g.
+    ``2020-07-04T12:34:56.789012``) and in UTC.
+
+    :type timestamp: str
+    :param timestamp: the timestamp
+
+    :rtype: :class:`datetime.datetime`
+    :return: the corresponding (time zone aware) datetime
+    """
+    dt = _fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+
+def endpoint(url):
+    """
+    Return the endpoint of a request URL, i.e. its path with the Galaxy ids
+    replaced by ``{id}``, e.g. ``/api/histories/{id}/contents``.
+    """
+    return _ID_RE.sub('/{id}', urlsplit(url).path)
+
+
 __all__ = (
     'Bunch',
     'attach_file',
+    'endpoint',
+    'parse_timestamp',
 )
@@ -0,0 +1,307 @@
+"""
+Adaptive limit of the number of concurrent requests to a server, to find the
+highest throughput that does not overload it.
+
+Requests are made in one of two priority lanes: ``INTERACTIVE`` (the default)
+for latency-sensitive calls, and ``BACKGROUND`` for bulk work, which yields
+to interactive requests and cannot use the slots reserved for them, e.g.::
+
+    from bioblend.util.limiter import BACKGROUND, priority
+
+    with priority(BACKGROUND):
+        for dataset_id in dataset_ids:
+            gi.datasets.show_dataset(dataset_id)
+"""
+import collections
+import contextlib
+import functools
+import statistics
+import threading
+import time
+
+# HTTP status codes meaning that the server (or a proxy in front of it) is
+# overloaded
+CONGESTION_STATUS_CODES = frozenset((429, 502, 503, 504))
+
+# Number of latencies of an endpoint needed before comparing the recent ones
+# with the long-term average
+MIN_LATENCY_SAMPLES = 20
+# Number of recent latencies of an endpoint whose median is compared with the
+# long-term average, so that a single slow request is not a congestion signal
+RECENT_LATENCY_SAMPLES = 5
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+_local = threading.local()
+
+
+def current_priority():
+    """
+    Return the priority lane of the requests made by the current thread.
+
+    :rtype: str
+    :return: ``INTERACTIVE`` or ``BACKGROUND``
+    """
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(lane):
+    """
+    Context manager making the requests of the current thread in the given
+    priority lane.
+
+    :type lane: str
+    :param lane: ``INTERACTIVE`` or ``BACKGROUND``
+    """
+    if lane not in PRIORITIES:
+        raise ValueError("Unknown priority {!r}, it must be one of: {}".format(lane, ', '.join(PRIORITIES)))
+    previous = current_priority()
+    _local.priority = lane
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def bind_priority(func):
+    """
+    Return a function calling ``func`` in the priority lane of the current
+    thread, to be called from another thread.
+    """
+    lane = current_priority()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with priority(lane):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class _LatencyStats:
+    __slots__ = ('count', 'average', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.average = 0.0
+        self.recent = collections.deque(maxlen=RECENT_LATENCY_SAMPLES)
+
+
+class _Ticket:
+    __slots__ = ('start', 'generation')
+
+    def __init__(self, start, generation):
+        self.start = start
+        self.generation = generation
+
+
+class AIMDLimiter:
+    """
+    Limit the number of concurrent requests with an additive increase,
+    multiplicative decrease (AIMD) algorithm, like TCP congestion control.
+
+    The limit grows by about 1 each time ``limit`` requests complete
+    successfully, up to ``max_limit``, and is multiplied by ``backoff`` (down
+    to ``min_limit``) when a request signals congestion: an overload HTTP
+    status code (see ``CONGESTION_STATUS_CODES``), a timeout or connection
+    error, or recent latencies more than ``latency_tolerance`` times the
+    usual ones. Latencies are compared per request key (e.g. the method and
+    endpoint), since different requests have different normal latencies.
+    Only one decrease happens for the requests which were in flight at the
+    same time.
+
+    Background requests wait while interactive ones are waiting, and can only
+    start while fewer than ``limit - reserved_slots`` requests are in flight
+    (or none at all), so that interactive requests are not starved.
+
+    Optionally, the start of requests is spaced to keep below ``max_rate``
+    requests per second.
+
+    Usage::
+
+        ticket = limiter.acquire()
+        try:
+            r = do_request()
+        except requests.exceptions.RequestException:
+            limiter.release(ticket, congested=True)
+            raise
+        limiter.release(ticket, congested=r.status_code in CONGESTION_STATUS_CODES,
+                        key=('GET', endpoint(url)))
+    """
+
+    def __init__(self, max_limit, initial_limit=None, min_limit=1, backoff=0.5,
+                 latency_tolerance=3.0, max_rate=None, adaptive=True, reserved_slots=None):
+        """
+        :type max_limit: int
+        :param max_limit: maximum number of concurrent requests
+
+        :type initial_limit: int
+        :param initial_limit: initial number of concurrent requests, by default
+          half of ``max_limit``
+
+        :type min_limit: int
+        :param min_limit: minimum number of concurrent requests
+
+        :type backoff: float
+        :param backoff: factor (between 0 and 1) applied to the limit on
+          congestion
+
+        :type latency_tolerance: float
+        :param latency_tolerance: ratio between the median of the recent
+          latencies and the long-term average latency (of requests with the
+          same key) above which the server is considered congested, ``None``
+          to ignore latencies
+
+        :type max_rate: float
+        :param max_rate: maximum number of requests started per second,
+          ``None`` for no maximum
+
+        :type adaptive: bool
+        :param adaptive: if ``False``, the limit stays at ``max_limit`` (only
+          ``max_rate`` and the priority lanes are enforced)
+
+        :type reserved_slots: int
+        :param reserved_slots: number of slots reserved for interactive
+          requests, by default a fifth of ``max_limit`` (at least 1)
+        """
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError("Limits must satisfy 1 <= min_limit <= max_limit (got: {}, {})".format(
+                min_limit, max_limit))
+        if not 0 < backoff < 1:
+            raise ValueError("backoff must be between 0 and 1 (got: %s)" % backoff)
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError("max_rate must be > 0 (got: %s)" % max_rate)
+        if reserved_slots is None:
+            reserved_slots = max(1, max_limit // 5)
+        elif reserved_slots < 0:
+            raise ValueError("reserved_slots must be >= 0 (got: %s)" % reserved_slots)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.max_rate = max_rate
+        self.adaptive = adaptive
+        self.reserved_slots = reserved_slots
+        if not adaptive:
+            initial_limit = max_limit
+        elif initial_limit is None:
+            initial_limit = max(min_limit, max_limit // 2)
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._interactive_waiting = 0
+        # Incremented at each decrease, to ignore the congestion signals of
+        # the requests started before it
+        self._generation = 0
+        self._next_start = 0.0
+        # Latency statistics per request key
+        self._latencies = {}
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        """
+        The current maximum number of concurrent requests.
+        """
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """
+        The number of requests currently in flight.
+        """
+        return self._in_flight
+
+    def _can_start(self, lane):
+        limit = int(self._limit)
+        if lane == INTERACTIVE:
+            return self._in_flight < limit
+        if self._interactive_waiting:
+            return False
+        return self._in_flight < max(1, limit - self.reserved_slots)
+
+    def acquire(self, lane=None):
+        """
+        Wait until a new request can be started.
+
+        :type lane: str
+        :param lane: priority lane of the request, by default the one of the
+          current thread (see :func:`priority`)
+
+        :rtype: object
+        :return: a ticket to pass to :meth:`release` when the request completes
+        """
+        if lane is None:
+            lane = current_priority()
+        with self._cond:
+            if not self._can_start(lane):
+                if lane == INTERACTIVE:
+                    self._interactive_waiting += 1
+                try:
+                    while not self._can_start(lane):
+                        self._cond.wait()
+                finally:
+                    if lane == INTERACTIVE:
+                        self._interactive_waiting -= 1
+            self._in_flight += 1
+            delay = 0.0
+            if self.max_rate is not None:
+                now = time.monotonic()
+                start = max(now, self._next_start)
+                self._next_start = start + 1.0 / self.max_rate
+                delay = start - now
+            generation = self._generation
+        if delay > 0:
+            time.sleep(delay)
+        return _Ticket(time.monotonic(), generation)
+
+    def release(self, ticket, congested=False, key=None):
+        """
+        Record the completion of a request.
+
+        :param ticket: the ticket returned by :meth:`acquire`
+
+        :type congested: bool
+        :param congested: whether the request failed because the server is
+          overloaded
+
+        :param key: hashable identifying the kind of request (e.g. the method
+          and endpoint) whose latencies are compared, ``None`` to ignore the
+          latency of this request
+        """
+        latency = time.monotonic() - ticket.start
+        with self._cond:
+            self._in_flight -= 1
+            if self.adaptive:
+                slow = False
+                if not congested and key is not None and self.latency_tolerance is not None:
+                    slow = self._update_latency(key, latency)
+                if congested or slow:
+                    if ticket.generation == self._generation:
+                        self._generation += 1
+                        self._limit = max(self.min_limit, self._limit * self.backoff)
+                else:
+                    self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def _update_latency(self, key, latency):
+        """
+        Update the latency statistics of ``key`` and return whether its
+        recent latencies are too high.
+        """
+        stats = self._latencies.get(key)
+        if stats is None:
+            stats = self._latencies[key] = _LatencyStats()
+        stats.recent.append(latency)
+        slow = False
+        if stats.count >= MIN_LATENCY_SAMPLES and len(stats.recent) == RECENT_LATENCY_SAMPLES:
+            slow = statistics.median(stats.recent) > self.latency_tolerance * stats.average
+        if slow:
+            # The next decrease needs a new series of slow requests
+            stats.recent.clear()
+        # Long-term average: the plain mean of the first samples, then
+        # exponentially weighted
+        stats.count += 1
+        stats.average += (latency - stats.average) / min(stats.count, 100)
+        return slow
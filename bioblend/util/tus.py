@@ -0,0 +1,232 @@
+"""
+A minimal client for the tus resumable upload protocol (https://tus.io/),
+used to stage large files on Galaxy's ``/api/upload/resumable_upload``
+endpoint in chunks.
+"""
+import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+import bioblend
+from bioblend import ConnectionError
+
+TUS_VERSION = '1.0.0'
+# Same as the default value of Galaxy's ``chunk_upload_size`` option
+DEFAULT_CHUNK_SIZE = 10 * 1024 * 1024
+
+
+class TusUploader:
+    """
+    Upload files through a tus server, one chunk (``PATCH`` request) at a
+    time.
+
+    If an upload is interrupted, it can be resumed from the last offset
+    acknowledged by the server, either by calling :meth:`upload` again with
+    the same ``storage`` or transparently when a chunk fails (up to
+    ``max_retries`` times per chunk).
+
+    If the server supports the ``concatenation`` extension and ``parallel``
+    is greater than 1, the file is split into ``parallel`` partial uploads
+    which are sent concurrently and then concatenated by the server.
+    """
+
+    def __init__(self, endpoint, params=None, verify=True, timeout=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, parallel=1, storage=None,
+                 max_retries=3):
+        """
+        :type endpoint: str
+        :param endpoint: URL of the tus upload creation endpoint
+
+        :type params: dict
+        :param params: query parameters (e.g. the API key) to send with every
+          request
+
+        :type verify: bool
+        :param verify: whether to verify the server's TLS certificate
+
+        :type timeout: float
+        :param timeout: timeout for each request, ``None`` for no timeout
+
+        :type chunk_size: int
+        :param chunk_size: number of bytes to send with each ``PATCH`` request
+
+        :type parallel: int
+        :param parallel: maximum number of partial uploads to send
+          concurrently (only if the server supports concatenation)
+
+        :type storage: :class:`~collections.abc.MutableMapping`
+        :param storage: persistent mapping (e.g. a :mod:`shelve` object) used
+          to remember the upload URLs of unfinished uploads, so that they can
+          be resumed by a later process. If ``None``, uploads can only be
+          resumed within the same :meth:`upload` call.
+
+        :type max_retries: int
+        :param max_retries: how many times a failed chunk is retried (after
+          querying the server for the current offset) before giving up
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be >= 1 (got: %s)" % chunk_size)
+        if parallel < 1:
+            raise ValueError("parallel must be >= 1 (got: %s)" % parallel)
+        self.endpoint = endpoint
+        self.params = params or {}
+        self.verify = verify
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.parallel = parallel
+        self.storage = storage
+        self.max_retries = max_retries
+
+    def _request(self, method, url, headers=None, **kwargs):
+        all_headers = {'Tus-Resumable': TUS_VERSION}
+        if headers:
+            all_headers.update(headers)
+        return requests.request(method, url, headers=all_headers,
+                                params=self.params, verify=self.verify,
+                                timeout=self.timeout, allow_redirects=False,
+                                **kwargs)
+
+    def extensions(self):
+        """
+        Return the set of protocol extensions supported by the server.
+        """
+        try:
+            r = self._request('OPTIONS', self.endpoint)
+        except requests.exceptions.RequestException:
+            return set()
+        if r.status_code not in (200, 204):
+            return set()
+        return {_.strip() for _ in r.headers.get('Tus-Extension', '').split(',') if _.strip()}
+
+    def create(self, length, metadata=None, concat=None):
+        """
+        Create a new upload of ``length`` bytes and return its URL.
+        """
+        headers = {}
+        if concat is None or concat == 'partial':
+            headers['Upload-Length'] = str(length)
+        if concat is not None:
+            headers['Upload-Concat'] = concat
+        if metadata:
+            headers['Upload-Metadata'] = ','.join(
+                '{} {}'.format(k, base64.b64encode(str(v).encode()).decode())
+                for k, v in metadata.items())
+        r = self._request('POST', self.endpoint, headers=headers)
+        if r.status_code != 201 or 'Location' not in r.headers:
+            raise ConnectionError("Unexpected HTTP status code while creating upload: %s" % r.status_code,
+                                  body=r.text, status_code=r.status_code)
+        return urljoin(self.endpoint, r.headers['Location'])
+
+    def get_offset(self, url):
+        """
+        Return the number of bytes of the upload at ``url`` already received
+        by the server, or ``None`` if the upload does not exist any more.
+        """
+        r = self._request('HEAD', url)
+        if r.status_code in (403, 404, 410):
+            return None
+        if r.status_code not in (200, 204) or 'Upload-Offset' not in r.headers:
+            raise ConnectionError("Unexpected HTTP status code while querying upload offset: %s" % r.status_code,
+                                  body=r.text, status_code=r.status_code)
+        return int(r.headers['Upload-Offset'])
+
+    def _send(self, url, path, start, length, offset=0):
+        """
+        Send bytes ``[start + offset, start + length)`` of the file at
+        ``path`` to the upload at ``url``.
+        """
+        retries_left = self.max_retries
+        with open(path, 'rb') as f:
+            while offset < length:
+                f.seek(start + offset)
+                chunk = f.read(min(self.chunk_size, length - offset))
+                headers = {
+                    'Content-Type': 'application/offset+octet-stream',
+                    'Upload-Offset': str(offset),
+                }
+                try:
+                    r = self._request('PATCH', url, headers=headers, data=chunk)
+                    if r.status_code != 204:
+                        raise ConnectionError("Unexpected HTTP status code while uploading chunk: %s" % r.status_code,
+                                              body=r.text, status_code=r.status_code)
+                except (requests.exceptions.RequestException, ConnectionError) as e:
+                    if retries_left <= 0:
+                        raise
+                    retries_left -= 1
+                    bioblend.log.warning("Upload of chunk at offset %s to %s failed (%s), %d retries left",
+                                         offset, url, e, retries_left)
+                    server_offset = self.get_offset(url)
+                    if server_offset is None:
+                        raise
+                    offset = server_offset
+                else:
+                    offset = int(r.headers.get('Upload-Offset', offset + len(chunk)))
+                    retries_left = self.max_retries
+        return url
+
+    def _fingerprint(self, path, size):
+        st = os.stat(path)
+        return '{}|{}|{}|{}'.format(self.endpoint, os.path.abspath(path), size, st.st_mtime_ns)
+
+    def _resume_or_create(self, url, length, metadata, concat=None):
+        """
+        Return the URL to upload to and the offset to start from.
+        """
+        if url is not None:
+            offset = self.get_offset(url)
+            if offset is not None:
+                bioblend.log.info("Resuming upload %s at offset %s", url, offset)
+                return url, offset
+        return self.create(length, metadata=metadata, concat=concat), 0
+
+    def upload(self, path, metadata=None):
+        """
+        Upload the file at ``path``, resuming a previous unfinished upload of
+        the same file if one is recorded in ``storage``.
+
+        :type path: str
+        :param path: path of the file to upload
+
+        :type metadata: dict
+        :param metadata: ``Upload-Metadata`` key-value pairs
+
+        :rtype: str
+        :return: the URL of the completed upload
+        """
+        size = os.path.getsize(path)
+        fingerprint = self._fingerprint(path, size)
+        stored_urls = []
+        if self.storage is not None:
+            stored_urls = list(self.storage.get(fingerprint, []))
+        n_parts = 1
+        if self.parallel > 1 and size > self.chunk_size:
+            if 'concatenation' in self.extensions():
+                n_parts = min(self.parallel, -(-size // self.chunk_size))
+        if len(stored_urls) != n_parts:
+            stored_urls = [None] * n_parts
+        if n_parts == 1:
+            url, offset = self._resume_or_create(stored_urls[0], size, metadata)
+            if self.storage is not None:
+                self.storage[fingerprint] = [url]
+            self._send(url, path, 0, size, offset)
+        else:
+            # Split the file into n_parts ranges aligned to chunk_size
+            chunks_per_part = -(-size // self.chunk_size) // n_parts
+            bounds = [i * chunks_per_part * self.chunk_size for i in range(n_parts)] + [size]
+            ranges = [(bounds[i], bounds[i + 1] - bounds[i]) for i in range(n_parts)]
+            parts = [self._resume_or_create(stored_urls[i], ranges[i][1], None, concat='partial')
+                     for i in range(n_parts)]
+            if self.storage is not None:
+                self.storage[fingerprint] = [_[0] for _ in parts]
+            with ThreadPoolExecutor(max_workers=n_parts) as executor:
+                futures = [executor.submit(self._send, url, path, start, length, offset)
+                           for (url, offset), (start, length) in zip(parts, ranges)]
+                part_urls = [_.result() for _ in futures]
+            url = self.create(size, metadata=metadata,
+                              concat='final;' + ' '.join(part_urls))
+        if self.storage is not None:
+            del self.storage[fingerprint]
+        return url